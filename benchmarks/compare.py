@@ -0,0 +1,93 @@
+"""
+对比两次 benchmarks/run.py 的结果：
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+逐个场景、逐轮列出延迟和吞吐的变化；延迟变长或吞吐下降超过 --threshold 百分比的标记为退化，
+存在退化时退出码为 1，可以直接用在 CI 中。两次的数据集参数不同时给出提示，数值没有可比性。
+"""
+import argparse
+import json
+import sys
+
+# (字段, 越大越好)
+METRICS = [
+    ('p50_ms', False),
+    ('p90_ms', False),
+    ('p99_ms', False),
+    ('throughput', True),
+    ('mb_per_s', True),
+    ('rows_per_s', True),
+    ('errors', False),
+]
+
+
+def load(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def change(before: float, after: float) -> float | None:
+    """变化百分比，基准为 0 时返回 None"""
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before: dict, after: dict, threshold: float) -> tuple[list[str], int]:
+    """返回输出的行和退化项数"""
+    lines, regressions = [], 0
+    before_meta, after_meta = before.get('meta', {}), after.get('meta', {})
+    lines.append(f"before: {before_meta.get('commit')}{' (dirty)' if before_meta.get('dirty') else ''}")
+    lines.append(f"after:  {after_meta.get('commit')}{' (dirty)' if after_meta.get('dirty') else ''}")
+
+    keys = ('depth', 'fanout', 'files_per_folder', 'shares', 'seed')
+    if any(before['dataset'].get(k) != after['dataset'].get(k) for k in keys):
+        lines.append('注意: 两次的数据集参数不同，结果没有可比性')
+    for field in ('concurrency', 'requests', 'cpu_count'):
+        if before_meta.get(field) != after_meta.get(field):
+            lines.append(f'注意: {field} 不同 ({before_meta.get(field)} -> {after_meta.get(field)})')
+    lines.append(f"dataset build: {before['dataset']['build_seconds']}s -> {after['dataset']['build_seconds']}s")
+    lines.append('')
+
+    lines.append(f"{'scenario':<24}{'metric':<12}{'before':>12}{'after':>12}{'change':>10}")
+    for scenario, phases in after['scenarios'].items():
+        old_phases = before['scenarios'].get(scenario)
+        if old_phases is None:
+            lines.append(f'{scenario:<24}(新增场景)')
+            continue
+        for phase, stats in phases.items():
+            old_stats = old_phases.get(phase)
+            if not isinstance(stats, dict) or not isinstance(old_stats, dict):
+                continue
+            name = f'{scenario}/{phase}'
+            for metric, higher_is_better in METRICS:
+                if metric not in stats or metric not in old_stats:
+                    continue
+                old, new = old_stats[metric], stats[metric]
+                pct = change(old, new)
+                worse = new > old if metric == 'errors' else (
+                    pct is not None and (pct < -threshold if higher_is_better else pct > threshold))
+                regressions += worse
+                pct_text = '' if pct is None else f'{pct:+.1f}%'
+                lines.append(f"{name:<24}{metric:<12}{old:>12}{new:>12}{pct_text:>10}{'  !' if worse else ''}")
+                name = ''
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare', description='对比两次性能基准的结果')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10, help='视为退化的变化百分比')
+    args = parser.parse_args(argv)
+
+    lines, regressions = compare(load(args.before), load(args.after), args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f'\n{regressions} 项退化超过 {args.threshold:g}%')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
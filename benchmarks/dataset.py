@@ -0,0 +1,167 @@
+import datetime
+import os
+import random
+import secrets
+import string
+import time
+from dataclasses import dataclass, field
+
+from src.djhx_pan.config.app_config import config_dict
+from src.djhx_pan.db import DB
+from src.djhx_pan.repository import file_repo, usage_repo, user_repo
+from src.djhx_pan.service import password_service, share_service
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench-password'
+
+# 每个事务写入的行数
+BATCH_SIZE = 20000
+# 保留的最深层目录样本数（面包屑场景使用）
+DEEP_SAMPLE_SIZE = 1000
+
+
+@dataclass
+class Dataset:
+    depth: int
+    fanout: int
+    files: int
+    shares: int
+    seed: int
+    folder_count: int = 0
+    file_count: int = 0
+    build_seconds: float = 0.0
+    # 第一层目录（递归删除场景使用）
+    top_folders: list = field(default_factory=list)
+    # 各层随机抽样的目录，None 表示根目录
+    folder_sample: list = field(default_factory=list)
+    # 最深一层的目录
+    deep_folders: list = field(default_factory=list)
+    # (share_key, 分享目录下到最深一层的相对路径)
+    share_paths: list = field(default_factory=list)
+
+    def summary(self) -> dict:
+        return {
+            'depth': self.depth,
+            'fanout': self.fanout,
+            'files_per_folder': self.files,
+            'shares': self.shares,
+            'seed': self.seed,
+            'folders': self.folder_count,
+            'files': self.file_count,
+            'rows': self.folder_count + self.file_count,
+            'build_seconds': round(self.build_seconds, 3),
+        }
+
+
+def _folder_name(index: int) -> str:
+    return f'dir{index:03d}'
+
+
+def _share_key() -> str:
+    return ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(8))
+
+
+def create_user() -> None:
+    """基准测试使用的登录用户，哈希参数与正常注册一致"""
+    if user_repo.get_credentials(BENCH_USER):
+        return
+    hashed = password_service.hash_new_password(BENCH_PASSWORD)
+    user_repo.add_user(BENCH_USER, BENCH_USER, hashed['password'], hashed['salt'], None, None,
+                       hashed['pwd_algorithm'], hashed['pwd_iterations'])
+
+
+def build(depth: int, fanout: int, files: int, shares: int, seed: int = 0) -> Dataset:
+    """
+    在当前配置的数据库中生成目录树和分享（需要在 create_app 之后调用，表结构由迁移创建）。
+    行直接批量写入 t_file，id 预先分配，子节点不需要回查父节点 id；文件只有数据库记录，没有物理文件。
+    写入期间目录聚合值只由触发器累加到直接父目录，结束后用 usage_repo.reconcile 一次性重算，
+    避免每个文件都沿祖先链向上更新。
+    """
+    rng = random.Random(seed)
+    dataset = Dataset(depth=depth, fanout=fanout, files=files, shares=shares, seed=seed)
+    upload_folder = config_dict.get(os.getenv('CONFIG_MODE', 'development')).UPLOAD_FOLDER
+    now = datetime.datetime.now().isoformat()
+    start = time.perf_counter()
+
+    next_id = (DB.query_one("SELECT coalesce(max(id), 0) AS id FROM t_file")['id'] or 0) + 1
+    pending = []
+
+    def flush():
+        if not pending:
+            return
+        with DB.transaction():
+            DB.executemany("""
+                INSERT INTO t_file (id, filename, filesize, filetype, filepath, parent_id, is_dir,
+                                    preview_type, md5, create_datetime, update_datetime)
+                VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL, ?, ?)
+            """, pending)
+        pending.clear()
+
+    DB.execute("UPDATE t_storage_usage SET reconciling = 1 WHERE id = 1")
+    try:
+        # 每层的 (id, 物理路径)，根目录为 (None, UPLOAD_FOLDER)
+        level = [(None, upload_folder)]
+        for current_depth in range(1, depth + 1):
+            children = []
+            for parent_id, parent_path in level:
+                for index in range(fanout):
+                    name = _folder_name(index)
+                    path = os.path.join(parent_path, name)
+                    pending.append((next_id, name, 0, 'folder', path, parent_id, 1, now, now))
+                    children.append((next_id, path))
+                    next_id += 1
+                    for file_index in range(files):
+                        pending.append((next_id, f'file{file_index:05d}.bin', rng.randint(1, 1 << 20), 'bin',
+                                        os.path.join(path, f'file{file_index:05d}.bin'), children[-1][0], 0, now, now))
+                        next_id += 1
+                    if len(pending) >= BATCH_SIZE:
+                        flush()
+            flush()
+            dataset.folder_count += len(children)
+            dataset.file_count += len(children) * files
+            if current_depth == 1:
+                dataset.top_folders = [folder_id for folder_id, _ in children]
+            sample = rng.sample(children, min(len(children), max(1, DEEP_SAMPLE_SIZE // depth)))
+            dataset.folder_sample.extend(folder_id for folder_id, _ in sample)
+            level = children
+        dataset.folder_sample.insert(0, None)
+        dataset.deep_folders = [folder_id for folder_id, _ in rng.sample(level, min(len(level), DEEP_SAMPLE_SIZE))]
+    finally:
+        flush()
+        usage_repo.reconcile()
+
+    _create_shares(dataset, rng, now)
+    file_repo.invalidate_ancestors()
+    share_service.invalidate_files()
+    dataset.build_seconds = time.perf_counter() - start
+    return dataset
+
+
+def _create_shares(dataset: Dataset, rng: random.Random, now: str) -> None:
+    """
+    在第 1 ~ depth-1 层的随机目录上创建分享，并记录从分享目录随机向下走到最深一层的路径。
+    目录名由位置决定（dirNNN），导航路径直接由随机选出的下标拼出，只有分享目录本身需要查询 id。
+    """
+    if dataset.depth < 2 or not dataset.shares:
+        return
+    rows = []
+    for _ in range(dataset.shares):
+        # 从根向下随机走到分享所在的层，再继续走到最深一层
+        share_depth = rng.randint(1, dataset.depth - 1)
+        names = [_folder_name(rng.randrange(dataset.fanout)) for _ in range(dataset.depth)]
+        folder = DB.query_one(
+            "SELECT id FROM t_file WHERE parent_id IS NULL AND filename = ? AND is_dir = 1", (names[0],)
+        )
+        for name in names[1:share_depth]:
+            folder = DB.query_one(
+                "SELECT id FROM t_file WHERE parent_id = ? AND filename = ? AND is_dir = 1", (folder['id'], name)
+            )
+        share_key = _share_key()
+        rows.append((folder['id'], share_key, now, now))
+        dataset.share_paths.append((share_key, '/'.join(names[share_depth:])))
+    with DB.transaction():
+        DB.executemany("""
+            INSERT INTO t_share (file_id, share_key, password, expires_at, allow_download, allow_delete,
+                                 created_datetime, update_datetime)
+            VALUES (?, ?, NULL, NULL, 1, 0, ?, ?)
+        """, rows)
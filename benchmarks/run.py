@@ -0,0 +1,359 @@
+"""
+性能基准：在临时目录中生成合成数据集，通过 Flask 测试客户端和线程池并发请求测量主要路径的延迟和吞吐，
+结果输出为 JSON，用 benchmarks/compare.py 对比两次提交的结果。
+
+    python -m benchmarks.run --scale small --output before.json
+    python -m benchmarks.run --scale large --concurrency 16 --only listing,breadcrumbs,share --output after.json
+
+每个场景先顺序执行一轮（concurrency=1），再以 --concurrency 个线程执行一轮；递归删除会破坏数据集，总是最后执行。
+必须在仓库根目录以模块方式运行，数据库、上传目录等在导入应用之前切换到临时目录（CONFIG_MODE=benchmark）。
+"""
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 数据规模预设：目录树深度、每个目录的子目录数、每个目录的文件数、分享数。
+# 目录数为 fanout + fanout^2 + ... + fanout^depth，文件数为目录数 × files
+PRESETS = {
+    'tiny': {'depth': 2, 'fanout': 4, 'files': 10, 'shares': 20},  # 20 个目录，200 个文件
+    'small': {'depth': 3, 'fanout': 6, 'files': 40, 'shares': 100},  # 258 个目录，1 万个文件
+    'medium': {'depth': 4, 'fanout': 8, 'files': 50, 'shares': 500},  # 4680 个目录，23 万个文件
+    'large': {'depth': 5, 'fanout': 10, 'files': 10, 'shares': 2000},  # 11 万个目录，111 万个文件
+}
+
+SCENARIOS = ['listing', 'breadcrumbs', 'share', 'upload', 'download', 'login', 'api_login', 'delete']
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """最近秩百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values), math.ceil(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float, concurrency: int, transferred: int = 0) -> dict:
+    """延迟单位为毫秒，吞吐为每秒完成的请求数（失败的也计入），有传输数据时附带 MB/s"""
+    values = sorted(latencies)
+    count = len(values)
+    result = {
+        'concurrency': concurrency,
+        'requests': count,
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'throughput': round(count / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(values) / count, 3) if count else 0.0,
+        'p50_ms': round(percentile(values, 50), 3),
+        'p90_ms': round(percentile(values, 90), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(values[-1], 3) if values else 0.0,
+    }
+    if transferred:
+        result['mb_per_s'] = round(transferred / elapsed / 1024 / 1024, 2) if elapsed else 0.0
+    return result
+
+
+class LoadGenerator:
+    """
+    用线程池并发调用 request(client, index)：每个线程一个测试客户端，logged_in 时会话中已登录基准用户。
+    request 返回 (是否成功, 传输的字节数)，抛出的异常计为失败。
+    """
+
+    def __init__(self, app, username: str):
+        self.app = app
+        self.username = username
+
+    def _client(self, local: threading.local, logged_in: bool):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = self.app.test_client()
+            if logged_in:
+                with client.session_transaction() as session:
+                    session['user'] = {'username': self.username}
+        return client
+
+    def run(self, request, count: int, concurrency: int, logged_in: bool = True) -> dict:
+        local = threading.local()
+        lock = threading.Lock()
+        latencies, totals = [], {'errors': 0, 'bytes': 0}
+
+        def task(index):
+            client = self._client(local, logged_in)
+            start = time.perf_counter()
+            try:
+                ok, transferred = request(client, index)
+            except Exception as e:
+                logging.getLogger('benchmark').debug(f'请求失败: {e!r}')
+                ok, transferred = False, 0
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                totals['bytes'] += transferred
+                if not ok:
+                    totals['errors'] += 1
+
+        start = time.perf_counter()
+        if concurrency <= 1:
+            for index in range(count):
+                task(index)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench') as executor:
+                list(executor.map(task, range(count)))
+        return summarize(latencies, totals['errors'], time.perf_counter() - start, concurrency, totals['bytes'])
+
+    def phases(self, request, count: int, concurrency: int, logged_in: bool = True) -> dict:
+        """顺序一轮、并发一轮；并发轮的下标接着顺序轮，上传等场景不会重复"""
+        return {
+            'sequential': self.run(request, count, 1, logged_in),
+            'concurrent': self.run(lambda client, index: request(client, count + index), count, concurrency, logged_in),
+        }
+
+
+def _read_body(response) -> int:
+    """读完流式响应体，返回字节数"""
+    try:
+        return sum(len(chunk) for chunk in response.iter_encoded())
+    finally:
+        response.close()
+
+
+def _git_revision() -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True,
+                                timeout=30).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, timeout=30).stdout.strip())
+    except (OSError, subprocess.SubprocessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit or None, 'dirty': dirty}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='djhx-pan 性能基准')
+    parser.add_argument('--scale', choices=sorted(PRESETS), default='small', help='数据规模预设')
+    parser.add_argument('--depth', type=int, help='目录树深度（覆盖预设）')
+    parser.add_argument('--fanout', type=int, help='每个目录的子目录数（覆盖预设）')
+    parser.add_argument('--files', type=int, help='每个目录的文件数（覆盖预设）')
+    parser.add_argument('--shares', type=int, help='分享数（覆盖预设）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同参数生成相同的数据集和请求序列')
+    parser.add_argument('--requests', type=int, default=200, help='每个场景每轮的请求数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发轮的线程数')
+    parser.add_argument('--upload-size', type=int, default=1024 * 1024, help='上传 / 下载场景的文件大小（字节）')
+    parser.add_argument('--login-requests', type=int, default=40, help='登录场景每轮的请求数（每次都计算 PBKDF2）')
+    parser.add_argument('--delete-trees', type=int, default=3, help='递归删除场景删除的第一层目录数')
+    parser.add_argument('--only', help=f'逗号分隔，只运行这些场景: {",".join(SCENARIOS)}')
+    parser.add_argument('--dir', help='数据目录，默认新建临时目录')
+    parser.add_argument('--keep', action='store_true', help='结束后保留数据目录')
+    parser.add_argument('--output', help='结果 JSON 的路径，默认输出到标准输出')
+    parser.add_argument('--verbose', action='store_true', help='输出应用的 INFO 日志')
+    args = parser.parse_args(argv)
+
+    for name, value in PRESETS[args.scale].items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+    if args.depth < 1 or args.fanout < 1 or args.files < 0 or args.shares < 0:
+        parser.error('depth、fanout 至少为 1，files、shares 不能为负数')
+    args.only = [s.strip() for s in args.only.split(',')] if args.only else list(SCENARIOS)
+    unknown = set(args.only) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'未知的场景: {", ".join(sorted(unknown))}')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    bench_dir = args.dir or tempfile.mkdtemp(prefix='djhx-pan-bench-')
+    os.makedirs(bench_dir, exist_ok=True)
+    if os.listdir(bench_dir):
+        sys.exit(f'数据目录 {bench_dir} 不为空')
+    # 应用的各个模块在导入时读取配置中的路径，必须在导入之前设置
+    os.environ['CONFIG_MODE'] = 'benchmark'
+    os.environ['DJHX_PAN_BENCH_DIR'] = bench_dir
+
+    if not args.keep:
+        # 在导入应用之前注册，atexit 倒序执行，应用退出时写入指标等操作完成后才删除目录
+        atexit.register(shutil.rmtree, bench_dir, ignore_errors=True)
+
+    # 应用日志输出到标准输出（导入时配置），改到标准错误，标准输出只有结果 JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args, bench_dir)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def run(args, bench_dir: str) -> dict:
+    from src.djhx_pan import create_app
+    from src.djhx_pan.config.app_config import AppConfig
+    from src.djhx_pan.db import DB
+    from src.djhx_pan.service import file_service
+    from . import dataset as synthetic
+
+    logging.getLogger(AppConfig.PROJECT_NAME).setLevel(logging.INFO if args.verbose else logging.WARNING)
+    log = logging.getLogger('benchmark')
+    log.addHandler(logging.StreamHandler(sys.stderr))
+    log.setLevel(logging.INFO)
+
+    app = create_app('benchmark')
+    with app.app_context():
+        synthetic.create_user()
+        log.info(f'生成数据集: depth={args.depth} fanout={args.fanout} files={args.files} shares={args.shares}')
+        data = synthetic.build(args.depth, args.fanout, args.files, args.shares, args.seed)
+        log.info(f'数据集完成: {data.folder_count} 个目录, {data.file_count} 个文件, {data.build_seconds:.1f}s')
+
+    load = LoadGenerator(app, synthetic.BENCH_USER)
+    scenarios = {}
+
+    def scenario(name, func):
+        if name not in args.only:
+            return
+        log.info(f'场景 {name} ...')
+        scenarios[name] = func()
+
+    def pick(values, index):
+        return values[(index * 7919 + args.seed) % len(values)]
+
+    def listing(targets):
+        def request(client, index):
+            parent_id = pick(targets, index)
+            response = client.get('/file/' if parent_id is None else f'/file/?parent_id={parent_id}')
+            return response.status_code == 200, 0
+        return load.phases(request, args.requests, args.concurrency)
+
+    scenario('listing', lambda: listing(data.folder_sample))
+    scenario('breadcrumbs', lambda: {**listing(data.deep_folders), 'depth': args.depth})
+
+    def share():
+        if not data.share_paths:
+            return {'skipped': '没有分享（shares=0 或 depth<2）'}
+
+        def request(client, index):
+            share_key, path = pick(data.share_paths, index)
+            response = client.get(f'/file/s/{share_key}', query_string={'path': path})
+            return response.status_code == 200, 0
+        # 登录后的请求不受匿名限流影响，测量的是分享解析和目录列表本身
+        return load.phases(request, args.requests, args.concurrency)
+
+    scenario('share', share)
+
+    # 上传的文件放在单独的目录中，下载场景使用
+    uploads_parent = DB.execute("""
+        INSERT INTO t_file (filename, filetype, filepath, is_dir, parent_id, create_datetime, update_datetime)
+        VALUES ('bench-uploads', 'folder', ?, 1, NULL, datetime('now'), datetime('now'))
+    """, (os.path.join(bench_dir, 'uploads', 'bench-uploads'),))
+
+    def upload_request(client, index):
+        # 每次内容不同，不会走重复内容的引用计数
+        payload = index.to_bytes(8, 'big') + os.urandom(max(0, args.upload_size - 8))
+        response = client.post('/file/upload', content_type='multipart/form-data', data={
+            'parent_id': str(uploads_parent),
+            'file': (io.BytesIO(payload), f'upload-{index:06d}.bin'),
+        })
+        return response.status_code == 302, len(payload)
+
+    def upload():
+        result = load.phases(upload_request, args.requests, args.concurrency)
+        stored = DB.query_one("SELECT count(*) AS n FROM t_file WHERE parent_id = ?", (uploads_parent,))['n']
+        return {**result, 'size': args.upload_size, 'stored': stored}
+
+    scenario('upload', upload)
+
+    def download():
+        ids = [row['id'] for row in DB.query("SELECT id FROM t_file WHERE parent_id = ? AND is_dir = 0",
+                                             (uploads_parent,))]
+        if not ids:
+            # 没有运行上传场景时先上传一批
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['user'] = {'username': synthetic.BENCH_USER}
+            for index in range(min(args.requests, 50)):
+                upload_request(client, index)
+            ids = [row['id'] for row in DB.query("SELECT id FROM t_file WHERE parent_id = ? AND is_dir = 0",
+                                                 (uploads_parent,))]
+
+        def request(client, index):
+            response = client.get(f'/file/download/{pick(ids, index)}', buffered=False)
+            ok = response.status_code == 200
+            return ok, _read_body(response)
+        return {**load.phases(request, args.requests, args.concurrency), 'size': args.upload_size}
+
+    scenario('download', download)
+
+    def login():
+        def request(client, index):
+            response = client.post('/login', data={
+                'login_type': 'username', 'username': synthetic.BENCH_USER, 'password': synthetic.BENCH_PASSWORD,
+            })
+            return response.status_code == 302, 0
+        # 超过 PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE 的并发登录会被拒绝，计为失败
+        return {**load.phases(request, args.login_requests, args.concurrency, logged_in=False),
+                'hash_workers': AppConfig.PASSWORD_HASH_WORKERS, 'hash_queue': AppConfig.PASSWORD_HASH_QUEUE}
+
+    scenario('login', login)
+
+    def api_login():
+        def request(client, index):
+            response = client.post('/api/auth/login', json={
+                'login_type': 'username', 'username': synthetic.BENCH_USER, 'password': synthetic.BENCH_PASSWORD,
+            })
+            return response.status_code == 200 and response.get_json().get('success') is True, 0
+        # 同一客户端重复登录命中登录缓存，测量的是缓存命中后的开销
+        return load.phases(request, args.requests, args.concurrency, logged_in=False)
+
+    scenario('api_login', api_login)
+
+    def delete():
+        # 直接调用 file_service.delete_tree（接口删除目录时交给后台任务执行，这里测量任务本身）
+        latencies, rows = [], 0
+        start = time.perf_counter()
+        with app.app_context():
+            for folder_id in data.top_folders[:args.delete_trees]:
+                begin = time.perf_counter()
+                deleted = file_service.delete_tree([folder_id])
+                latencies.append((time.perf_counter() - begin) * 1000)
+                rows += deleted['files'] + deleted['dirs']
+        elapsed = time.perf_counter() - start
+        result = summarize(latencies, 0, elapsed, 1)
+        result['rows'] = rows
+        result['rows_per_s'] = round(rows / elapsed, 1) if elapsed else 0.0
+        return {'sequential': result}
+
+    scenario('delete', delete)
+
+    return {
+        'meta': {
+            **_git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'dataset': data.summary(),
+        'scenarios': scenarios,
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,37 @@
+import math
 import multiprocessing
+import os
 
 from src.djhx_pan.config.app_config import AppConfig
 
 bind = f'{AppConfig.APP_HOST}:{AppConfig.APP_PORT}'
-# workers = multiprocessing.cpu_count() * 2 + 1
-workers = 1
+
+# 运行模式，环境变量 GUNICORN_PROFILE 优先于 AppConfig.SERVER_PROFILE：
+# - gthread：每个进程一个线程池，SQLite 查询、文件读写和 sendfile 期间都会释放 GIL，
+#   慢速客户端只占住一个线程，几百个并发下载不会排在同一个请求后面
+# - sync：每个进程同一时刻只处理一个请求，只用于调试
+# 没有提供 gevent：sqlite3 的调用（包括等待写锁的 busy_timeout）不会让出事件循环，一次锁等待会卡住整个进程
+profile = os.getenv('GUNICORN_PROFILE', AppConfig.SERVER_PROFILE)
+cpu_count = multiprocessing.cpu_count()
+
+if profile == 'gthread':
+    worker_class = 'gthread'
+    # 进程数跟随 CPU 核数，限制在 2~8：SQLite 同时只有一个写者，更多进程不会提高写入吞吐，
+    # 只会多出几份进程内缓存和任务 worker
+    workers = int(os.getenv('GUNICORN_WORKERS', min(max(cpu_count, 2), 8)))
+    # 线程数按目标并发连接数均分到每个进程；每个线程持有一个 SQLite 连接（页缓存按需增长）
+    threads = int(os.getenv('GUNICORN_THREADS', math.ceil(AppConfig.SERVER_CONCURRENCY / workers)))
+    # gthread 的心跳由主线程发送，timeout 只用来回收卡死的进程，不会中断长时间的下载
+    timeout = 60
+    # 空闲的 keep-alive 连接不占线程，由主线程的事件循环等待
+    keepalive = 5
+elif profile == 'sync':
+    workers = int(os.getenv('GUNICORN_WORKERS', 1))
+    # sync worker 处理请求期间不发心跳，timeout 需要覆盖最慢的一次下载
+    timeout = 600
+else:
+    raise ValueError(f'GUNICORN_PROFILE 只能是 gthread 或 sync: {profile}')
+
+graceful_timeout = 30
+# 不要 preload_app：create_app 会启动后台任务线程，在主进程中启动的线程不会被 fork 出的 worker 继承
+preload_app = False
@@ -1,3 +1,4 @@
+-- 基线表结构（迁移版本 1），索引及后续变更由 src/djhx_pan/db/migration.py 在启动时应用
 create table main.t_file
 (
     id              INTEGER
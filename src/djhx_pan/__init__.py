@@ -6,17 +6,24 @@ from flask import Flask
 from .config.log_config import init_log_config
 from .extension import init_app_extension
 from .util import JsonResult
+from .util.metrics import init_metrics
+from .util.sqltrace import init_sql_trace
+from .util.stream import UploadRequest
 
 init_log_config()
 
 from .config import app_config
 from .config.app_config import AppConfig
+from .db.migration import migrate
 from .route.auth import auth_bp
 from .route.main import main_bp
 from .route.file import file_bp
 from .route.user import user_bp
 from .route.api_auth import api_auth_bp
 from .route.api_file import api_file_bp
+from .route.api_job import api_job_bp
+from .route.metrics import metrics_bp
+from .service import job_service
 
 from .exception import ClientError, ServerError
 
@@ -28,10 +35,14 @@ def register_blueprints(app):
     app.register_blueprint(user_bp)
     app.register_blueprint(api_auth_bp)
     app.register_blueprint(api_file_bp)
+    app.register_blueprint(api_job_bp)
+    app.register_blueprint(metrics_bp)
 
 
 def create_app(config_mode: str = 'development'):
     flask_app = Flask(__name__)
+    # multipart 上传边接收边写临时文件并计算 MD5
+    flask_app.request_class = UploadRequest
     app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
 
     # 初始化应用配置和扩展
@@ -39,9 +50,21 @@ def create_app(config_mode: str = 'development'):
     init_app_extension(flask_app)
     app_logger.info(f'App config mode: {config_mode}')
 
+    # 数据库迁移（建表、索引等）
+    db_version = migrate()
+    app_logger.info(f'DB schema version: {db_version}')
+
     # 注册蓝图
     register_blueprints(flask_app)
 
+    # 请求耗时、上传下载字节数、SQL 语句数等指标（/metrics）
+    init_metrics(flask_app)
+    # 开发环境：每个请求的 SQL 明细、慢查询和 N+1 提示
+    init_sql_trace(flask_app)
+
+    # 后台任务 worker（批量删除、发送邮件等）
+    job_service.start_workers(flask_app)
+
     # 全局异常处理
     @flask_app.errorhandler(500)
     def server_error(e):
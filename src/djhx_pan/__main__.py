@@ -1,4 +1,6 @@
 from .app import app
 from .config.app_config import AppConfig
 
-app.run(host=AppConfig.APP_HOST, port=AppConfig.APP_PORT, debug=False)
\ No newline at end of file
+# 密码哈希进程池用 spawn 启动子进程，子进程会重新导入这个模块，不能再启动一次服务
+if __name__ == '__main__':
+    app.run(host=AppConfig.APP_HOST, port=AppConfig.APP_PORT, debug=False)
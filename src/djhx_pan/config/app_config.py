@@ -1,4 +1,6 @@
+import os
 import platform
+import tempfile
 from datetime import timedelta
 
 
@@ -8,11 +10,144 @@ class AppConfig(object):
 
     APP_HOST = "0.0.0.0"
     APP_PORT = 8125
+    # gunicorn 运行模式（gthread / sync）和目标并发连接数，进程数、线程数的计算见 gunicorn.conf.py
+    SERVER_PROFILE = 'gthread'
+    SERVER_CONCURRENCY = 128
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024
     MAX_FORM_MEMORY_SIZE = 100 * 1024 * 1024
 
     PERMANENT_SESSION_LIFETIME = timedelta(days=5)
 
+    # SQLite 连接参数（db.DB 和 SQLAlchemy 共用）
+    DB_BUSY_TIMEOUT = 5  # 秒
+    DB_CACHE_SIZE = -64 * 1024  # 负数表示 KiB，即 64 MB 页缓存
+    DB_MMAP_SIZE = 256 * 1024 * 1024
+    DB_CACHED_STATEMENTS = 256
+    # SQLAlchemy 连接池：默认最多 15 个连接，gthread 下并发线程更多时会排队等待 30 秒，
+    # 这里不限制溢出连接（SQLite 连接很轻），常驻 10 个
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 10, 'max_overflow': -1}
+
+    # 目录列表分页大小
+    FILE_PAGE_SIZE = 200
+    FILE_PAGE_SIZE_MAX = 1000
+
+    # 分片上传：默认分片大小、单个分片上限（受 MAX_CONTENT_LENGTH 约束）、未完成任务保留时间
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+    UPLOAD_CHUNK_MAX_SIZE = 64 * 1024 * 1024
+    UPLOAD_STAGING_EXPIRE = timedelta(days=1)
+
+    # 下载：浏览器私有缓存时间（秒），单个请求最多接受的 Range 区间数（超过时返回完整内容）
+    DOWNLOAD_CACHE_MAX_AGE = 24 * 60 * 60
+    DOWNLOAD_MAX_RANGES = 16
+
+    # 下载内容交给前置代理发送，worker 只做鉴权和查询：
+    # None          由应用进程自己发送（gunicorn 下走 sendfile）
+    # 'x-accel'     nginx X-Accel-Redirect，需要一个映射到 UPLOAD_FOLDER 的 internal location：
+    #               location /_protected/ { internal; alias /home/koril/project/djhx-pan/uploads/; }
+    # 'x-sendfile'  lighttpd / Apache mod_xsendfile 的 X-Sendfile，头中是文件的绝对路径
+    DOWNLOAD_OFFLOAD = None
+    DOWNLOAD_ACCEL_PREFIX = '/_protected/'
+
+    # 文本预览：默认 / 最大返回字节数，按行预览时默认 / 最大行数
+    PREVIEW_TEXT_BYTES = 64 * 1024
+    PREVIEW_TEXT_MAX_BYTES = 1024 * 1024
+    PREVIEW_TEXT_LINES = 200
+    PREVIEW_TEXT_MAX_LINES = 5000
+    # 按行号（start）定位时最多向后扫描的字节数，更靠后的位置用上一页返回的 next_offset 定位
+    PREVIEW_TEXT_SKIP_BYTES = 8 * 1024 * 1024
+
+    # 缩略图：最大边长、JPEG 质量、后台生成线程数、缓存目录上限、单个文件生成超时（秒）
+    # 图片优先使用 Pillow（可选依赖），没有安装时和视频封面一样调用 ffmpeg
+    THUMBNAIL_SIZE = (256, 256)
+    THUMBNAIL_QUALITY = 80
+    THUMBNAIL_WORKERS = 2
+    THUMBNAIL_CACHE_MAX_SIZE = 512 * 1024 * 1024
+    THUMBNAIL_TIMEOUT = 60
+    THUMBNAIL_RETRY_AFTER = 10 * 60  # 生成失败后多久可以重试（秒）
+    THUMBNAIL_FFMPEG = 'ffmpeg'
+    THUMBNAIL_CACHE_MAX_AGE = 30 * 24 * 60 * 60  # 缩略图按内容寻址，浏览器可以长期缓存
+
+    # 批量删除：删除物理文件的线程数、每批处理的 blob 数（一批一个事务）
+    DELETE_UNLINK_WORKERS = 4
+    DELETE_BATCH_SIZE = 500
+
+    # 后台任务：每个进程的 worker 线程数（0 表示不执行任务）、空闲时轮询间隔（秒）、
+    # 默认最大尝试次数、首次重试延迟（秒，之后翻倍）、执行中任务的心跳间隔（秒）、心跳超时视为崩溃的时间、已完成任务保留时间
+    JOB_WORKERS = 2
+    JOB_POLL_INTERVAL = 2
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY = 30
+    JOB_HEARTBEAT_INTERVAL = 30
+    JOB_STALE_AFTER = timedelta(minutes=10)
+    JOB_RETENTION = timedelta(days=7)
+
+    # 存储配额（字节），None 表示不限制；按全部文件的逻辑大小计算，秒传 / 重复内容也计入
+    STORAGE_QUOTA = None
+    # 目录聚合大小和总用量由触发器实时维护，定期全量重算一次修正偏差
+    USAGE_RECONCILE_INTERVAL = timedelta(hours=24)
+
+    # 首页公开分享列表的进程内缓存时间；本进程的分享变更会立即失效，其他 worker 进程最多滞后这么久
+    PUBLIC_SHARE_CACHE_TTL = timedelta(seconds=30)
+    # 分享链接解析缓存：share_key 条目数、分享内目录路径条目数，以及每项的有效期
+    SHARE_CACHE_SIZE = 1024
+    SHARE_PATH_CACHE_SIZE = 8192
+    SHARE_CACHE_TTL = timedelta(seconds=30)
+
+    # 匿名访问限流（登录用户不受限制），按客户端 IP、分享链接和全局三个令牌桶同时限制，
+    # 桶的状态保存在 RATE_LIMIT_DB 中，多个 gunicorn worker 进程共用。
+    # 请求数：(每秒补充的令牌数, 桶容量)；下载带宽：字节/秒，桶容量为 RATE_LIMIT_BANDWIDTH_BURST 秒的流量；None 表示不限制
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_REQUESTS = {'ip': (2, 30), 'share': (10, 100), 'global': (50, 200)}
+    RATE_LIMIT_BANDWIDTH = {'ip': 2 * 1024 * 1024, 'share': 5 * 1024 * 1024, 'global': 10 * 1024 * 1024}
+    RATE_LIMIT_BANDWIDTH_BURST = 2
+    # 位于反向代理之后时从该请求头读取客户端 IP（如 nginx 设置的 X-Real-IP），None 表示使用连接的对端地址
+    RATE_LIMIT_IP_HEADER = None
+
+    # 搜索：每页条数及上限；文本文件内容只索引开头 SEARCH_CONTENT_MAX_BYTES 字节，
+    # 后台任务每批处理 SEARCH_INDEX_BATCH 个文件，并按 SEARCH_INDEX_INTERVAL 定期补建遗漏的内容索引。
+    # 索引的内容会复制一份保存在主库的 t_file_search 中（结果片段 snippet 需要原文），再加上 trigram 索引，
+    # 主库、WAL 和备份都会随之增大，大约是被索引文本的数倍；调大前先评估文本文件的总量
+    SEARCH_PAGE_SIZE = 20
+    SEARCH_PAGE_SIZE_MAX = 100
+    SEARCH_CONTENT_MAX_BYTES = 64 * 1024
+    SEARCH_INDEX_BATCH = 200
+    SEARCH_INDEX_INTERVAL = timedelta(minutes=30)
+
+    # 密码哈希（PBKDF2-SHA256）：新密码和登录时重新计算的哈希使用 PASSWORD_HASH_ITERATIONS 次迭代，
+    # 旧参数的用户登录成功后自动升级。计算在独立的进程池中进行（PASSWORD_HASH_WORKERS 个进程），
+    # 排队超过 PASSWORD_HASH_QUEUE 个时直接拒绝，等待超过 PASSWORD_HASH_TIMEOUT 秒视为失败
+    PASSWORD_HASH_ITERATIONS = 65536
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE = 16
+    PASSWORD_HASH_TIMEOUT = 10
+    # 接口登录验证通过后，同一客户端用相同的用户名和密码再次登录时不再计算哈希；修改密码后立即失效
+    LOGIN_CACHE_SIZE = 1024
+    LOGIN_CACHE_TTL = timedelta(minutes=5)
+
+    # 邮箱验证码：有效期、同时有效的验证码数量上限，保存在 EPHEMERAL_DB 中，所有 worker 进程共用。
+    # 同一邮箱两次发送至少间隔 EMAIL_CODE_RESEND_INTERVAL；EMAIL_CODE_ATTEMPT_WINDOW 内最多校验 EMAIL_CODE_MAX_ATTEMPTS 次，
+    # 次数按邮箱累计、重新发送不清零，校验通过后清零，用完后窗口结束前不能再发送和校验
+    EMAIL_CODE_TTL = timedelta(minutes=5)
+    EMAIL_CODE_MAX_ENTRIES = 10000
+    EMAIL_CODE_RESEND_INTERVAL = timedelta(seconds=60)
+    EMAIL_CODE_MAX_ATTEMPTS = 5
+    EMAIL_CODE_ATTEMPT_WINDOW = timedelta(minutes=30)
+
+    # Prometheus 指标（/metrics）：各 worker 进程每 METRICS_FLUSH_INTERVAL 秒把增量写入 METRICS_DB 汇总。
+    # METRICS_ALLOWED_IPS 按连接的对端地址判断，None 表示不限制。同机的反向代理转发的请求对端也是 127.0.0.1，
+    # 所以带有 X-Forwarded-For / X-Real-IP / Forwarded 头的请求一律拒绝，Prometheus 需要直连 gunicorn 抓取；
+    # 必须经过代理抓取时配置 METRICS_TOKEN，请求带上 Authorization: Bearer <token> 才能访问（IP 限制仍然生效）
+    METRICS_ENABLED = True
+    METRICS_FLUSH_INTERVAL = 5
+    METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+    METRICS_TOKEN = None
+
+    # SQL 跟踪（见 util.sqltrace）：记录每个请求执行的语句，慢查询（毫秒）附带 EXPLAIN QUERY PLAN，
+    # 同一请求中同一条语句超过 SQL_TRACE_REPEAT_THRESHOLD 次时提示 N+1；开发环境默认开启
+    SQL_TRACE_ENABLED = False
+    SQL_TRACE_SLOW_MS = 100
+    SQL_TRACE_REPEAT_THRESHOLD = 10
+
     secret_key = 'fj@k!19qox'
     JWT_SECRET_KEY = secret_key
     SECRET_KEY = secret_key
@@ -20,11 +155,19 @@ class AppConfig(object):
 
 class DevelopmentConfig(AppConfig):
     # 存储开发环境中的配置
+    SQL_TRACE_ENABLED = True
+
     if platform.system().lower() == 'windows':
         DB_NAME = "C:\\Project\\MyProject\\djhx-pan\\djhx-pan.db"
+        RATE_LIMIT_DB = "C:\\Project\\MyProject\\djhx-pan\\ratelimit.db"
+        EPHEMERAL_DB = "C:\\Project\\MyProject\\djhx-pan\\ephemeral.db"
+        METRICS_DB = "C:\\Project\\MyProject\\djhx-pan\\metrics.db"
         UPLOAD_FOLDER = "C:\\Project\\MyProject\\djhx-pan\\uploads"
     else:
         DB_NAME = "/home/koril/project/djhx-pan/djhx-pan.db"
+        RATE_LIMIT_DB = "/home/koril/project/djhx-pan/ratelimit.db"
+        EPHEMERAL_DB = "/home/koril/project/djhx-pan/ephemeral.db"
+        METRICS_DB = "/home/koril/project/djhx-pan/metrics.db"
         UPLOAD_FOLDER = "/home/koril/project/djhx-pan/uploads"
 
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + DB_NAME
@@ -33,11 +176,29 @@ class DevelopmentConfig(AppConfig):
 class ProductionConfig(AppConfig):
     # 存储生产环境中的配置
     DB_NAME = "/home/koril/project/djhx-pan/djhx-pan.db"
+    RATE_LIMIT_DB = "/home/koril/project/djhx-pan/ratelimit.db"
+    EPHEMERAL_DB = "/home/koril/project/djhx-pan/ephemeral.db"
+    METRICS_DB = "/home/koril/project/djhx-pan/metrics.db"
     UPLOAD_FOLDER = "/home/koril/project/djhx-pan/uploads"
 
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + DB_NAME
 
+
+class BenchmarkConfig(AppConfig):
+    # 性能基准（benchmarks/run.py）使用的临时环境，所有数据放在 DJHX_PAN_BENCH_DIR 下，
+    # 需要在导入应用之前设置 CONFIG_MODE=benchmark 和该目录
+    BENCH_DIR = os.getenv('DJHX_PAN_BENCH_DIR', os.path.join(tempfile.gettempdir(), 'djhx-pan-bench'))
+    DB_NAME = os.path.join(BENCH_DIR, 'djhx-pan.db')
+    RATE_LIMIT_DB = os.path.join(BENCH_DIR, 'ratelimit.db')
+    EPHEMERAL_DB = os.path.join(BENCH_DIR, 'ephemeral.db')
+    METRICS_DB = os.path.join(BENCH_DIR, 'metrics.db')
+    UPLOAD_FOLDER = os.path.join(BENCH_DIR, 'uploads')
+
+    SQLALCHEMY_DATABASE_URI = "sqlite:///" + DB_NAME
+
+
 config_dict = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'benchmark': BenchmarkConfig,
 }
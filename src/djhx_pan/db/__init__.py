@@ -1,49 +1,213 @@
 import logging
 import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
 
 from ..config.app_config import config_dict, AppConfig
 
 app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
 app_config_mode = os.getenv("CONFIG_MODE", "development")
 
-
-DB_PATH = config_dict.get(app_config_mode).DB_NAME
+DB_CONFIG = config_dict.get(app_config_mode)
+DB_PATH = DB_CONFIG.DB_NAME
 app_logger.info("DB path: {}".format(DB_PATH))
 
+
+def apply_pragmas(conn):
+    """
+    对新建的 SQLite 连接设置一次性参数：
+    - WAL 模式：读不阻塞写，多 worker 时读写可以并行
+    - synchronous=NORMAL：WAL 下只在 checkpoint 时 fsync，仍然保证一致性
+    - mmap_size / cache_size：减少 read 系统调用和重复的页解析
+    - recursive_triggers：目录聚合大小的触发器需要逐级向上触发
+    """
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_CONFIG.DB_BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_CONFIG.DB_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size = {int(DB_CONFIG.DB_CACHE_SIZE)}")
+    conn.execute("PRAGMA recursive_triggers = ON")
+
+
+class ConnectionPool:
+    """
+    按线程复用的 SQLite 连接池。
+
+    每个线程持有一个长连接，pragma 只在建连时设置一次；
+    sqlite3 模块会在连接内缓存已编译的语句（cached_statements），
+    同一条 SQL 重复执行时不再重新 prepare。
+    fork 之后（gunicorn 多 worker）检测到 pid 变化会重新建连，不会跨进程共用连接。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_CONFIG.DB_BUSY_TIMEOUT,
+            cached_statements=DB_CONFIG.DB_CACHED_STATEMENTS,
+            isolation_level=None,  # 自动提交，事务由 transaction() 显式控制
+        )
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn)
+        return conn
+
+    def get(self) -> sqlite3.Connection:
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.pid != os.getpid():
+            conn = self._connect()
+            local.conn = conn
+            local.pid = os.getpid()
+            local.tx_depth = 0
+        return conn
+
+    def in_transaction(self) -> bool:
+        return getattr(self._local, 'tx_depth', 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        """
+        显式事务（BEGIN IMMEDIATE），支持嵌套，只有最外层提交或回滚
+        """
+        conn = self.get()
+        local = self._local
+        if local.tx_depth > 0:
+            local.tx_depth += 1
+            try:
+                yield conn
+            finally:
+                local.tx_depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        local.tx_depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            local.tx_depth = 0
+
+    def close(self):
+        """关闭当前线程持有的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+pool = ConnectionPool(DB_PATH)
+
+class Statement(NamedTuple):
+    """一条执行完成的 SQL 语句，传给 statement_hooks"""
+    source: str  # 'db'（DB 的方法）或 'sqlalchemy'（ORM 会话）
+    sql: str
+    params: object  # executemany 时为参数序列（不是 list / tuple 时为 None，避免消耗生成器）
+    many: bool
+    rows: int | None  # 返回或影响的行数，未知时为 None
+    seconds: float  # 包含取回结果的时间
+
+
+# 语句执行完成后（包括执行失败）依次调用 hook(statement)，由 util.metrics、util.sqltrace 等模块注册，
+# 没有注册时不计时
+statement_hooks = []
+
+
+def notify_statement(statement: Statement) -> None:
+    for hook in statement_hooks:
+        try:
+            hook(statement)
+        except Exception as e:
+            app_logger.warning(f'SQL 语句回调异常: {e}')
+
+
+def _affected(cur) -> int | None:
+    # sqlite3 对 SELECT 返回 -1
+    return cur.rowcount if cur.rowcount >= 0 else None
+
+
 class DB:
     @staticmethod
     def get_connection():
-        """获取 SQLite3 数据库连接"""
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """获取当前线程复用的 SQLite3 数据库连接"""
+        return pool.get()
+
+    @staticmethod
+    def transaction():
+        """
+        在同一个事务内执行多条语句：
+            with DB.transaction():
+                DB.execute(...)
+                DB.execute(...)
+        """
+        return pool.transaction()
 
     @staticmethod
     def execute(sql, params=None):
         """执行单条语句（适用于 INSERT/UPDATE/DELETE）"""
         conn = DB.get_connection()
-        cur = conn.cursor()
+        start, rows = time.perf_counter(), None
         try:
-            cur.execute(sql, params or [])
-            conn.commit()
+            cur = conn.execute(sql, params or [])
+            rows = _affected(cur)
             return cur.lastrowid
         finally:
-            conn.close()
+            if statement_hooks:
+                notify_statement(Statement('db', sql, params, False, rows, time.perf_counter() - start))
+
+    @staticmethod
+    def executemany(sql, seq_of_params):
+        """批量执行同一条语句，返回影响的行数"""
+        conn = DB.get_connection()
+        start, rows = time.perf_counter(), None
+        try:
+            cur = conn.executemany(sql, seq_of_params)
+            rows = _affected(cur)
+            return cur.rowcount
+        finally:
+            if statement_hooks:
+                params = seq_of_params if isinstance(seq_of_params, (list, tuple)) else None
+                notify_statement(Statement('db', sql, params, True, rows, time.perf_counter() - start))
 
     @staticmethod
     def query(sql, params=None):
         """执行查询语句，返回结果列表（字典形式）"""
         conn = DB.get_connection()
-        cur = conn.cursor()
+        start, rows = time.perf_counter(), None
         try:
-            cur.execute(sql, params or [])
+            cur = conn.execute(sql, params or [])
             rows = cur.fetchall()
-            return [dict(row) for row in rows]
         finally:
-            conn.close()
+            if statement_hooks:
+                notify_statement(Statement('db', sql, params, False, None if rows is None else len(rows),
+                                           time.perf_counter() - start))
+        return [dict(row) for row in rows]
 
     @staticmethod
     def query_one(sql, params=()):
-        rows = DB.query(sql, params)
-        return rows[0] if rows else None
+        conn = DB.get_connection()
+        start, row, fetched = time.perf_counter(), None, False
+        try:
+            cur = conn.execute(sql, params or [])
+            row = cur.fetchone()
+            fetched = True
+            cur.close()
+        finally:
+            if statement_hooks:
+                notify_statement(Statement('db', sql, params, False, (1 if row else 0) if fetched else None,
+                                           time.perf_counter() - start))
+        return dict(row) if row else None
+
+    @staticmethod
+    def close():
+        pool.close()
@@ -0,0 +1,367 @@
+import logging
+
+from . import pool
+from ..config.app_config import AppConfig
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+
+def _create_search_index(conn):
+    """
+    rowid 与 t_file.id 一致的 FTS5 表，trigram 分词按任意 3 个字符建索引，中文和文件名中间的片段都能匹配。
+    文件名由触发器同步；文本文件的内容由后台任务写入，t_search_content 记录已经处理过的文件。
+    SQLite 没有编译 FTS5 或不支持 trigram（3.34 之前）时跳过，搜索退回到文件名 LIKE，
+    升级 SQLite 后由 ensure_search_index 在启动时补建。返回是否已创建。
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS t_file_search USING fts5(filename, content, tokenize = 'trigram')")
+    except Exception as e:
+        app_logger.warning(f'当前 SQLite 不支持 FTS5 trigram，跳过全文索引: {e}')
+        return False
+
+    for sql in [
+        """
+        CREATE TABLE IF NOT EXISTS t_search_content
+        (
+            file_id          INTEGER
+                primary key,
+            indexed_datetime TEXT
+        )
+        """,
+        # 后台任务查找未建立内容索引的文本文件
+        "CREATE INDEX IF NOT EXISTS idx_file_text ON t_file (id) WHERE preview_type = 'text' AND is_dir = 0",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_search_insert AFTER INSERT ON t_file
+        BEGIN
+            INSERT INTO t_file_search (rowid, filename, content) VALUES (NEW.id, NEW.filename, '');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_search_delete AFTER DELETE ON t_file
+        BEGIN
+            DELETE FROM t_file_search WHERE rowid = OLD.id;
+            DELETE FROM t_search_content WHERE file_id = OLD.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_search_rename AFTER UPDATE OF filename ON t_file
+        BEGIN
+            UPDATE t_file_search SET filename = NEW.filename WHERE rowid = NEW.id;
+        END
+        """,
+        "INSERT INTO t_file_search (rowid, filename, content) SELECT id, filename, '' FROM t_file",
+    ]:
+        conn.execute(sql)
+    return True
+
+
+def _has_search_index(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='t_file_search'").fetchone() is not None
+
+
+def ensure_search_index(conn) -> None:
+    """
+    迁移 7 在不支持 FTS5 trigram 的 SQLite 上只记录版本号、不建表；每次启动时检查，
+    当前 SQLite 已经支持时补建全文索引（文本内容由后台任务重新写入）
+    """
+    if _has_search_index(conn):
+        return
+    with pool.transaction():
+        # 多个 worker 同时启动时由 BEGIN IMMEDIATE 串行化，只有第一个会建表
+        if _has_search_index(conn) or not _create_search_index(conn):
+            return
+    app_logger.info('全文索引 t_file_search 已补建')
+
+# 版本化的数据库迁移：(版本号, 说明, SQL 语句列表或 callable(conn))
+# 当前版本记录在 PRAGMA user_version 中，create_app 启动时依次执行未应用的版本。
+# 新的表结构变更只追加到末尾，不要修改已经发布的版本。
+MIGRATIONS = [
+    (1, '基础表结构（与 schema.sql 一致）', [
+        """
+        CREATE TABLE IF NOT EXISTS t_file
+        (
+            id              INTEGER
+                primary key autoincrement,
+            filename        TEXT    NOT NULL,
+            filesize        INTEGER DEFAULT 0,
+            filetype        TEXT    NOT NULL,
+            filepath        TEXT    NOT NULL,
+            parent_id       INTEGER DEFAULT NULL,
+            is_dir          INTEGER DEFAULT 0,
+            preview_type    TEXT    DEFAULT NULL,
+            md5             TEXT    DEFAULT NULL,
+            create_datetime TEXT,
+            update_datetime TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS t_share
+        (
+            id               INTEGER
+                primary key autoincrement,
+            file_id          INTEGER not null,
+            share_key        TEXT    not null
+                unique,
+            password         TEXT,
+            expires_at       TEXT,
+            allow_download   BOOLEAN default 1,
+            allow_delete     BOOLEAN default 0,
+            created_datetime TEXT    not null,
+            update_datetime  TEXT    not null
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS t_user
+        (
+            id              INTEGER
+                primary key autoincrement,
+            username        TEXT,
+            password        TEXT,
+            salt            TEXT,
+            nickname        TEXT,
+            email           TEXT,
+            phone           TEXT,
+            create_datetime TEXT,
+            update_datetime TEXT
+        )
+        """,
+    ]),
+    (2, 't_file / t_share 热点查询索引', [
+        # 目录列表：WHERE parent_id=? 按 is_dir、create_datetime 排序
+        "CREATE INDEX IF NOT EXISTS idx_file_parent_list ON t_file (parent_id, is_dir, create_datetime)",
+        # 分享目录逐级解析：WHERE parent_id=? AND filename=? AND is_dir=1（覆盖 id、filename）
+        "CREATE INDEX IF NOT EXISTS idx_file_parent_name ON t_file (parent_id, filename, is_dir)",
+        # 秒传 / 去重：WHERE md5=?
+        "CREATE INDEX IF NOT EXISTS idx_file_md5 ON t_file (md5)",
+        # 文件删除时查找关联的分享
+        "CREATE INDEX IF NOT EXISTS idx_share_file ON t_share (file_id)",
+        # 首页公开分享：WHERE password IS NULL AND (expires_at IS NULL OR expires_at > ?)
+        "CREATE INDEX IF NOT EXISTS idx_share_public ON t_share (expires_at, file_id) WHERE password IS NULL",
+    ]),
+    (3, '统一时间格式为 ISO 8601（SQLAlchemy 旧数据使用空格分隔）', [
+        "UPDATE t_file SET create_datetime = replace(create_datetime, ' ', 'T') WHERE create_datetime LIKE '____-__-__ %'",
+        "UPDATE t_file SET update_datetime = replace(update_datetime, ' ', 'T') WHERE update_datetime LIKE '____-__-__ %'",
+        "UPDATE t_user SET create_datetime = replace(create_datetime, ' ', 'T') WHERE create_datetime LIKE '____-__-__ %'",
+        "UPDATE t_user SET update_datetime = replace(update_datetime, ' ', 'T') WHERE update_datetime LIKE '____-__-__ %'",
+    ]),
+    (4, '内容寻址存储的引用计数表 t_blob', [
+        """
+        CREATE TABLE IF NOT EXISTS t_blob
+        (
+            md5             TEXT    NOT NULL
+                primary key,
+            filepath        TEXT    NOT NULL,
+            filesize        INTEGER NOT NULL,
+            ref_count       INTEGER NOT NULL DEFAULT 0,
+            create_datetime TEXT
+        )
+        """,
+    ]),
+    (5, '后台任务队列 t_job', [
+        """
+        CREATE TABLE IF NOT EXISTS t_job
+        (
+            id              INTEGER
+                primary key autoincrement,
+            kind            TEXT    NOT NULL,
+            payload         TEXT    NOT NULL DEFAULT '{}',
+            status          TEXT    NOT NULL DEFAULT 'pending',
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            max_attempts    INTEGER NOT NULL DEFAULT 1,
+            progress_done   INTEGER NOT NULL DEFAULT 0,
+            progress_total  INTEGER NOT NULL DEFAULT 0,
+            result          TEXT,
+            error           TEXT,
+            run_after       TEXT,
+            locked_by       TEXT,
+            locked_at       TEXT,
+            create_datetime TEXT,
+            update_datetime TEXT
+        )
+        """,
+        # worker 领取任务：WHERE status='pending' AND run_after <= ? ORDER BY id
+        "CREATE INDEX IF NOT EXISTS idx_job_claim ON t_job (status, run_after, id)",
+    ]),
+    (6, '目录聚合大小 / 文件数与总用量 t_storage_usage，由触发器维护', [
+        # 目录行的 subtree_size / subtree_files 为其下全部文件（含子目录中的）的总大小和个数，文件行恒为 0
+        "ALTER TABLE t_file ADD COLUMN subtree_size INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE t_file ADD COLUMN subtree_files INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS t_storage_usage
+        (
+            id                 INTEGER
+                primary key check (id = 1),
+            used_size          INTEGER NOT NULL DEFAULT 0,
+            file_count         INTEGER NOT NULL DEFAULT 0,
+            reconciling        INTEGER NOT NULL DEFAULT 0,
+            reconcile_datetime TEXT
+        )
+        """,
+        "INSERT OR IGNORE INTO t_storage_usage (id) VALUES (1)",
+        # 新增文件：父目录和总用量加上文件大小，父目录的变化再由 trg_file_usage_rollup 逐级向上传递
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_usage_insert AFTER INSERT ON t_file
+        WHEN NEW.is_dir = 0
+        BEGIN
+            UPDATE t_file SET subtree_size = subtree_size + coalesce(NEW.filesize, 0), subtree_files = subtree_files + 1
+            WHERE id = NEW.parent_id;
+            UPDATE t_storage_usage SET used_size = used_size + coalesce(NEW.filesize, 0), file_count = file_count + 1
+            WHERE id = 1;
+        END
+        """,
+        # 删除文件或目录：父目录减去该节点的大小。整棵子树一起删除时，无论先删目录还是先删其中的文件，
+        # 祖先都只会被减一次（先删目录后，子节点的父目录已不存在，更新不会命中任何行）
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_usage_delete AFTER DELETE ON t_file
+        BEGIN
+            UPDATE t_file
+            SET subtree_size = subtree_size - CASE WHEN OLD.is_dir = 1 THEN OLD.subtree_size ELSE coalesce(OLD.filesize, 0) END,
+                subtree_files = subtree_files - CASE WHEN OLD.is_dir = 1 THEN OLD.subtree_files ELSE 1 END
+            WHERE id = OLD.parent_id;
+            UPDATE t_storage_usage SET used_size = used_size - coalesce(OLD.filesize, 0), file_count = file_count - 1
+            WHERE id = 1 AND OLD.is_dir = 0;
+        END
+        """,
+        # 文件大小变化
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_usage_resize AFTER UPDATE OF filesize ON t_file
+        WHEN NEW.is_dir = 0 AND coalesce(NEW.filesize, 0) != coalesce(OLD.filesize, 0)
+        BEGIN
+            UPDATE t_file SET subtree_size = subtree_size + coalesce(NEW.filesize, 0) - coalesce(OLD.filesize, 0)
+            WHERE id = NEW.parent_id;
+            UPDATE t_storage_usage SET used_size = used_size + coalesce(NEW.filesize, 0) - coalesce(OLD.filesize, 0)
+            WHERE id = 1;
+        END
+        """,
+        # 移动到其他目录：从原父目录减去，加到新父目录
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_usage_move AFTER UPDATE OF parent_id ON t_file
+        WHEN NEW.parent_id IS NOT OLD.parent_id
+        BEGIN
+            UPDATE t_file
+            SET subtree_size = subtree_size - CASE WHEN OLD.is_dir = 1 THEN OLD.subtree_size ELSE coalesce(OLD.filesize, 0) END,
+                subtree_files = subtree_files - CASE WHEN OLD.is_dir = 1 THEN OLD.subtree_files ELSE 1 END
+            WHERE id = OLD.parent_id;
+            UPDATE t_file
+            SET subtree_size = subtree_size + CASE WHEN NEW.is_dir = 1 THEN NEW.subtree_size ELSE coalesce(NEW.filesize, 0) END,
+                subtree_files = subtree_files + CASE WHEN NEW.is_dir = 1 THEN NEW.subtree_files ELSE 1 END
+            WHERE id = NEW.parent_id;
+        END
+        """,
+        # 目录聚合值变化时把差值加到上一级目录，依赖 PRAGMA recursive_triggers 逐级触发到根。
+        # 全量重算（reconciling = 1）时直接写入正确值，不能再向上累加
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_usage_rollup AFTER UPDATE OF subtree_size, subtree_files ON t_file
+        WHEN NEW.parent_id IS NOT NULL
+            AND (NEW.subtree_size != OLD.subtree_size OR NEW.subtree_files != OLD.subtree_files)
+            AND (SELECT reconciling FROM t_storage_usage WHERE id = 1) = 0
+        BEGIN
+            UPDATE t_file
+            SET subtree_size = subtree_size + NEW.subtree_size - OLD.subtree_size,
+                subtree_files = subtree_files + NEW.subtree_files - OLD.subtree_files
+            WHERE id = NEW.parent_id;
+        END
+        """,
+        # 已有数据的初始值
+        "UPDATE t_storage_usage SET reconciling = 1 WHERE id = 1",
+        """
+        WITH RECURSIVE closure(ancestor, id, depth) AS (
+            SELECT id, id, 0 FROM t_file WHERE is_dir = 1
+            UNION ALL
+            SELECT c.ancestor, f.id, c.depth + 1 FROM t_file f JOIN closure c ON f.parent_id = c.id WHERE c.depth < 100
+        ),
+        folder_usage(id, size, files) AS (
+            SELECT c.ancestor, sum(coalesce(f.filesize, 0)), count(*)
+            FROM closure c JOIN t_file f ON f.id = c.id
+            WHERE f.is_dir = 0
+            GROUP BY c.ancestor
+        )
+        UPDATE t_file SET subtree_size = u.size, subtree_files = u.files
+        FROM folder_usage u WHERE t_file.id = u.id
+        """,
+        """
+        UPDATE t_storage_usage
+        SET used_size = (SELECT coalesce(sum(filesize), 0) FROM t_file WHERE is_dir = 0),
+            file_count = (SELECT count(*) FROM t_file WHERE is_dir = 0),
+            reconciling = 0,
+            reconcile_datetime = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')
+        WHERE id = 1
+        """,
+    ]),
+    (7, '文件名 / 文本内容全文索引 t_file_search（FTS5 trigram）', _create_search_index),
+    (8, 't_user 保存每个用户的密码哈希参数', [
+        # 已有用户的哈希都是 PBKDF2-SHA256 65536 次迭代
+        "ALTER TABLE t_user ADD COLUMN pwd_algorithm TEXT NOT NULL DEFAULT 'sha256'",
+        "ALTER TABLE t_user ADD COLUMN pwd_iterations INTEGER NOT NULL DEFAULT 65536",
+    ]),
+    (9, '目录列表索引改为 coalesce 表达式，与 list_children 的排序和翻页条件一致', [
+        # create_datetime 为 NULL 的行按 '' 参与排序和 keyset 比较
+        "DROP INDEX IF EXISTS idx_file_parent_list",
+        "CREATE INDEX IF NOT EXISTS idx_file_parent_list "
+        "ON t_file (parent_id, coalesce(is_dir, 0), coalesce(create_datetime, ''), id)",
+    ]),
+    (10, '视频文件的 preview_type 补为 video（之前没有映射，一直为 NULL）', [
+        """
+        UPDATE t_file SET preview_type = 'video'
+        WHERE is_dir = 0 AND preview_type IS NULL
+            AND lower(filetype) IN ('mp4', 'mkv', 'mov', 'webm', 'avi', 'm4v', 'flv', 'wmv', 'mpeg', 'mpg', '3gp')
+        """,
+    ]),
+    (11, '目录列表的排序列补齐 NULL 并恢复普通列索引，keyset 翻页重新走索引范围扫描', [
+        # 迁移 9 的 coalesce 表达式索引只能按 parent_id 定位，行值比较退化为逐行过滤，深翻页和 OFFSET 一样慢。
+        # 改为保证 is_dir / create_datetime 不为 NULL，直接使用列本身排序和比较。
+        # is_dir 为 NULL 的行之前没有计入聚合值，由定时的 usage.reconcile 修正
+        "UPDATE t_file SET is_dir = 0 WHERE is_dir IS NULL",
+        "UPDATE t_file SET create_datetime = coalesce(update_datetime, '1970-01-01T00:00:00') WHERE create_datetime IS NULL",
+        "DROP INDEX IF EXISTS idx_file_parent_list",
+        "CREATE INDEX IF NOT EXISTS idx_file_parent_list ON t_file (parent_id, is_dir, create_datetime)",
+        # SQLite 不能给已有列加 NOT NULL，由触发器在写入 NULL 后立即补上默认值
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_list_default_insert AFTER INSERT ON t_file
+        WHEN NEW.is_dir IS NULL OR NEW.create_datetime IS NULL
+        BEGIN
+            UPDATE t_file
+            SET is_dir = coalesce(is_dir, 0),
+                create_datetime = coalesce(create_datetime, update_datetime, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
+            WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_file_list_default_update AFTER UPDATE OF is_dir, create_datetime ON t_file
+        WHEN NEW.is_dir IS NULL OR NEW.create_datetime IS NULL
+        BEGIN
+            UPDATE t_file
+            SET is_dir = coalesce(is_dir, 0),
+                create_datetime = coalesce(create_datetime, update_datetime, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
+            WHERE id = NEW.id;
+        END
+        """,
+    ]),
+]
+
+
+def current_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    """
+    执行所有未应用的迁移，每个版本在独立的事务中完成。
+    多个 worker 同时启动时由 BEGIN IMMEDIATE 串行化，事务内重新读取版本号避免重复执行。
+    """
+    conn = pool.get()
+    for version, description, step in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        with pool.transaction():
+            if version <= current_version(conn):
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for sql in step:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        app_logger.info(f'DB migration {version} applied: {description}')
+    ensure_search_index(conn)
+    return current_version(conn)
@@ -1,9 +1,39 @@
+import sqlite3
+import time
+
 from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import db as raw_db
+from .db import apply_pragmas
 
 jwt = JWTManager()
 db = SQLAlchemy()
 
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    # SQLAlchemy 连接池新建连接时，与 db.DB 使用相同的 pragma
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_pragmas(dbapi_connection)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['statement_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # ORM 会话执行的语句与 db.DB 一样交给 db.statement_hooks
+    if raw_db.statement_hooks:
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        raw_db.notify_statement(raw_db.Statement('sqlalchemy', statement, parameters, executemany, rows,
+                                                 time.perf_counter() - conn.info['statement_start']))
+
+
 def init_app_extension(app):
     jwt.init_app(app)
-    db.init_app(app)
\ No newline at end of file
+    db.init_app(app)
@@ -1,13 +1,25 @@
 from datetime import datetime
 
+from sqlalchemy.dialects.sqlite import DATETIME
+
 from ..extension import db
 
+# SQLite 中时间统一按 ISO 8601（'T' 分隔）存储，与 db.DB 直接写入的 isoformat() 一致，
+# 目录列表在 SQL 中按 create_datetime 字符串排序，格式不一致会排错
+IsoDateTime = db.DateTime().with_variant(
+    DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02dT%(hour)02d:%(minute)02d:%(second)02d.%(microsecond)06d",
+        regexp=r"(\d+)-(\d+)-(\d+)(?:[ T](\d+):(\d+):(\d+)(?:\.(\d{6}))?)?",
+    ),
+    'sqlite'
+)
+
 
 class BaseModel(db.Model):
     __abstract__ = True  # 👈 不会生成表
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    create_datetime = db.Column(db.DateTime, default=datetime.now)
-    update_datetime = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    create_datetime = db.Column(IsoDateTime, default=datetime.now)
+    update_datetime = db.Column(IsoDateTime, default=datetime.now, onupdate=datetime.now)
 
 
 class User(BaseModel):
@@ -15,6 +27,9 @@ class User(BaseModel):
     username = db.Column(db.String(20), nullable=False)
     password = db.Column(db.String(12), nullable=False)
     salt = db.Column(db.String(20), nullable=False)
+    # 密码哈希参数，见 PasswordUtil
+    pwd_algorithm = db.Column(db.String(20), nullable=False, default='sha256')
+    pwd_iterations = db.Column(db.Integer, nullable=False, default=65536)
     nickname = db.Column(db.String(20), nullable=True)
     email = db.Column(db.String(50), unique=True, nullable=True)
     phone = db.Column(db.String(11), nullable=True)
@@ -1,5 +1,18 @@
+import base64
+import binascii
+import json
+
+from ..db import DB
 from ..extension import db
 from ..model import File
+from ..util.cache import LRUCache
+
+# 目录 id -> 从根到该目录的祖先链，删除目录时失效
+ancestor_cache = LRUCache(maxsize=4096)
+
+# 目录列表只取页面和接口用到的列；subtree_size / subtree_files 为目录下全部文件的总大小和个数
+LIST_COLUMNS = ('id, filename, filesize, filetype, parent_id, is_dir, preview_type, md5, create_datetime, '
+                'subtree_size, subtree_files')
 
 
 def add_file(
@@ -35,9 +48,148 @@ def get_file_by_id(file_id: int) -> File:
 
 
 def delete_file(file_id):
-    db.session.delete(get_file_by_id(file_id))
+    file = get_file_by_id(file_id)
+    db.session.delete(file)
     db.session.commit()
+    invalidate_ancestors(None if file.is_dir else file_id)
 
 
 def exist_child(file_id):
-    return File.query.filter_by(parent_id=file_id).count() != 0
\ No newline at end of file
+    return File.query.filter_by(parent_id=file_id).count() != 0
+
+
+def exist_filename(parent_id, filename: str) -> bool:
+    """目录下是否已有同名文件（命中 idx_file_parent_name）"""
+    row = DB.query_one(
+        "SELECT 1 FROM t_file WHERE parent_id IS ? AND filename=? AND is_dir=0",
+        (int(parent_id) if parent_id else None, filename)
+    )
+    return row is not None
+
+
+def get_ancestors(file_id) -> list[dict]:
+    """
+    用一条递归 CTE 取出从根到 file_id（包含自身）的节点链，
+    每项包含 id、filename、parent_id、is_dir，顺序为 root...current。
+    结果缓存在 ancestor_cache 中，返回的列表不要原地修改。
+    """
+    try:
+        file_id = int(file_id) if file_id else None
+    except ValueError:
+        return []
+    if not file_id:
+        return []
+
+    chain = ancestor_cache.get(file_id)
+    if chain is not None:
+        return chain
+
+    chain = DB.query("""
+        WITH RECURSIVE ancestor(id, filename, parent_id, is_dir, depth) AS (
+            SELECT id, filename, parent_id, is_dir, 0 FROM t_file WHERE id = ?
+            UNION ALL
+            SELECT f.id, f.filename, f.parent_id, f.is_dir, a.depth + 1
+            FROM t_file f
+            JOIN ancestor a ON f.id = a.parent_id
+            WHERE a.depth < 100
+        )
+        SELECT id, filename, parent_id, is_dir FROM ancestor ORDER BY depth DESC
+    """, (file_id,))
+    if chain:
+        ancestor_cache.set(file_id, chain)
+    return chain
+
+
+def collect_subtree(root_ids: list[int]) -> list[dict]:
+    """
+    用一条递归 CTE 取出若干节点及其全部子孙（id、is_dir、filepath、md5）。
+    UNION 去重，选中的节点互为祖先或数据中出现环时也不会重复或死循环。
+    """
+    return DB.query("""
+        WITH RECURSIVE subtree(id) AS (
+            SELECT id FROM t_file WHERE id IN (SELECT value FROM json_each(?))
+            UNION
+            SELECT f.id FROM t_file f JOIN subtree s ON f.parent_id = s.id
+        )
+        SELECT t_file.id, is_dir, filepath, md5 FROM subtree JOIN t_file ON t_file.id = subtree.id
+    """, (json.dumps([int(i) for i in root_ids]),))
+
+
+def collect_archive_entries(root_ids: list[int]) -> list[dict]:
+    """
+    用一条递归 CTE 取出若干节点及其子孙在压缩包中的相对路径（path、is_dir、filepath），
+    选中节点的文件名作为第一级，按路径排序。
+    """
+    return DB.query("""
+        WITH RECURSIVE tree(id, path, is_dir, filepath, depth) AS (
+            SELECT id, filename, is_dir, filepath, 0 FROM t_file WHERE id IN (SELECT value FROM json_each(?))
+            UNION ALL
+            SELECT f.id, t.path || '/' || f.filename, f.is_dir, f.filepath, t.depth + 1
+            FROM t_file f
+            JOIN tree t ON f.parent_id = t.id
+            WHERE t.is_dir = 1 AND t.depth < 100
+        )
+        SELECT path, is_dir, filepath FROM tree ORDER BY path
+    """, (json.dumps([int(i) for i in root_ids]),))
+
+
+def delete_rows(file_ids: list[int]) -> None:
+    """删除 t_file 记录及指向它们的分享，需在调用方的事务中执行"""
+    ids = json.dumps([int(i) for i in file_ids])
+    DB.execute("DELETE FROM t_share WHERE file_id IN (SELECT value FROM json_each(?))", (ids,))
+    DB.execute("DELETE FROM t_file WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+
+
+def invalidate_ancestors(file_id=None):
+    """
+    节点被删除（或移动）后使祖先链缓存失效。
+    删除目录会影响所有以它为祖先的缓存链，直接清空；删除单个文件只需去掉自身。
+    """
+    if file_id is None:
+        ancestor_cache.clear()
+    else:
+        ancestor_cache.pop(int(file_id))
+
+
+def encode_cursor(row: dict) -> str:
+    """把列表最后一行的排序键 (is_dir, create_datetime, id) 编码为 URL 安全的游标"""
+    raw = f"{int(row['is_dir'] or 0)}|{row['create_datetime'] or ''}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[int, str, int] | None:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        is_dir, create_datetime, file_id = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        return int(is_dir), create_datetime, int(file_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def children_query(parent_id, after: tuple[int, str, int] = None, limit: int = None) -> tuple[str, list]:
+    """list_children 使用的 SQL 和参数，limit 不为空时多取一行用来判断是否还有下一页"""
+    # is_dir / create_datetime 由迁移 11 的触发器保证不为 NULL，行值比较直接使用列本身才能走索引范围扫描
+    sql = f"SELECT {LIST_COLUMNS} FROM t_file WHERE parent_id IS ?"
+    params = [int(parent_id) if parent_id else None]
+    if after:
+        sql += " AND (is_dir, create_datetime, id) < (?, ?, ?)"
+        params.extend(after)
+    sql += " ORDER BY is_dir DESC, create_datetime DESC, id DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    return sql, params
+
+
+def list_children(parent_id, after: tuple[int, str, int] = None, limit: int = None) -> tuple[list[dict], str | None]:
+    """
+    列出目录下的条目，由 SQL 按 目录优先、创建时间倒序 排序（命中 idx_file_parent_list）。
+    after 为上一页最后一行的排序键（decode_cursor 的结果），limit 为空时返回全部。
+    返回 (rows, next_cursor)，没有下一页时 next_cursor 为 None。
+    """
+    rows = DB.query(*children_query(parent_id, after, limit))
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
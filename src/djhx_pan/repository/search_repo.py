@@ -0,0 +1,99 @@
+import datetime
+
+from ..db import DB
+
+# 搜索结果只取页面和接口用到的列
+SEARCH_COLUMNS = ('f.id, f.filename, f.filesize, f.filetype, f.parent_id, f.is_dir, f.preview_type, f.create_datetime, '
+                  'f.subtree_size, f.subtree_files')
+
+# snippet / highlight 的标记，由 service 转换成页面上的 <mark>
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+_available = None
+
+
+def is_available() -> bool:
+    """t_file_search 是否存在（SQLite 不支持 FTS5 trigram 时迁移会跳过）"""
+    global _available
+    if _available is None:
+        _available = DB.query_one("SELECT 1 FROM sqlite_master WHERE type='table' AND name='t_file_search'") is not None
+    return _available
+
+
+def _phrase(term: str) -> str:
+    # 按短语匹配，双引号转义后 FTS5 的运算符和特殊字符都按普通文本处理
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like(term: str) -> str:
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search(match_terms: list[str], like_terms: list[str], with_content: bool, limit: int, offset: int) -> list[dict]:
+    """
+    match_terms 走 FTS5 索引（每项至少 3 个字符），按 bm25 排序，文件名的权重高于内容；
+    like_terms 太短无法使用 trigram，用 LIKE 过滤：有 match_terms 缩小范围时同时匹配文件名和内容，
+    否则只匹配文件名，避免逐行扫描全部内容。所有词之间是 AND 关系。
+    返回的 filename_html / snippet 中用 MARK_START / MARK_END 标出命中的部分。
+    """
+    column = '' if with_content else 'filename : '
+    match = ' AND '.join(column + _phrase(term) for term in match_terms)
+
+    if not is_available():
+        sql = f"SELECT {SEARCH_COLUMNS} FROM t_file f WHERE 1 = 1"
+        params = []
+        for term in match_terms + like_terms:
+            sql += " AND f.filename LIKE ? ESCAPE '\\'"
+            params.append(_like(term))
+        sql += " ORDER BY f.is_dir DESC, length(f.filename), f.id DESC LIMIT ? OFFSET ?"
+        return DB.query(sql, params + [limit, offset])
+
+    params = []
+    if match:
+        sql = (f"SELECT {SEARCH_COLUMNS}, "
+               f"highlight(t_file_search, 0, ?, ?) AS filename_html, "
+               f"snippet(t_file_search, 1, ?, ?, '…', 48) AS snippet "
+               f"FROM t_file_search JOIN t_file f ON f.id = t_file_search.rowid "
+               f"WHERE t_file_search MATCH ?")
+        params.extend([MARK_START, MARK_END, MARK_START, MARK_END, match])
+    else:
+        sql = (f"SELECT {SEARCH_COLUMNS}, NULL AS filename_html, NULL AS snippet "
+               f"FROM t_file_search JOIN t_file f ON f.id = t_file_search.rowid WHERE 1 = 1")
+    for term in like_terms:
+        if match and with_content:
+            sql += " AND (t_file_search.filename LIKE ? ESCAPE '\\' OR t_file_search.content LIKE ? ESCAPE '\\')"
+            params.extend([_like(term), _like(term)])
+        else:
+            sql += " AND t_file_search.filename LIKE ? ESCAPE '\\'"
+            params.append(_like(term))
+    if match:
+        sql += " ORDER BY bm25(t_file_search, 10.0, 1.0), f.id DESC"
+    else:
+        sql += " ORDER BY f.is_dir DESC, length(f.filename), f.id DESC"
+    sql += " LIMIT ? OFFSET ?"
+    return DB.query(sql, params + [limit, offset])
+
+
+def pending_content(after_id: int, limit: int) -> list[dict]:
+    """id 大于 after_id、还没有建立内容索引的文本文件（命中 idx_file_text）"""
+    return DB.query("""
+        SELECT f.id, f.filepath FROM t_file f
+        WHERE f.preview_type = 'text' AND f.is_dir = 0 AND f.id > ?
+            AND NOT EXISTS (SELECT 1 FROM t_search_content s WHERE s.file_id = f.id)
+        ORDER BY f.id
+        LIMIT ?
+    """, (after_id, limit))
+
+
+def save_content(contents: list[tuple[int, str]]) -> None:
+    """写入一批 (file_id, 文本内容)；期间已被删除的文件不会留下记录"""
+    now = datetime.datetime.now().isoformat()
+    with DB.transaction():
+        DB.executemany("UPDATE t_file_search SET content=? WHERE rowid=?",
+                       [(content, file_id) for file_id, content in contents])
+        DB.executemany(
+            "INSERT OR REPLACE INTO t_search_content (file_id, indexed_datetime) "
+            "SELECT ?, ? WHERE EXISTS (SELECT 1 FROM t_file WHERE id=?)",
+            [(file_id, now, file_id) for file_id, _ in contents]
+        )
@@ -0,0 +1,65 @@
+import datetime
+
+from ..db import DB
+
+
+def get_usage() -> dict:
+    """总用量（由触发器实时维护）：used_size、file_count、reconcile_datetime"""
+    row = DB.query_one("SELECT used_size, file_count, reconcile_datetime FROM t_storage_usage WHERE id = 1")
+    return dict(row) if row else {'used_size': 0, 'file_count': 0, 'reconcile_datetime': None}
+
+
+def reconcile() -> dict:
+    """
+    全量重算目录聚合值和总用量，修正触发器之外的写入（手工改库、旧代码等）造成的偏差。
+    在一个 BEGIN IMMEDIATE 事务中完成，期间没有其他写入；只更新与实际值不一致的目录行。
+    返回修正的目录数以及总用量重算前后的差值。
+    """
+    with DB.transaction():
+        before = get_usage()
+        # 直接写入正确值，不经过 trg_file_usage_rollup 向上累加
+        DB.execute("UPDATE t_storage_usage SET reconciling = 1 WHERE id = 1")
+        DB.execute("DROP TABLE IF EXISTS temp.folder_usage")
+        DB.execute("""
+            CREATE TEMP TABLE folder_usage AS
+            WITH RECURSIVE closure(ancestor, id, depth) AS (
+                SELECT id, id, 0 FROM t_file WHERE is_dir = 1
+                UNION ALL
+                SELECT c.ancestor, f.id, c.depth + 1 FROM t_file f JOIN closure c ON f.parent_id = c.id
+                WHERE c.depth < 100
+            )
+            SELECT c.ancestor AS id, sum(coalesce(f.filesize, 0)) AS size, count(*) AS files
+            FROM closure c JOIN t_file f ON f.id = c.id
+            WHERE f.is_dir = 0
+            GROUP BY c.ancestor
+        """)
+        fixed = DB.query("""
+            UPDATE t_file SET subtree_size = u.size, subtree_files = u.files
+            FROM temp.folder_usage u
+            WHERE t_file.id = u.id AND (t_file.subtree_size != u.size OR t_file.subtree_files != u.files)
+            RETURNING t_file.id
+        """)
+        fixed += DB.query("""
+            UPDATE t_file SET subtree_size = 0, subtree_files = 0
+            WHERE is_dir = 1 AND (subtree_size != 0 OR subtree_files != 0)
+                AND id NOT IN (SELECT id FROM temp.folder_usage)
+            RETURNING id
+        """)
+        DB.execute("DROP TABLE temp.folder_usage")
+        DB.execute("""
+            UPDATE t_storage_usage
+            SET used_size = (SELECT coalesce(sum(filesize), 0) FROM t_file WHERE is_dir = 0),
+                file_count = (SELECT count(*) FROM t_file WHERE is_dir = 0),
+                reconciling = 0,
+                reconcile_datetime = ?
+            WHERE id = 1
+        """, (datetime.datetime.now().isoformat(),))
+        after = get_usage()
+
+    return {
+        'folders_fixed': len(fixed),
+        'used_size': after['used_size'],
+        'file_count': after['file_count'],
+        'size_drift': after['used_size'] - before['used_size'],
+        'file_drift': after['file_count'] - before['file_count'],
+    }
@@ -1,3 +1,6 @@
+import datetime
+
+from ..db import DB
 from ..extension import db
 from ..model import User
 
@@ -14,8 +17,29 @@ def get_user_by_phone(phone):
     return User.query.filter_by(phone=phone).first()
 
 
-def add_user(username: str, nickname: str, password: str, salt: str, email: str, phone: str, ):
-    user = User(username=username, nickname=nickname, password=password, salt=salt, email=email, phone=phone)
+def add_user(username: str, nickname: str, password: str, salt: str, email: str, phone: str,
+             pwd_algorithm: str, pwd_iterations: int):
+    user = User(username=username, nickname=nickname, password=password, salt=salt, email=email, phone=phone,
+                pwd_algorithm=pwd_algorithm, pwd_iterations=pwd_iterations)
     db.session.add(user)
     db.session.commit()
     return user
+
+
+def get_credentials(username: str) -> dict | None:
+    """登录校验用到的列：密码哈希、salt 和哈希参数"""
+    return DB.query_one(
+        "SELECT id, username, password, salt, pwd_algorithm, pwd_iterations FROM t_user WHERE username = ?",
+        (username,)
+    )
+
+
+def update_password_hash(user_id: int, old_hash: str, password_hash: str, salt: str,
+                         pwd_algorithm: str, pwd_iterations: int) -> bool:
+    """替换密码哈希；期间密码已被修改（old_hash 不再匹配）时不更新，返回是否更新"""
+    return bool(DB.query("""
+        UPDATE t_user SET password=?, salt=?, pwd_algorithm=?, pwd_iterations=?, update_datetime=?
+        WHERE id=? AND password=?
+        RETURNING id
+    """, (password_hash, salt, pwd_algorithm, pwd_iterations, datetime.datetime.now().isoformat(),
+          user_id, old_hash)))
@@ -9,6 +9,7 @@ from ..config.app_config import AppConfig
 from ..exception import ClientError, ServerError
 from ..service import user_service
 from ..util import JsonResult
+from ..util.ratelimit import client_ip, rate_limit
 from ..repository import user_repo
 
 app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
@@ -23,7 +24,7 @@ def api_login():
     if login_type == 'username':
         username = data.get('username')
         password = data.get('password')
-        token_data = user_service.login_by_username(username, password)
+        token_data = user_service.login_by_username(username, password, client_ip())
         if not token_data:
             raise ServerError('无法生成 Token Data')
         else:
@@ -55,6 +56,7 @@ def api_register():
 
 
 @api_auth_bp.post('/send_code')
+@rate_limit
 def api_send_code():
     data = request.get_json()
     email = data.get('email')
@@ -1,17 +1,16 @@
 import logging
-import os
-from datetime import datetime
 
-from flask import Blueprint, request, send_from_directory
+from flask import Blueprint, request
 from flask_jwt_extended import (
     jwt_required
 )
 
-from .file import ICON_TYPES, _row_to_dict, UPLOAD_FOLDER, PREVIEW_TYPES, delete_entry
+from .file import list_entries, page_limit, parse_ids, _zip_download
 from ..config.app_config import AppConfig
-from ..db import DB
-from ..service import file_service
+from ..exception import ClientError
+from ..service import file_service, job_service, upload_service, preview_service, search_service, usage_service
 from ..util import JsonResult, safe_secure_filename
+from ..util.download import send_stored_file
 
 app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
 
@@ -21,32 +20,35 @@ api_file_bp = Blueprint('api_file', __name__, url_prefix='/api/file')
 @api_file_bp.get('/')
 @jwt_required()
 def api_file_page():
-    parent_id = request.args.get('parent_id')
-    if parent_id:
-        # 取指定父目录下的条目
-        rows = DB.query("SELECT * FROM t_file WHERE parent_id=?", (parent_id,))
-    else:
-        rows = DB.query("SELECT * FROM t_file WHERE parent_id IS NULL")
-
-    # 保证 rows 为 list of dict
-    rows = [_row_to_dict(r) for r in rows] if rows else []
-
-    for r in rows:
-        if r['is_dir']:
-            r['icon_class'] = 'folder'
-        else:
-            filetype = (r.get('filetype') or '').lower()
-            r['icon_class'] = ICON_TYPES.get(filetype, 'file')
-
-    rows.sort(
-        key=lambda r: (
-            not r['is_dir'],
-            -datetime.fromisoformat(r['create_datetime']).timestamp() if r['create_datetime'] else 0
-        )
-    )
+    parent_id = request.args.get('parent_id', type=int)
+
+    # 传入 after / limit 时使用 keyset 分页，返回 {files, next_cursor}
+    if 'after' in request.args or 'limit' in request.args:
+        rows, next_cursor = list_entries(parent_id, after=request.args.get('after'), limit=page_limit())
+        return JsonResult.successful(data={'files': rows, 'next_cursor': next_cursor})
+
+    rows, _ = list_entries(parent_id)
     return JsonResult.successful(data=rows)
 
 
+@api_file_bp.get('/usage')
+@jwt_required()
+def api_usage():
+    """总用量：used_size、file_count、quota（None 为不限制）、percent；目录的聚合值见列表中的 subtree_size / subtree_files"""
+    return JsonResult.successful(data=usage_service.get_usage())
+
+
+@api_file_bp.get('/search')
+@jwt_required()
+def api_search():
+    """
+    搜索文件名和文本文件内容：q 关键词（空白分隔，全部命中），scope=all|name，page 从 1 开始，limit 每页条数。
+    返回 {keyword, scope, page, limit, items, has_more}，按相关度排序
+    """
+    return JsonResult.successful(data=search_service.search(
+        request.args.get('q'), request.args.get('scope', 'all'), request.args.get('page'), request.args.get('limit')))
+
+
 @api_file_bp.post('/create-folder')
 @jwt_required()
 def api_create_folder():
@@ -80,13 +82,103 @@ def api_upload_file():
     return JsonResult.successful("上传文件成功")
 
 
+@api_file_bp.post('/upload/instant')
+@jwt_required()
+def api_instant_upload():
+    """
+    秒传检查：先发送文件的 md5，服务端已有相同内容时直接登记，不需要再传输文件内容
+    {"filename": "a.iso", "md5": "...", "filesize": 123, "parent_id": 1}
+    """
+    json_data = request.get_json() or {}
+    new_file = file_service.instant_upload(
+        filename=json_data.get('filename'),
+        md5=json_data.get('md5'),
+        parent_id=json_data.get('parent_id'),
+        filesize=json_data.get('filesize'),
+    )
+    if not new_file:
+        return JsonResult.successful('服务端没有相同内容，请上传文件', {'exists': False})
+    return JsonResult.successful(f'秒传文件 {new_file.filename} 成功', {'exists': True, 'id': new_file.id})
+
+
+@api_file_bp.post('/upload/chunked')
+@jwt_required()
+def api_chunked_upload_init():
+    """
+    创建分片上传任务
+    {"filename": "a.iso", "filesize": 123, "md5": "...", "parent_id": 1, "chunk_size": 8388608}
+    """
+    json_data = request.get_json() or {}
+    task = upload_service.init_upload(
+        filename=json_data.get('filename'),
+        filesize=json_data.get('filesize'),
+        parent_id=json_data.get('parent_id'),
+        md5=json_data.get('md5'),
+        chunk_size=json_data.get('chunk_size'),
+    )
+    return JsonResult.successful('分片上传任务已创建', task)
+
+
+@api_file_bp.get('/upload/chunked/<upload_id>')
+@jwt_required()
+def api_chunked_upload_status(upload_id):
+    # 断点续传：返回已收到的分片序号
+    return JsonResult.successful(data=upload_service.upload_status(upload_id))
+
+
+@api_file_bp.put('/upload/chunked/<upload_id>/<int:index>')
+@jwt_required()
+def api_chunked_upload_chunk(upload_id, index):
+    # 请求体即分片的原始字节
+    size = upload_service.save_chunk(upload_id, index, request.stream)
+    return JsonResult.successful(f'分片 {index} 上传成功', {'index': index, 'size': size})
+
+
+@api_file_bp.post('/upload/chunked/<upload_id>/complete')
+@jwt_required()
+def api_chunked_upload_complete(upload_id):
+    new_file = upload_service.complete_upload(upload_id)
+    return JsonResult.successful(f'上传文件 {new_file.filename} 成功', {'id': new_file.id, 'md5': new_file.md5})
+
+
+@api_file_bp.delete('/upload/chunked/<upload_id>')
+@jwt_required()
+def api_chunked_upload_abort(upload_id):
+    upload_service.abort_upload(upload_id)
+    return JsonResult.successful('已取消上传')
+
+
+@api_file_bp.get('/zip')
+@jwt_required()
+def api_zip_download():
+    """打包下载目录或多个文件 / 目录：参数 ids=1,2,3，ZIP 流式写入响应"""
+    ids = parse_ids(request.args.get('ids'))
+    if not ids:
+        raise ClientError(f'未选择要下载的项')
+    return _zip_download(ids)
+
+
+@api_file_bp.post('/delete/batch')
+@jwt_required()
+def api_delete_batch():
+    """批量删除文件和目录（包括目录下的全部内容），返回后台任务 id，通过 /api/job/<id> 查询进度"""
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = [int(i) for i in data.get('ids') or []]
+    except (TypeError, ValueError):
+        raise ClientError(f'ids 格式错误')
+    if not ids:
+        raise ClientError(f'未选择要删除的项')
+    job_id = job_service.enqueue('file.delete_tree', {'ids': ids})
+    return JsonResult.successful(f'已提交删除 {len(ids)} 项', {'job_id': job_id})
+
+
 @api_file_bp.get('/download/<int:file_id>')
 @jwt_required()
 def api_download_file(file_id):
-    filepath = file_service.download_file(file_id=file_id)
-    directory = os.path.dirname(filepath)
-    filename = os.path.basename(filepath)
-    return send_from_directory(directory, filename, as_attachment=True)
+    file = file_service.download_file(file_id=file_id)
+    # 内容存储中的文件名是 md5，下载时使用原始文件名
+    return send_stored_file(file.filepath, file.filename, file.md5)
 
 
 @api_file_bp.post('/delete/file/<int:file_id>')
@@ -101,3 +193,18 @@ def api_delete_file(file_id):
 def api_delete_folder(folder_id):
     deleted_folder = file_service.delete_folder(folder_id=folder_id)
     return JsonResult.successful(f'删除目录 {deleted_folder.filename} 成功')
+
+
+@api_file_bp.get('/preview/<int:file_id>')
+@jwt_required()
+def api_preview_file(file_id):
+    file = file_service.download_file(file_id=file_id)
+    preview = preview_service.read_preview(
+        file.filepath,
+        mode=request.args.get('mode', 'head'),
+        max_bytes=request.args.get('bytes'),
+        start_line=request.args.get('start'),
+        line_count=request.args.get('lines'),
+        offset=request.args.get('offset'),
+    )
+    return JsonResult.successful(data={'filename': file.filename, **preview})
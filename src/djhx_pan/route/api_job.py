@@ -0,0 +1,20 @@
+import logging
+
+from flask import Blueprint
+from flask_jwt_extended import (
+    jwt_required
+)
+
+from ..config.app_config import AppConfig
+from ..service import job_service
+from ..util import JsonResult
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+api_job_bp = Blueprint('api_job', __name__, url_prefix='/api/job')
+
+
+@api_job_bp.get('/<int:job_id>')
+@jwt_required()
+def api_job_status(job_id):
+    return JsonResult.successful(data=job_service.get_job(job_id))
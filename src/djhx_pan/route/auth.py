@@ -1,13 +1,13 @@
 import logging
-import random
-import string
-import time
 
 from flask import Blueprint, request, session, redirect, render_template, url_for, jsonify
 
 from ..config.app_config import AppConfig
 from ..db import DB
-from ..util import PasswordUtil, send_email_verify_code
+from ..exception import ClientError, ServerError
+from ..repository import user_repo
+from ..service import password_service, user_service
+from ..util.ratelimit import rate_limit
 
 app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
 
@@ -28,18 +28,18 @@ def login():
             # 用户名密码登录
             username = request.form.get('username')
             password = request.form.get('password')
-            db_user = DB.query(
-                "SELECT username, password, salt FROM t_user WHERE username = ?",
-                (username,)
-            )
+            db_user = user_repo.get_credentials(username)
             if db_user:
-                db_user = db_user[0]
-                if PasswordUtil.verify_password(password, db_user.get('password'), db_user.get('salt')):
+                try:
+                    verified = password_service.verify_user(db_user, password)
+                except (ClientError, ServerError) as e:
+                    verified, error = False, e.message
+                if verified:
                     session.permanent = True
                     session['user'] = {'username': username}
                     next_url = session.pop('next_url', None) or url_for('main.index')
                     return redirect(next_url)
-                else:
+                elif not error:
                     error = '密码错误'
             else:
                 error = f'用户 {username} 不存在'
@@ -52,21 +52,16 @@ def login():
             if not db_user:
                 error = f'邮箱 {email} 未注册'
             else:
-                stored = session.get('email_code')
-                if stored and stored['email'] == email:
-                    if time.time() - stored['time'] > 300:  # 5分钟有效
-                        error = '验证码已过期'
-                    elif stored['code'] != code:
-                        error = '验证码错误'
-                    else:
-                        # 登录成功
-                        session.permanent = True
-                        session['user'] = {'username': db_user[0]['username']}
-                        session.pop('email_code', None)  # 删除验证码
-                        next_url = session.pop('next_url', None) or url_for('main.index')
-                        return redirect(next_url)
+                try:
+                    user_service.check_email_code(email, code)
+                except ClientError as e:
+                    error = e.message
                 else:
-                    error = '请先获取验证码'
+                    # 登录成功
+                    session.permanent = True
+                    session['user'] = {'username': db_user[0]['username']}
+                    next_url = session.pop('next_url', None) or url_for('main.index')
+                    return redirect(next_url)
 
     return render_template('login.html', error=error, username=username, email=email, login_type=login_type)
 
@@ -96,17 +91,19 @@ def register():
             error = f'用户名 {username} 已存在'
         else:
             # 生成 salt 和 hash
-            salt = PasswordUtil.generate_salt()
-            password_hash = PasswordUtil.hash_password(password, salt)
+            try:
+                hashed = password_service.hash_new_password(password)
+            except (ClientError, ServerError) as e:
+                return render_template('register.html', error=e.message)
 
             # 存储到数据库
             DB.execute(
                 """
                 INSERT INTO t_user
-                    (username, password, salt, nickname)
-                VALUES (?, ?, ?, ?);
+                    (username, password, salt, nickname, pwd_algorithm, pwd_iterations)
+                VALUES (?, ?, ?, ?, ?, ?);
                 """,
-                (username, password_hash, salt, username)
+                (username, hashed['password'], hashed['salt'], username, hashed['pwd_algorithm'], hashed['pwd_iterations'])
             )
 
             # 注册成功后跳转到登录页
@@ -122,25 +119,15 @@ def logout():
 
 
 @auth_bp.route('/send_code', methods=['POST'])
+@rate_limit
 def send_code():
     data = request.get_json()
     email = data.get('email')
 
-    # 检查邮箱是否存在
-    db_user = DB.query("SELECT id FROM t_user WHERE email = ?", (email,))
-    if not db_user:
-        return jsonify({'success': False, 'message': '该邮箱未注册'})
-
-    # 生成6位验证码
-    code = ''.join(random.choices(string.digits, k=6))
-    session['email_code'] = {'email': email, 'code': code, 'time': time.time()}
-
-    app_logger.info(f"Send code {code} to {email}")
+    # 生成 6 位验证码，与接口登录共用同一份验证码存储，由后台任务发送邮件
     try:
-        send_email_verify_code(email, code)
-    except Exception as e:
-        app_logger.exception(f'邮件 {email} 验证码发送失败: {e}')
-    else:
-        app_logger.info(f'邮件 {email} 验证码发送成功')
+        user_service.send_email_code(email)
+    except ClientError as e:
+        return jsonify({'success': False, 'message': e.message})
 
     return jsonify({'success': True, 'message': '验证码已发送，请查收邮件'})
@@ -3,13 +3,21 @@ import logging
 import os
 import secrets
 import string
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
-from flask import Blueprint, request, render_template, send_from_directory, redirect, url_for, flash
+from flask import Blueprint, request, render_template, redirect, url_for, flash, send_file, current_app
 
 from ..config.app_config import AppConfig, config_dict
 from ..db import DB
+from ..exception import ClientError
+from ..repository import file_repo
+from ..service import file_service, job_service, preview_service, search_service, share_service, thumbnail_service, usage_service
 from ..util import safe_secure_filename, login_required, JsonResult
+from ..util.constant import ICON_TYPES
+from ..util.download import send_stored_file
+from ..util.ratelimit import rate_limit
+from ..util.zipstream import zip_response
+from ..util.stream import spool_upload
 
 app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
 
@@ -22,126 +30,6 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 file_bp = Blueprint('file', __name__, url_prefix='/file')
 
-ICON_TYPES = {
-
-    ## 特殊处理
-    "md": "markdown",
-    "json": "json",
-    "py": "python",
-    "java": "java",
-
-    ## 大类
-    # 文档类
-    "pdf": "pdf",
-    "txt": "text", "rtf": "text",
-    "xml": "text",
-    "yml": "text", "toml": "text",
-
-    # Office 文档
-    "doc": "word", "docx": "word", "odt": "word",
-    "xls": "spreadsheet", "xlsx": "spreadsheet", "ods": "spreadsheet",
-    "ppt": "presentation", "pptx": "presentation", "odp": "presentation",
-
-    # 图片类
-    "jpg": "image", "jpeg": "image", "png": "image", "gif": "image",
-    "webp": "image", "bmp": "image", "tif": "image", "tiff": "image",
-    "svg": "image", "ico": "image", "heic": "image", "avif": "image",
-    "psd": "image", "ai": "image", "eps": "image",
-
-    # 音频类
-    "mp3": "audio", "wav": "audio", "flac": "audio", "aac": "audio",
-    "ogg": "audio", "m4a": "audio", "wma": "audio", "aiff": "audio",
-    "mid": "audio", "midi": "audio", "amr": "audio",
-
-    # 视频类
-    "mp4": "video", "avi": "video", "mkv": "video", "mov": "video",
-    "flv": "video", "wmv": "video", "webm": "video", "mpeg": "video", "mpg": "video",
-    "m4v": "video", "m3u8": "video", "3gp": "video",
-
-    # 压缩包类
-    "zip": "archive", "rar": "archive", "7z": "archive",
-    "tar": "archive", "gz": "archive", "bz2": "archive", "xz": "archive",
-    "tgz": "archive", "tar.gz": "archive", "iso": "archive", "dmg": "archive",
-
-    # 代码 / 脚本类
-    "pyc": "code", "pyo": "code",
-    "js": "code", "ts": "code", "jsx": "code", "tsx": "code",
-    "html": "code", "htm": "code", "css": "code",
-    "class": "code", "jar": "code",
-    "c": "code", "cpp": "code", "h": "code", "hpp": "code", "cs": "code",
-    "go": "code", "rs": "code", "php": "code", "rb": "code",
-    "swift": "code", "kt": "code", "kts": "code", "dart": "code",
-    "json5": "code", "vue": "code", "jsp": "code", "asp": "code", "aspx": "code",
-    "sql": "code", "db": "code", "sqlite": "code",
-    "bat": "code", "cmd": "code", "sh": "code", "bash": "code", "zsh": "code",
-
-    # 系统类
-    "exe": "binary", "msi": "binary", "bin": "binary", "dll": "binary",
-    "so": "binary", "dylib": "binary", "sys": "binary",
-    "apk": "binary", "ipa": "binary", "app": "binary", "run": "binary",
-    "pkg": "binary", "img": "binary", "vmdk": "binary", "vdi": "binary",
-    "ovf": "binary", "ova": "binary",
-
-    # 设计 / 3D / CAD
-    "dwg": "design", "dxf": "design", "blend": "design",
-    "obj": "design", "fbx": "design", "stl": "design",
-    "3ds": "design", "gltf": "design", "glb": "design",
-    "indd": "design", "xd": "design", "sketch": "design",
-
-    # 字体类
-    "ttf": "font", "otf": "font", "woff": "font", "woff2": "font", "eot": "font",
-
-    # 数据 / 备份
-    "bak": "backup", "old": "backup", "tmp": "backup", "swp": "backup",
-
-    # 其他常见文件
-    "torrent": "torrent",
-    "url": "link", "lnk": "link",
-    "eml": "mail", "msg": "mail",
-    "ics": "calendar",
-    "crt": "certificate", "pem": "certificate", "key": "certificate",
-    "csv": "spreadsheet", "tsv": "spreadsheet",
-
-    # 电子书类
-    "epub": "ebook", "mobi": "ebook", "azw3": "ebook", "cbz": "ebook", "cbr": "ebook",
-
-    # 日志 / 监控类
-    "log": "text", "out": "text", "err": "text",
-
-    # 配置类
-    "env": "config", "properties": "config", "ini": "config",
-    "cfg": "config", "conf": "config", "yaml": "config",
-}
-
-
-PREVIEW_TYPES = {
-    # 图片类
-    "jpg": "image", "jpeg": "image", "png": "image", "gif": "image",
-    "webp": "image", "bmp": "image", "tif": "image", "tiff": "image",
-    "svg": "image", "ico": "image", "heic": "image", "avif": "image",
-    "psd": "image", "ai": "image", "eps": "image",
-
-    # 文本类
-    "txt": "text", "rtf": "text",
-    "xml": "text",
-    "yml": "text", "toml": "text",
-    "md": "text", "ini": "text",
-    "env": "text", "properties": "text",
-    "log": "text", "out": "text", "err": "text",
-
-    "py": "text", "java": "text", "json": "text",
-    "pyc": "text", "pyo": "text",
-    "js": "text", "ts": "text", "jsx": "text", "tsx": "text",
-    "html": "text", "htm": "text", "css": "text",
-    "class": "text", "jar": "text",
-    "c": "text", "cpp": "text", "h": "text", "hpp": "text", "cs": "text",
-    "go": "text", "rs": "text", "php": "text", "rb": "text",
-    "swift": "text", "kt": "text", "kts": "text", "dart": "text",
-    "json5": "text", "vue": "text", "jsp": "text", "asp": "text", "aspx": "text",
-    "sql": "text", "db": "text", "sqlite": "text",
-    "bat": "text", "cmd": "text", "sh": "text", "bash": "text", "zsh": "text",
-}
-
 
 def _row_to_dict(row) -> Dict[str, Any]:
     """
@@ -155,59 +43,39 @@ def _row_to_dict(row) -> Dict[str, Any]:
 
 def build_breadcrumbs(start_parent_id: Optional[int]) -> List[Dict[str, Any]]:
     """
-    从当前 parent_id 向上查父节点，生成面包屑（根不包含 None）
-    返回列表，顺序是从根向下到当前（root...current）
+    生成面包屑（根不包含 None），返回列表，顺序是从根向下到当前（root...current）
+    祖先链由 file_repo.get_ancestors 用一条递归 CTE 查出并缓存
     """
-    crumbs: List[Dict[str, Any]] = []
-    pid = start_parent_id
-    safety = 0
-    while pid:
-        safety += 1
-        if safety > 100:
-            break
-        rows = DB.query("SELECT * FROM t_file WHERE id=?", (pid,))
-        if not rows:
-            break
-        row = _row_to_dict(rows[0])
-        crumbs.append({'id': row.get('id'), 'filename': row.get('filename')})
-        pid = row.get('parent_id')
-    crumbs.reverse()
-    return crumbs
+    return file_repo.get_ancestors(start_parent_id)
 
 
-def delete_entry(entry_id: int):
+def list_entries(parent_id: Optional[int], after: Optional[str] = None,
+                 limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    递归删除一个 t_file 条目：
-    - 如果是文件，删除物理文件（如果存在）
-    - 如果是目录，递归删除子条目
-    - 最后删除数据库记录本身
+    读取目录下的条目并补充 icon_class，返回 (rows, next_cursor)
+    after 为上一页返回的游标，limit 为空时返回全部条目
     """
-    rows = DB.query("SELECT * FROM t_file WHERE id=?", (entry_id,))
-    if not rows:
-        return
-    row = _row_to_dict(rows[0])
+    after_key = None
+    if after:
+        after_key = file_repo.decode_cursor(after)
+        if after_key is None:
+            raise ClientError('无效的分页游标')
 
-    if row.get('is_dir'):
-        # 先删除子节点
-        children = DB.query("SELECT id FROM t_file WHERE parent_id=?", (entry_id,))
-        for c in children:
-            # c 可能是 Row-like
-            cid = c.get('id') if isinstance(c, dict) else c[0] if len(c) else None
-            if cid:
-                delete_entry(cid)
-        filepath = row.get('filepath')
-        if os.path.isdir(filepath):
-            os.rmdir(filepath)
-    else:
-        filepath = row.get('filepath')
-        try:
-            if filepath and os.path.exists(filepath) and os.path.isfile(filepath):
-                os.remove(filepath)
-        except Exception as e:
-            app_logger.warning("删除文件 %s 时出错: %s", filepath, e)
+    rows, next_cursor = file_repo.list_children(parent_id, after=after_key, limit=limit)
+    for r in rows:
+        r['icon_class'] = 'folder' if r['is_dir'] else ICON_TYPES.get((r.get('filetype') or '').lower(), 'file')
+    return rows, next_cursor
+
+
+def page_limit() -> int:
+    """从请求参数 limit 读取分页大小，限制在 [1, FILE_PAGE_SIZE_MAX]"""
+    limit = request.args.get('limit', type=int) or AppConfig.FILE_PAGE_SIZE
+    return max(1, min(limit, AppConfig.FILE_PAGE_SIZE_MAX))
 
-    # 删除数据库记录
-    DB.execute("DELETE FROM t_file WHERE id=?", (entry_id,))
+
+def delete_entry(entry_id: int):
+    """删除一个 t_file 条目，目录连同全部子孙一起删除（见 file_service.delete_tree）"""
+    file_service.delete_tree([entry_id])
 
 
 @file_bp.app_template_filter('format_file_size')
@@ -253,39 +121,32 @@ def format_file_size(size_in_bytes, decimals=2):
 @file_bp.route('/', methods=['GET'])
 @login_required
 def file_page():
-    parent_id = request.args.get('parent_id')
-    if parent_id:
-        # 取指定父目录下的条目
-        rows = DB.query("SELECT * FROM t_file WHERE parent_id=?", (parent_id,))
-    else:
-        rows = DB.query("SELECT * FROM t_file WHERE parent_id IS NULL")
-
-    # 保证 rows 为 list of dict
-    rows = [_row_to_dict(r) for r in rows] if rows else []
+    parent_id = request.args.get('parent_id', type=int)
+    after = request.args.get('after')
 
-    for r in rows:
-        if r['is_dir']:
-            r['icon_class'] = 'folder'
-        else:
-            filetype = (r.get('filetype') or '').lower()
-            r['icon_class'] = ICON_TYPES.get(filetype, 'file')
+    # SQL 排序 + keyset 分页
+    rows, next_cursor = list_entries(parent_id, after=after, limit=page_limit())
 
-    rows.sort(
-        key=lambda r: (
-            not r['is_dir'],
-            -datetime.datetime.fromisoformat(r['create_datetime']).timestamp() if r['create_datetime'] else 0
-        )
-    )
+    # 生成面包屑，从根到当前；最后一项就是当前目录
+    breadcrumbs = build_breadcrumbs(parent_id)
+    parent = breadcrumbs[-1] if breadcrumbs else None
 
-    parent = None
-    if parent_id:
-        parent_result = DB.query("SELECT * FROM t_file WHERE id=?", (parent_id,))
-        parent = _row_to_dict(parent_result[0]) if parent_result else None
+    return render_template('file.html', files=rows, parent=parent, breadcrumbs=breadcrumbs,
+                           after=after, next_cursor=next_cursor, usage=usage_service.get_usage())
 
-    # 生成面包屑，从根到当前
-    breadcrumbs = build_breadcrumbs(parent.get('id') if parent else None)
 
-    return render_template('file.html', files=rows, parent=parent, breadcrumbs=breadcrumbs)
+@file_bp.get('/search')
+@login_required
+def search_page():
+    keyword = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'all')
+    result, error = None, None
+    if keyword:
+        try:
+            result = search_service.search(keyword, scope, request.args.get('page'), request.args.get('limit'))
+        except ClientError as e:
+            error = e.message
+    return render_template('search.html', keyword=keyword, scope=scope, result=result, error=error)
 
 
 @file_bp.route('/upload', methods=['POST'])
@@ -308,56 +169,20 @@ def upload_file():
         return redirect(url_for('file.file_page', parent_id=request.form.get('parent_id') or None))
 
     parent_id = request.form.get('parent_id') or None
-    # 保存到 uploads 目录并避免同名覆盖
-    save_path = os.path.join(UPLOAD_FOLDER, filename)
-
-    if parent_id:
-        parent_folder = DB.query("SELECT * FROM t_file WHERE id=?", (parent_id,))
-        parent_folder = parent_folder[0] if parent_folder else None
-        if parent_folder:
-            save_path = os.path.join(parent_folder['filepath'], filename)
-
-    counter = 1
-    original_name = filename
-    name_root, ext = os.path.splitext(original_name)
-    while os.path.exists(save_path):
-        filename = f"{name_root}_{counter}{ext}"
-        save_path = os.path.join(UPLOAD_FOLDER, filename)
-        counter += 1
 
+    # 请求体在解析时已经写入临时文件并算好 MD5，这里放入内容存储并登记，同名文件自动加后缀
     try:
-        f.save(save_path)
+        parent_id, _ = file_service.resolve_parent(parent_id)
+        with spool_upload(f) as spooled:
+            file_service.store_upload(spooled, filename, parent_id)
+    except ClientError as e:
+        flash(e.message)
+        return redirect(url_for('file.file_page', parent_id=parent_id))
     except Exception as e:
         app_logger.exception("保存上传文件失败: %s", e)
         flash("保存文件失败")
         return redirect(url_for('file.file_page', parent_id=parent_id))
 
-    # 检查是否为文件
-    if not os.path.isfile(save_path):
-        # 清理异常目录（极端情况）
-        if os.path.exists(save_path) and os.path.isdir(save_path):
-            try:
-                os.rmdir(save_path)
-            except Exception:
-                pass
-        flash("上传内容不是有效文件")
-        return redirect(url_for('file.file_page', parent_id=parent_id))
-
-    filesize = os.path.getsize(save_path)
-    _, ext = os.path.splitext(filename)
-    filetype = ext.lstrip('.').lower() if ext else ''
-    now = datetime.datetime.now().isoformat()
-
-    preview_type = PREVIEW_TYPES.get(filetype)
-
-    DB.execute(
-        """
-        INSERT INTO t_file (filename, filesize, filetype, preview_type, filepath, is_dir, parent_id, create_datetime, update_datetime)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (filename, filesize, filetype, preview_type, save_path, 0, parent_id, now, now)
-    )
-
     # 上传后若是 fetch 提交通常会返回 200；这里统一重定向到目录页
     return redirect(url_for('file.file_page', parent_id=parent_id))
 
@@ -394,20 +219,107 @@ def create_folder():
     return redirect(url_for('file.file_page', parent_id=parent_id))
 
 
+def _file_share_key(file_id) -> str | None:
+    """查询参数 share 指向包含该文件、未过期的分享时计入该分享的限额，否则忽略（仍受 IP 和全局限额约束）"""
+    share_key = request.args.get('share')
+    return share_key if share_service.share_contains(share_key, file_id) else None
+
+
 @file_bp.route('/download/<int:file_id>', methods=['GET'])
+@rate_limit(share_key=_file_share_key)
 def download_file(file_id):
-    rows = DB.query("SELECT * FROM t_file WHERE id=?", (file_id,))
-    if not rows:
+    row = DB.query_one("SELECT filename, filepath, is_dir, md5 FROM t_file WHERE id=?", (file_id,))
+    if not row:
         return "文件不存在", 404
-    row = _row_to_dict(rows[0])
+    if row['is_dir']:
+        return "无法下载目录", 400
 
     filepath = row.get('filepath')
-    if not filepath:
+    if not filepath or not os.path.isfile(filepath):
         return "无法下载：未找到文件路径", 404
-    directory = os.path.dirname(filepath)
-    filename = os.path.basename(filepath)
-    # send_from_directory 将处理文件名编码等
-    return send_from_directory(directory, filename, as_attachment=True)
+    # 内容存储中的文件名是 md5，下载时使用原始文件名；Range / ETag / 304 由 send_stored_file 处理
+    return send_stored_file(filepath, row.get('filename'), row.get('md5'))
+
+
+def _zip_download(ids: list[int], download_name: str = None):
+    """打包下载：单个节点以它的文件名命名，多选时按数量命名"""
+    entries = file_repo.collect_archive_entries(ids)
+    if not entries:
+        return "文件不存在", 404
+    if not download_name:
+        download_name = f"{entries[0]['path'].split('/')[0]}.zip" if len(ids) == 1 else f'{AppConfig.PROJECT_NAME}-{len(ids)}.zip'
+    return zip_response(entries, download_name)
+
+
+def parse_ids(value: str) -> list[int]:
+    """解析逗号分隔的 id 列表"""
+    try:
+        return [int(p) for p in (value or '').split(',') if p.strip()]
+    except ValueError:
+        raise ClientError('传入的 id 格式错误')
+
+
+@file_bp.get('/zip')
+@login_required
+def zip_download():
+    """
+    打包下载目录或多选的文件 / 目录：参数 ids=1,2,3。
+    不压缩（store），边读边写入响应，不生成临时压缩包。
+    """
+    ids = parse_ids(request.args.get('ids'))
+    if not ids:
+        return "未选择要下载的项", 400
+    return _zip_download(ids)
+
+
+@file_bp.get('/preview/<int:file_id>')
+@rate_limit
+def preview_text(file_id):
+    """
+    文本预览：只返回开头 / 末尾的一段或指定的行，不需要下载整个文件。
+    参数 mode=head|tail|lines, bytes=最大字节数, offset=起始字节偏移（上一页的 next_offset）, start=起始行号, lines=行数
+    """
+    row = DB.query_one("SELECT filename, filepath, is_dir FROM t_file WHERE id=?", (file_id,))
+    if not row:
+        raise ClientError(f'文件 id {file_id} 不存在')
+    if row['is_dir']:
+        raise ClientError(f'无法预览目录')
+
+    preview = preview_service.read_preview(
+        row['filepath'],
+        mode=request.args.get('mode', 'head'),
+        max_bytes=request.args.get('bytes'),
+        start_line=request.args.get('start'),
+        line_count=request.args.get('lines'),
+        offset=request.args.get('offset'),
+    )
+    return JsonResult.successful(data={'filename': row['filename'], **preview})
+
+
+@file_bp.get('/thumbnail/<int:file_id>')
+@rate_limit(share_key=_file_share_key)
+def thumbnail(file_id):
+    """
+    图片 / 视频缩略图。还没有生成时提交后台任务并返回类型图标作为占位，占位图不缓存，
+    下次打开页面时即可拿到真正的缩略图。
+    """
+    row = DB.query_one("SELECT filepath, preview_type, md5 FROM t_file WHERE id=? AND is_dir=0", (file_id,))
+    if not row:
+        return "文件不存在", 404
+
+    path = thumbnail_service.get_thumbnail(row['md5'])
+    if path:
+        response = send_file(path, mimetype='image/jpeg', etag=row['md5'], conditional=True,
+                             max_age=AppConfig.THUMBNAIL_CACHE_MAX_AGE)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+
+    thumbnail_service.schedule(row['md5'], row['filepath'], row['preview_type'])
+    placeholder = 'video.png' if row['preview_type'] == 'video' else 'image.png'
+    response = send_file(os.path.join(current_app.static_folder, 'icons', placeholder), max_age=0)
+    response.cache_control.no_store = True
+    return response
 
 
 @file_bp.route('/delete/<int:file_id>', methods=['POST'])
@@ -418,6 +330,12 @@ def delete_file_route(file_id):
         return "文件不存在", 404
     row = _row_to_dict(rows[0])
 
+    # 目录可能包含大量子孙，交给后台任务删除
+    if row.get('is_dir'):
+        job_id = job_service.enqueue('file.delete_tree', {'ids': [file_id]})
+        flash(f"目录 {row.get('filename')} 正在后台删除（任务 #{job_id}）")
+        return redirect(url_for('file.file_page', parent_id=row.get('parent_id')))
+
     # 先删除物理文件/子文件（由 helper 完成）
     try:
         delete_entry(file_id)
@@ -456,13 +374,9 @@ def delete_multiple():
         except Exception:
             parent_id = None
 
-    # 逐个删除
-    for _id in ids:
-        try:
-            delete_entry(_id)
-        except Exception as e:
-            app_logger.exception("批量删除时 %s 失败: %s", _id, e)
-            # 继续删除剩余项
+    # 所有选中项及其子孙由后台任务在一个事务中删除，请求立即返回
+    job_id = job_service.enqueue('file.delete_tree', {'ids': ids})
+    flash(f"已提交删除 {len(ids)} 项（任务 #{job_id}）")
 
     return redirect(url_for('file.file_page', parent_id=parent_id))
 
@@ -531,25 +445,27 @@ def create_share(file_id):
         INSERT INTO t_share (file_id, share_key, password, expires_at, allow_download, allow_delete, created_datetime, update_datetime)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     """, (file_id, share_key, password, expires_at, allow_download, allow_delete, created_at, created_at))
+    share_service.invalidate_shares()
 
     share_url = url_for('file.view_share', share_key=share_key, _external=False)
     return {"share_url": share_url}
 
 
-@file_bp.route('/s/<share_key>')
-def view_share(share_key):
-    # 查询分享记录
-    shares = DB.query("SELECT * FROM t_share WHERE share_key=?", (share_key,))
-    if not shares:
-        return "分享链接无效或已过期", 404
-
-    share = _row_to_dict(shares[0])
+def _load_share(share_key: str):
+    """
+    解析分享（走 share_service 的缓存）并校验是否过期、密码是否正确，
+    返回 (share, 分享的文件, None) 或 (None, None, 错误响应)
+    """
+    loaded = share_service.get_share(share_key)
+    if not loaded:
+        return None, None, ("分享链接无效或已过期", 404)
+    share, base_file = loaded
 
     # 检查是否过期
     if share['expires_at']:
         expire_time = datetime.datetime.fromisoformat(share['expires_at'])
         if datetime.datetime.now() > expire_time:
-            return "分享链接已过期", 410
+            return None, None, ("分享链接已过期", 410)
 
     # 检查密码（如果有）
     password = share.get('password')
@@ -557,39 +473,35 @@ def view_share(share_key):
     if password:
         if input_pwd and input_pwd != password:
             flash('密码错误', 'error')
-            return render_template('share_password.html', share_key=share_key)
+            return None, None, render_template('share_password.html', share_key=share_key)
         elif not input_pwd:
             flash('请输入密码', 'info')
-            return render_template('share_password.html', share_key=share_key)
+            return None, None, render_template('share_password.html', share_key=share_key)
 
-    file_id = share['file_id']
-    base_file = DB.query_one("SELECT * FROM t_file WHERE id=?", (file_id,))
     if not base_file:
-        return "分享内容已被删除", 404
-    base_file = _row_to_dict(base_file)
+        return None, None, ("分享内容已被删除", 404)
+    return share, base_file, None
+
+
+@file_bp.route('/s/<share_key>')
+@rate_limit
+def view_share(share_key):
+    share, base_file, error = _load_share(share_key)
+    if error:
+        return error
+    input_pwd = request.args.get('pwd')
+    # 缓存中的记录由所有请求共享，下面会补充字段，先复制一份
+    base_file = dict(base_file)
 
     # 获取 path 参数（如 "folder1/folder2"）
     path = request.args.get('path', '').strip('/')
-    current_path_parts = [p for p in path.split('/') if p] if path else []
-
-    # 从 base_file 开始，逐级解析 path
-    current_id = base_file['id']
-    breadcrumbs = []
 
     if base_file['is_dir']:
-        # 如果分享的是目录，则根就是它
-        breadcrumbs.append({'id': base_file['id'], 'filename': base_file['filename']})
-        for part in current_path_parts:
-            # 查找当前目录下名为 `part` 的子目录
-            child = DB.query_one(
-                "SELECT id, filename FROM t_file WHERE parent_id=? AND filename=? AND is_dir=1",
-                (current_id, part)
-            )
-            if not child:
-                return "路径不存在", 404
-            child = _row_to_dict(child)
-            breadcrumbs.append(child)
-            current_id = child['id']
+        # 如果分享的是目录，则根就是它，从它开始逐级解析 path
+        breadcrumbs = share_service.resolve_path(base_file, path)
+        if breadcrumbs is None:
+            return "路径不存在", 404
+        current_id = breadcrumbs[-1]['id']
     else:
         # 分享的是单个文件，不允许 path 导航
         if path:
@@ -609,12 +521,7 @@ def view_share(share_key):
         )
 
     # 现在 current_id 是最终要展示的目录
-    files = DB.query("SELECT * FROM t_file WHERE parent_id=?", (current_id,))
-    files = [_row_to_dict(f) for f in files]
-    for f in files:
-        f['icon_class'] = 'folder' if f['is_dir'] else ICON_TYPES.get((f.get('filetype') or '').lower(), 'file')
-    files.sort(key=lambda r: (not r['is_dir'],
-                              -datetime.datetime.fromisoformat(r['create_datetime']).timestamp() if r['create_datetime'] else 0))
+    files, _ = list_entries(current_id)
 
     return render_template(
         'share_view.html',
@@ -629,6 +536,29 @@ def view_share(share_key):
     )
 
 
+@file_bp.route('/s/<share_key>/zip')
+@rate_limit
+def share_zip(share_key):
+    """把分享的目录（或 path 指定的子目录）打包成 ZIP 流式下载"""
+    share, base_file, error = _load_share(share_key)
+    if error:
+        return error
+    if not share.get('allow_download'):
+        return "该分享不允许下载", 403
+
+    path = request.args.get('path', '').strip('/')
+    if base_file['is_dir']:
+        breadcrumbs = share_service.resolve_path(base_file, path)
+        if breadcrumbs is None:
+            return "路径不存在", 404
+        target = breadcrumbs[-1]
+    elif path:
+        return "无效路径", 404
+    else:
+        target = base_file
+    return _zip_download([target['id']], f"{target['filename']}.zip")
+
+
 @file_bp.route('/share_page')
 @login_required
 def share_page():
@@ -660,6 +590,7 @@ def share_page():
 @login_required
 def delete_share(share_id):
     DB.execute("DELETE FROM t_share WHERE id=?", (share_id,))
+    share_service.invalidate_shares()
     flash("已删除分享记录", "success")
     return redirect(url_for('file.share_page'))
 
@@ -692,6 +623,7 @@ def update_share(share_id):
         SET password=?, expires_at=?, allow_download=?, update_datetime=?
         WHERE id=?
     """, (password, expires_at, allow_download, datetime.datetime.now().isoformat(), share_id))
+    share_service.invalidate_shares()
 
     flash("已更新分享设置", "success")
     return redirect(url_for('file.share_page'))
@@ -699,23 +631,5 @@ def update_share(share_id):
 
 @file_bp.route('/public')
 def public_file():
-    public_shares = DB.query("""
-                             SELECT t_share.id as share_id,
-                                    t_file.id  as file_id,
-                                    *
-                             FROM t_share
-                                      JOIN t_file ON t_share.file_id = t_file.id
-                             WHERE password IS NULL
-                               AND (expires_at IS NULL OR expires_at > ?)
-                               AND t_file.is_dir = 0
-                             """, (datetime.datetime.now().isoformat(),))
-
-    public_shares = [_row_to_dict(r) for r in public_shares] if public_shares else []
-
-    for f in public_shares:
-        f['icon_class'] = 'folder' if f['is_dir'] else ICON_TYPES.get((f.get('filetype') or '').lower(), 'file')
-    public_shares.sort(
-        key=lambda r: (not r['is_dir'], -datetime.datetime.fromisoformat(r['create_datetime']).timestamp() if r['create_datetime'] else 0)
-    )
-
+    public_shares = share_service.list_public_shares()
     return JsonResult.successful('ok', data=public_shares)
\ No newline at end of file
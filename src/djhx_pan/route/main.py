@@ -1,12 +1,10 @@
-import datetime
 import logging
 
 from flask import Blueprint, render_template, session
 
-from .file import ICON_TYPES, _row_to_dict
 from ..config.app_config import AppConfig
-from ..util import login_required
-from ..db import DB
+from ..service import job_service, share_service, usage_service
+from ..util import login_required, JsonResult
 
 main_bp = Blueprint('main', __name__)
 app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
@@ -20,23 +18,8 @@ def index():
     if s_user:
         username = s_user.get('username')
 
-    public_shares = DB.query("""
-        SELECT
-            t_share.id as share_id,
-            t_file.id as file_id,
-            *
-        FROM t_share 
-        JOIN t_file ON t_share.file_id = t_file.id
-        WHERE password IS NULL AND (expires_at IS NULL OR expires_at > ?) AND t_file.is_dir = 0
-    """, (datetime.datetime.now().isoformat(), ))
-
-    public_shares = [_row_to_dict(r) for r in public_shares] if public_shares else []
-
-    for f in public_shares:
-        f['icon_class'] = 'folder' if f['is_dir'] else ICON_TYPES.get((f.get('filetype') or '').lower(), 'file')
-    public_shares.sort(key=lambda r: (not r['is_dir'],
-                              -datetime.datetime.fromisoformat(r['create_datetime']).timestamp() if r[
-                                  'create_datetime'] else 0))
+    # 首页是访问量最大的页面，公开分享列表走进程内缓存
+    public_shares = share_service.list_public_shares()
 
     return render_template('index.html', username=username, files=public_shares)
 
@@ -48,4 +31,11 @@ def dashboard():
     username = 'anonymous'
     if s_user:
         username = s_user.get('username')
-    return render_template('dashboard.html', username=username)
+    return render_template('dashboard.html', username=username, usage=usage_service.get_usage())
+
+
+@main_bp.get('/job/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """后台任务状态：status、progress_done / progress_total、result、error"""
+    return JsonResult.successful(data=job_service.get_job(job_id))
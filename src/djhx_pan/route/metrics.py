@@ -0,0 +1,37 @@
+import hmac
+import logging
+
+from flask import Blueprint, Response, abort, request
+
+from ..config.app_config import AppConfig
+from ..util import metrics
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# 反向代理添加的请求头，出现时对端地址是代理而不是真实客户端
+PROXY_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+
+def _authorized() -> bool:
+    """访问规则见 AppConfig.METRICS_ALLOWED_IPS / METRICS_TOKEN"""
+    allowed = AppConfig.METRICS_ALLOWED_IPS
+    if allowed is not None and request.remote_addr not in allowed:
+        return False
+    token = AppConfig.METRICS_TOKEN
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode())
+    return not any(name in request.headers for name in PROXY_HEADERS)
+
+
+@metrics_bp.get('/metrics')
+def metrics_page():
+    """Prometheus 抓取接口，所有 worker 进程汇总后的指标"""
+    if not AppConfig.METRICS_ENABLED:
+        abort(404)
+    if not _authorized():
+        app_logger.warning(f'拒绝访问 /metrics: {request.remote_addr}')
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
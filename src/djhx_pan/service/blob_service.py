@@ -0,0 +1,121 @@
+import datetime
+import json
+import os
+
+from ..config.app_config import config_dict
+from ..config.log_config import project_logger
+from ..db import DB
+from ..util.stream import HashingTempFile
+
+app_logger = project_logger()
+
+app_config_mode = os.getenv("CONFIG_MODE", "development")
+
+# 内容寻址存储：文件内容按 MD5 存放在 <BLOB_FOLDER>/ab/cd/<md5>，
+# t_blob 记录每个内容被多少个 t_file 条目引用，引用数归零时才删除物理文件
+BLOB_FOLDER = os.path.join(config_dict.get(app_config_mode).UPLOAD_FOLDER, '.blobs')
+os.makedirs(BLOB_FOLDER, exist_ok=True)
+
+
+def blob_path(md5: str) -> str:
+    return os.path.join(BLOB_FOLDER, md5[:2], md5[2:4], md5)
+
+
+def is_blob_path(filepath: str) -> bool:
+    return bool(filepath) and os.path.dirname(os.path.dirname(os.path.dirname(filepath))) == BLOB_FOLDER
+
+
+def store(spooled: HashingTempFile) -> str:
+    """
+    把已经算好 MD5 的临时文件放入内容存储并增加一次引用，返回 blob 路径。
+    相同内容已存在时不再写入，临时文件随 close 删除。
+    """
+    md5 = spooled.hexdigest()
+    path = blob_path(md5)
+    with DB.transaction():
+        row = DB.query_one("SELECT filepath FROM t_blob WHERE md5=?", (md5,))
+        if row:
+            DB.execute("UPDATE t_blob SET ref_count = ref_count + 1 WHERE md5=?", (md5,))
+            return row['filepath']
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        spooled.commit(path)
+        try:
+            DB.execute(
+                "INSERT INTO t_blob (md5, filepath, filesize, ref_count, create_datetime) VALUES (?, ?, ?, 1, ?)",
+                (md5, path, spooled.size, datetime.datetime.now().isoformat())
+            )
+        except Exception:
+            os.remove(path)
+            raise
+    return path
+
+
+def acquire(md5: str, filesize: int = None) -> str | None:
+    """
+    秒传：内容已存在时直接增加一次引用并返回 blob 路径，否则返回 None。
+    传入 filesize 时额外校验大小，避免 MD5 碰撞时误用。
+    """
+    if not md5:
+        return None
+    with DB.transaction():
+        row = DB.query_one("SELECT filepath, filesize FROM t_blob WHERE md5=?", (md5,))
+        if not row or (filesize is not None and int(filesize) != row['filesize']):
+            return None
+        if not os.path.isfile(row['filepath']):
+            app_logger.warning(f'blob {md5} 记录存在但文件缺失: {row["filepath"]}')
+            return None
+        DB.execute("UPDATE t_blob SET ref_count = ref_count + 1 WHERE md5=?", (md5,))
+        return row['filepath']
+
+
+def release(md5: str) -> None:
+    """
+    去掉一次引用，引用数归零时删除 blob。
+    物理删除放在事务内完成，避免与同时写入相同内容的 store 交错。
+    """
+    with DB.transaction():
+        DB.execute("UPDATE t_blob SET ref_count = ref_count - 1 WHERE md5=?", (md5,))
+        row = DB.query_one("SELECT filepath, ref_count FROM t_blob WHERE md5=?", (md5,))
+        if row and row['ref_count'] <= 0:
+            DB.execute("DELETE FROM t_blob WHERE md5=?", (md5,))
+            try:
+                os.remove(row['filepath'])
+            except FileNotFoundError:
+                pass
+
+
+def release_many(md5_counts: dict[str, int]) -> list[str]:
+    """
+    批量减少引用，需在调用方的事务中执行。返回引用数归零的 md5，
+    记录暂不删除，由 purge 在之后的事务中确认仍未被引用再删除文件。
+    """
+    if not md5_counts:
+        return []
+    DB.executemany(
+        "UPDATE t_blob SET ref_count = ref_count - ? WHERE md5=?",
+        [(count, md5) for md5, count in md5_counts.items()]
+    )
+    rows = DB.query(
+        "SELECT md5 FROM t_blob WHERE ref_count <= 0 AND md5 IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(md5_counts)),)
+    )
+    return [row['md5'] for row in rows]
+
+
+def purge(md5_list: list[str], unlink) -> list[str]:
+    """
+    删除引用数仍为 0 的 blob 记录并通过 unlink(paths) 删除文件，返回被删除的路径。
+    在同一个事务中完成，期间写入相同内容的 store 会等待，不会拿到即将被删除的文件；
+    release_many 之后又被 store / acquire 重新引用的内容保留。
+    """
+    if not md5_list:
+        return []
+    with DB.transaction():
+        rows = DB.query(
+            "DELETE FROM t_blob WHERE ref_count <= 0 AND md5 IN (SELECT value FROM json_each(?)) RETURNING filepath",
+            (json.dumps(md5_list),)
+        )
+        paths = [row['filepath'] for row in rows]
+        unlink(paths)
+    return paths
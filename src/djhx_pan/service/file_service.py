@@ -1,13 +1,19 @@
-import hashlib
 import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from werkzeug.datastructures import FileStorage
 
 from ..config.log_config import project_logger
-from ..config.app_config import config_dict
+from ..config.app_config import AppConfig, config_dict
+from ..db import DB
 from ..exception import ClientError
+from ..model import File
 from ..repository import file_repo
+from ..util import safe_secure_filename
 from ..util.constant import PREVIEW_TYPES
+from ..util.stream import HashingTempFile, spool_upload
+from . import blob_service, job_service, search_service, share_service, thumbnail_service, usage_service
 
 app_logger = project_logger()
 
@@ -17,45 +23,42 @@ app_logger.info("upload folder path: {}".format(UPLOAD_FOLDER))
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 
-def save_file(file: FileStorage, parent_id: str, md5: str) -> None:
-    if not file.filename:
-        raise ClientError(f'上传文件的文件名不能为空')
+def resolve_parent(parent_id) -> tuple[int | None, str]:
+    """校验父级目录并返回 (parent_id, 父目录物理路径)，根目录返回 (None, UPLOAD_FOLDER)"""
+    if not parent_id:
+        return None, UPLOAD_FOLDER
 
-    parent_path = UPLOAD_FOLDER
-    if parent_id:
-        parent_id = int(parent_id)
+    parent_id = int(parent_id)
+    parent_file = file_repo.get_file_by_id(parent_id)
+    if not parent_file:
+        raise ClientError(f'上传文件的父级目录不存在')
 
-        parent_file = file_repo.get_file_by_id(parent_id)
-        if not parent_file:
-            raise ClientError(f'上传文件的父级目录不存在')
+    if not parent_file.is_dir:
+        raise ClientError(f'父级节点需要是目录')
+    return parent_id, parent_file.filepath
 
-        if not parent_file.is_dir:
-            raise ClientError(f'父级节点需要是目录')
-        parent_path = parent_file.filepath
 
+def unique_filename(parent_id: int | None, filename: str) -> str:
+    """目录下已有同名文件时追加 _1、_2 ... 后缀"""
+    name_root, ext = os.path.splitext(filename)
+    candidate = filename
+    counter = 1
+    while file_repo.exist_filename(parent_id, candidate):
+        candidate = f"{name_root}_{counter}{ext}"
+        counter += 1
+    return candidate
 
-    filename = file.filename
-    save_path = os.path.join(parent_path, filename)
-
-    file.save(save_path)
-    # 服务端重新计算 MD5
-    temp_md5 = hashlib.md5()
-    with open(save_path, "rb") as fp:
-        for chunk in iter(lambda: fp.read(8192), b""):
-            temp_md5.update(chunk)
-    server_md5 = temp_md5.hexdigest()
-
-    # 校验一致性
-    if md5 != server_md5:
-        raise ClientError(f'{filename} md5 不匹配')
 
+def register_file(filename: str, save_path: str, parent_id: int | None, md5: str | None):
+    """为已经落盘的文件写入 t_file 记录，目录和总用量由触发器随插入更新"""
     filesize = os.path.getsize(save_path)
+    usage_service.check_quota(filesize)
     _, ext = os.path.splitext(filename)
     filetype = ext.lstrip('.').lower() if ext else ''
 
     preview_type = PREVIEW_TYPES.get(filetype)
 
-    file_repo.add_file(
+    new_file = file_repo.add_file(
         filename=filename,
         filetype=filetype,
         filesize=filesize,
@@ -65,23 +68,75 @@ def save_file(file: FileStorage, parent_id: str, md5: str) -> None:
         filepath=save_path,
         is_dir=0
     )
+    # 图片 / 视频在后台生成缩略图，相同内容已有缩略图时不会重复生成
+    thumbnail_service.schedule(md5, save_path, preview_type)
+    # 文件名由触发器写入搜索索引，文本内容交给后台任务
+    if preview_type == 'text':
+        search_service.schedule_content_index()
+    return new_file
+
+
+def store_upload(spooled: HashingTempFile, filename: str, parent_id: int | None):
+    """
+    把接收完成的临时文件放入内容存储并登记 t_file。
+    相同内容已经存在时只增加引用，不再写入第二份。
+    """
+    usage_service.check_quota(spooled.size)
+    blob_path = blob_service.store(spooled)
+    try:
+        return register_file(unique_filename(parent_id, filename), blob_path, parent_id, spooled.hexdigest())
+    except Exception:
+        blob_service.release(spooled.hexdigest())
+        raise
+
+
+def save_file(file: FileStorage, parent_id: str, md5: str) -> None:
+    if not file.filename:
+        raise ClientError(f'上传文件的文件名不能为空')
+
+    parent_id, _ = resolve_parent(parent_id)
+
+    filename = file.filename
+
+    # 服务端 MD5 在接收请求体时已经增量算好，校验通过后才放入存储，
+    # 不匹配时临时文件随 close 删除，不会在目录里留下残缺文件
+    with spool_upload(file) as spooled:
+        server_md5 = spooled.hexdigest()
+
+        # 校验一致性
+        if md5 != server_md5:
+            raise ClientError(f'{filename} md5 不匹配')
+
+        store_upload(spooled, filename, parent_id)
+
+
+def instant_upload(filename: str, md5: str, parent_id, filesize=None):
+    """
+    秒传：服务端已有相同 MD5 的内容时直接登记新条目并返回，否则返回 None，客户端再正常上传
+    """
+    filename = safe_secure_filename(filename)
+    if not filename:
+        raise ClientError(f'上传文件的文件名不能为空')
+    if not md5:
+        raise ClientError(f'md5 不能为空')
+
+    parent_id, _ = resolve_parent(parent_id)
+
+    blob_path = blob_service.acquire(md5, filesize)
+    if not blob_path:
+        return None
+    try:
+        return register_file(unique_filename(parent_id, filename), blob_path, parent_id, md5)
+    except Exception:
+        blob_service.release(md5)
+        raise
 
 
 def save_folder(folder_name, parent_id):
     if not folder_name:
         raise ClientError(f'目录名称不能为空')
 
-    parent_path = UPLOAD_FOLDER
-    if parent_id:
-        parent_id = int(parent_id)
-
-        parent_file = file_repo.get_file_by_id(parent_id)
-        if not parent_file:
-            raise ClientError(f'上传文件的父级目录不存在')
-
-        if not parent_file.is_dir:
-            raise ClientError(f'父级节点需要是目录')
-        parent_path = parent_file.filepath
+    parent_id, parent_path = resolve_parent(parent_id)
 
     folder_path = os.path.join(parent_path, folder_name)
     os.makedirs(folder_path, exist_ok=True)
@@ -95,7 +150,7 @@ def save_folder(folder_name, parent_id):
     )
 
 
-def download_file(file_id) -> str:
+def download_file(file_id) -> File:
     file = file_repo.get_file_by_id(file_id)
     if not file:
         raise ClientError(f'文件 id {file_id} 不存在')
@@ -107,7 +162,7 @@ def download_file(file_id) -> str:
     if not filepath:
         raise ClientError(f'无法下载: 未找到文件 id {file_id} 路径')
 
-    return filepath
+    return file
 
 
 def delete_file(file_id):
@@ -120,8 +175,7 @@ def delete_file(file_id):
 
     target_filepath = target_file.filepath
     if target_filepath and os.path.exists(target_filepath) and os.path.isfile(target_filepath):
-        os.remove(target_filepath)
-        file_repo.delete_file(file_id)
+        delete_tree([file_id])
         return target_file
     else:
         raise ClientError(f'删除文件 id {file_id} 异常')
@@ -140,8 +194,90 @@ def delete_folder(folder_id):
 
     target_folder_path = target_folder.filepath
     if target_folder_path and os.path.exists(target_folder_path) and os.path.isdir(target_folder_path):
-        os.rmdir(target_folder_path)
-        file_repo.delete_file(folder_id)
+        delete_tree([folder_id])
         return target_folder
     else:
-        raise ClientError(f'删除目录 id {folder_id} 异常')
\ No newline at end of file
+        raise ClientError(f'删除目录 id {folder_id} 异常')
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        app_logger.warning(f'删除文件 {path} 失败: {e}')
+
+
+def delete_tree(root_ids: list[int], progress=None) -> dict:
+    """
+    删除若干文件 / 目录及其全部子孙：
+    1. 在一个事务中用递归 CTE 取出整棵子树，删除 t_file 和关联的 t_share，批量减少 blob 引用
+    2. 提交后用有界线程池删除物理文件（blob 每批一个短事务确认仍未被引用），最后由深到浅删除目录
+    progress(done, total) 在每批物理删除完成后回调，total 为需要删除的物理文件和目录数。
+    返回删除的文件和目录条目数。
+    """
+    with DB.transaction():
+        rows = file_repo.collect_subtree(root_ids)
+        if not rows:
+            return {'files': 0, 'dirs': 0}
+
+        blob_refs = Counter()
+        plain_files = []
+        dirs = []
+        for row in rows:
+            if row['is_dir']:
+                if row['filepath']:
+                    dirs.append(row['filepath'])
+            elif row['md5'] and blob_service.is_blob_path(row['filepath']):
+                blob_refs[row['md5']] += 1
+            elif row['filepath']:
+                # 旧版按目录存放、不在内容存储中的文件
+                plain_files.append(row['filepath'])
+
+        file_repo.delete_rows([row['id'] for row in rows])
+        orphan_blobs = blob_service.release_many(blob_refs)
+    file_repo.invalidate_ancestors()
+    share_service.invalidate_files()
+
+    dir_count = sum(1 for row in rows if row['is_dir'])
+    total = len(orphan_blobs) + len(plain_files) + len(dirs)
+    done = 0
+    batch_size = AppConfig.DELETE_BATCH_SIZE
+
+    def report(count: int):
+        nonlocal done
+        done += count
+        if progress:
+            progress(done, total)
+        if total > batch_size:
+            app_logger.info(f'删除进度: {done}/{total}')
+
+    with ThreadPoolExecutor(max_workers=AppConfig.DELETE_UNLINK_WORKERS, thread_name_prefix='unlink') as executor:
+        def unlink(paths):
+            list(executor.map(_remove_quietly, paths))
+
+        for i in range(0, len(orphan_blobs), batch_size):
+            batch = orphan_blobs[i:i + batch_size]
+            blob_service.purge(batch, unlink)
+            report(len(batch))
+        for i in range(0, len(plain_files), batch_size):
+            batch = plain_files[i:i + batch_size]
+            unlink(batch)
+            report(len(batch))
+
+    # 子目录路径更长，按长度倒序即可保证先删子目录；目录中还有其他文件时保留
+    for path in sorted(dirs, key=len, reverse=True):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+    if dirs:
+        report(len(dirs))
+
+    app_logger.info(f'删除完成: {len(rows) - dir_count} 个文件, {dir_count} 个目录')
+    return {'files': len(rows) - dir_count, 'dirs': dir_count}
+
+
+@job_service.handler('file.delete_tree')
+def _delete_tree_job(payload: dict, progress) -> dict:
+    return delete_tree(payload['ids'], progress=progress)
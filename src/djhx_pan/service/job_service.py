@@ -0,0 +1,271 @@
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+
+from ..config.app_config import AppConfig
+from ..config.log_config import project_logger
+from ..db import DB
+from ..exception import ClientError
+
+app_logger = project_logger()
+
+# 持久化的后台任务队列：任务保存在 t_job 中，由 create_app 启动的 worker 线程领取执行。
+# 请求线程只负责 enqueue 并返回任务 id，客户端通过任务状态接口查询进度和结果。
+# 任务状态：pending -> running -> done / failed，失败且未超过 max_attempts 时回到 pending 延迟重试。
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# kind -> handler(payload: dict, progress) -> 可 JSON 序列化的结果
+HANDLERS = {}
+# kind -> 间隔（timedelta），由 worker 的维护步骤按间隔自动入队
+PERIODIC = {}
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat()
+
+
+def handler(kind: str):
+    """注册任务处理函数，handler(payload, progress) 中调用 progress(done, total) 汇报进度"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def periodic(kind: str, interval):
+    """注册定期执行的任务，handler 以空 payload 调用"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        PERIODIC[kind] = interval
+        return func
+    return decorator
+
+
+def enqueue(kind: str, payload: dict = None, max_attempts: int = None) -> int:
+    if kind not in HANDLERS:
+        raise ValueError(f'未注册的任务类型: {kind}')
+    now = _now()
+    job_id = DB.execute(
+        """
+        INSERT INTO t_job (kind, payload, status, max_attempts, run_after, create_datetime, update_datetime)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (kind, json.dumps(payload or {}, ensure_ascii=False), JOB_PENDING,
+         max_attempts or AppConfig.JOB_MAX_ATTEMPTS, now, now, now)
+    )
+    _wakeup.set()
+    app_logger.info(f'任务入队: #{job_id} {kind}')
+    return job_id
+
+
+def enqueue_unique(kind: str, payload: dict = None) -> int:
+    """已有同类任务在排队（pending）时直接返回它的 id，不重复入队"""
+    with DB.transaction():
+        row = DB.query_one("SELECT id FROM t_job WHERE kind=? AND status=? LIMIT 1", (kind, JOB_PENDING))
+        if row:
+            return row['id']
+        return enqueue(kind, payload)
+
+
+def get_job(job_id: int) -> dict:
+    row = DB.query_one(
+        """
+        SELECT id, kind, status, attempts, max_attempts, progress_done, progress_total, result, error,
+               create_datetime, update_datetime
+        FROM t_job WHERE id=?
+        """,
+        (job_id,)
+    )
+    if not row:
+        raise ClientError(f'任务 {job_id} 不存在')
+    row = dict(row)
+    row['result'] = json.loads(row['result']) if row['result'] else None
+    return row
+
+
+def _claim(worker_id: str) -> dict | None:
+    """领取一个到期的 pending 任务，单条 UPDATE ... RETURNING 保证同一任务只会被一个 worker 领取"""
+    now = _now()
+    with DB.transaction():
+        rows = DB.query(
+            """
+            UPDATE t_job
+            SET status=?, attempts=attempts + 1, locked_by=?, locked_at=?, update_datetime=?
+            WHERE id = (SELECT id FROM t_job WHERE status=? AND run_after <= ? ORDER BY id LIMIT 1)
+            RETURNING id, kind, payload, attempts, max_attempts, locked_by
+            """,
+            (JOB_RUNNING, worker_id, now, now, JOB_PENDING, now)
+        )
+    return rows[0] if rows else None
+
+
+# 以下更新都带上 locked_by 条件：任务被判定超时并由其他 worker 重新领取后，原 worker 的进度和结果不再写入
+
+def _update_progress(job: dict, done: int, total: int) -> None:
+    # 同时刷新 locked_at
+    now = _now()
+    DB.execute(
+        "UPDATE t_job SET progress_done=?, progress_total=?, locked_at=?, update_datetime=? WHERE id=? AND locked_by=?",
+        (done, total, now, now, job['id'], job['locked_by'])
+    )
+
+
+def _touch(job: dict) -> bool:
+    """心跳：刷新 locked_at，返回任务是否仍由本 worker 持有"""
+    return bool(DB.query(
+        "UPDATE t_job SET locked_at=? WHERE id=? AND locked_by=? AND status=? RETURNING id",
+        (_now(), job['id'], job['locked_by'], JOB_RUNNING)
+    ))
+
+
+def _heartbeat(job: dict, stop: threading.Event) -> None:
+    """任务执行期间每 JOB_HEARTBEAT_INTERVAL 秒刷新一次心跳，不依赖 handler 调用 progress"""
+    while not stop.wait(AppConfig.JOB_HEARTBEAT_INTERVAL):
+        try:
+            if not _touch(job):
+                app_logger.warning(f'任务 #{job["id"]} 已不再由 {job["locked_by"]} 持有，停止心跳')
+                return
+        except Exception as e:
+            app_logger.warning(f'任务 #{job["id"]} 心跳更新失败: {e}')
+
+
+def _release(job: dict, sql: str, params: tuple) -> None:
+    """执行释放任务的 UPDATE（sql 以 WHERE id=? AND locked_by=? 结尾），任务已被接管时只记录日志"""
+    if not DB.query(sql + " RETURNING id", params + (job['id'], job['locked_by'])):
+        app_logger.warning(f'任务 #{job["id"]} 已被其他 worker 接管，丢弃本次执行的结果')
+
+
+def _finish(job: dict, result) -> None:
+    _release(
+        job,
+        "UPDATE t_job SET status=?, result=?, error=NULL, locked_by=NULL, update_datetime=? WHERE id=? AND locked_by=?",
+        (JOB_DONE, json.dumps(result, ensure_ascii=False) if result is not None else None, _now())
+    )
+
+
+def _fail(job: dict, error: str, retry: bool = True) -> None:
+    if retry and job['attempts'] < job['max_attempts']:
+        # 指数退避后重试
+        delay = AppConfig.JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+        run_after = (datetime.datetime.now() + datetime.timedelta(seconds=delay)).isoformat()
+        _release(
+            job,
+            "UPDATE t_job SET status=?, error=?, run_after=?, locked_by=NULL, update_datetime=? WHERE id=? AND locked_by=?",
+            (JOB_PENDING, error, run_after, _now())
+        )
+    else:
+        _release(
+            job,
+            "UPDATE t_job SET status=?, error=?, locked_by=NULL, update_datetime=? WHERE id=? AND locked_by=?",
+            (JOB_FAILED, error, _now())
+        )
+
+
+def run_job(job: dict) -> None:
+    func = HANDLERS.get(job['kind'])
+    if func is None:
+        _fail(job, f'未注册的任务类型: {job["kind"]}', retry=False)
+        return
+
+    def progress(done: int, total: int):
+        _update_progress(job, done, total)
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job, stop), name=f'job-heartbeat-{job["id"]}', daemon=True).start()
+    started = time.perf_counter()
+    try:
+        result = func(json.loads(job['payload']), progress)
+    except Exception as e:
+        app_logger.exception(f'任务 #{job["id"]} {job["kind"]} 第 {job["attempts"]} 次执行失败: {e}')
+        _fail(job, str(e) or e.__class__.__name__)
+        return
+    finally:
+        stop.set()
+    _finish(job, result)
+    app_logger.info(f'任务完成: #{job["id"]} {job["kind"]} ({time.perf_counter() - started:.2f}s)')
+
+
+def recover_stale_jobs() -> int:
+    """把心跳超时的 running 任务放回队列（进程崩溃或被 kill 时遗留）"""
+    expire_before = (datetime.datetime.now() - AppConfig.JOB_STALE_AFTER).isoformat()
+    with DB.transaction():
+        rows = DB.query(
+            "UPDATE t_job SET status=?, locked_by=NULL, update_datetime=? WHERE status=? AND locked_at < ? RETURNING id",
+            (JOB_PENDING, _now(), JOB_RUNNING, expire_before)
+        )
+    if rows:
+        app_logger.warning(f'恢复超时任务 {len(rows)} 个: {[row["id"] for row in rows]}')
+    return len(rows)
+
+
+def purge_finished_jobs() -> None:
+    expire_before = (datetime.datetime.now() - AppConfig.JOB_RETENTION).isoformat()
+    DB.execute(
+        "DELETE FROM t_job WHERE status IN (?, ?) AND update_datetime < ?",
+        (JOB_DONE, JOB_FAILED, expire_before)
+    )
+
+
+def schedule_periodic_jobs() -> None:
+    """距上次入队超过间隔、且没有待执行的同类任务时入队，事务保证多个进程不会重复入队"""
+    for kind, interval in PERIODIC.items():
+        due_before = (datetime.datetime.now() - interval).isoformat()
+        with DB.transaction():
+            row = DB.query_one(
+                """
+                SELECT 1 FROM t_job
+                WHERE kind=? AND (status IN (?, ?) OR create_datetime > ?)
+                LIMIT 1
+                """,
+                (kind, JOB_PENDING, JOB_RUNNING, due_before)
+            )
+            if row is None:
+                enqueue(kind)
+
+
+def _worker_loop(app, worker_id: str) -> None:
+    last_maintenance = 0
+    while True:
+        try:
+            if time.monotonic() - last_maintenance > AppConfig.JOB_STALE_AFTER.total_seconds() / 2:
+                last_maintenance = time.monotonic()
+                recover_stale_jobs()
+                purge_finished_jobs()
+                schedule_periodic_jobs()
+
+            job = _claim(worker_id)
+            if job is None:
+                # 本进程 enqueue 时立即唤醒，其他进程提交的任务按轮询间隔领取
+                _wakeup.wait(AppConfig.JOB_POLL_INTERVAL)
+                _wakeup.clear()
+                continue
+            with app.app_context():
+                run_job(job)
+        except Exception as e:
+            app_logger.exception(f'任务 worker {worker_id} 异常: {e}')
+            time.sleep(AppConfig.JOB_POLL_INTERVAL)
+
+
+def start_workers(app, count: int = None) -> None:
+    """启动任务 worker 线程，每个进程只启动一次；count 为 0 时不启动（任务只入队）"""
+    count = AppConfig.JOB_WORKERS if count is None else count
+    with _workers_lock:
+        if _workers or count <= 0:
+            return
+        for index in range(count):
+            worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+            thread = threading.Thread(target=_worker_loop, args=(app, worker_id), name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+    app_logger.info(f'任务 worker 已启动: {count} 个')
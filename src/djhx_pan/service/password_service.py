@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from ..config.app_config import AppConfig
+from ..config.log_config import project_logger
+from ..exception import ClientError, ServerError
+from ..repository import user_repo
+from ..util import PasswordUtil
+from ..util.cache import LRUCache
+
+app_logger = project_logger()
+
+# PBKDF2 在独立的进程池中计算，一次登录占满一个 CPU 核几十毫秒，不能让请求线程和目录列表争抢。
+# 子进程用 spawn 启动，只执行 hashlib.pbkdf2_hmac，不会复制 web 进程的线程和数据库连接。
+# 同时在计算和排队的数量不超过 PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE，再多的登录请求直接拒绝，
+# 撞库时不会堆积成几分钟的队列。
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(AppConfig.PASSWORD_HASH_WORKERS + AppConfig.PASSWORD_HASH_QUEUE)
+
+# 验证通过的登录：(客户端, 用户名) -> (密码的 HMAC, 当时的密码哈希, 过期时间)。
+# 只保存用进程内随机密钥计算的 HMAC，不保存密码；数据库中的哈希变化（修改密码）后不再命中。
+login_cache = LRUCache(maxsize=AppConfig.LOGIN_CACHE_SIZE)
+_login_cache_key = os.urandom(32)
+
+
+def _get_executor() -> ProcessPoolExecutor | None:
+    global _executor
+    if AppConfig.PASSWORD_HASH_WORKERS <= 0:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=AppConfig.PASSWORD_HASH_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _pbkdf2(password: str, salt: str, iterations: int, algorithm: str) -> str:
+    """计算 PasswordUtil.hash_password 相同的哈希；进程池忙时抛出 ClientError"""
+    if not _slots.acquire(blocking=False):
+        app_logger.warning('密码校验排队已满，拒绝本次请求')
+        raise ClientError('密码校验请求过多，请稍后再试')
+    try:
+        executor = _get_executor()
+        if executor is None:
+            return PasswordUtil.hash_password(password, salt, iterations, algorithm)
+        args = (algorithm, password.encode('utf-8'), base64.b64decode(salt), iterations, PasswordUtil.KEY_LENGTH)
+        try:
+            dk = executor.submit(hashlib.pbkdf2_hmac, *args).result(timeout=AppConfig.PASSWORD_HASH_TIMEOUT)
+        except BrokenProcessPool:
+            # 子进程被杀掉（OOM 等）后整个进程池不可用，换一个新的重试一次
+            app_logger.warning('密码哈希进程池异常，重新创建')
+            _reset_executor(executor)
+            dk = _get_executor().submit(hashlib.pbkdf2_hmac, *args).result(timeout=AppConfig.PASSWORD_HASH_TIMEOUT)
+        except TimeoutError:
+            raise ServerError('密码校验超时')
+        return base64.b64encode(dk).decode('utf-8')
+    finally:
+        _slots.release()
+
+
+def hash_new_password(password: str) -> dict:
+    """按当前配置的参数生成新密码的哈希，返回 t_user 对应的列"""
+    salt = PasswordUtil.generate_salt()
+    iterations, algorithm = AppConfig.PASSWORD_HASH_ITERATIONS, PasswordUtil.ALGORITHM
+    return {
+        'password': _pbkdf2(password, salt, iterations, algorithm),
+        'salt': salt,
+        'pwd_algorithm': algorithm,
+        'pwd_iterations': iterations,
+    }
+
+
+def _password_digest(password: str) -> bytes:
+    return hmac.new(_login_cache_key, password.encode('utf-8'), hashlib.sha256).digest()
+
+
+def verify_user(user: dict, password: str, client: str = None) -> bool:
+    """
+    校验 user（user_repo.get_credentials 的结果）的密码。
+    参数不是当前配置的用户验证通过后重新计算哈希并保存；client 不为空时使用并更新验证通过的登录缓存。
+    """
+    if not password or not user.get('password') or not user.get('salt'):
+        return False
+
+    cache_key = (client, user['username'])
+    if client:
+        cached = login_cache.get(cache_key)
+        if (cached is not None and cached[2] > time.monotonic() and cached[1] == user['password']
+                and hmac.compare_digest(cached[0], _password_digest(password))):
+            return True
+
+    new_hash = _pbkdf2(password, user['salt'], user['pwd_iterations'], user['pwd_algorithm'])
+    if not hmac.compare_digest(new_hash, user['password']):
+        return False
+
+    stored_hash = _rehash(user, password)
+    if client:
+        login_cache.set(cache_key, (_password_digest(password), stored_hash,
+                                    time.monotonic() + AppConfig.LOGIN_CACHE_TTL.total_seconds()))
+    return True
+
+
+def _rehash(user: dict, password: str) -> str:
+    """哈希参数落后于当前配置时用新参数重新计算并保存，返回数据库中现在的哈希"""
+    if (user['pwd_iterations'] == AppConfig.PASSWORD_HASH_ITERATIONS
+            and user['pwd_algorithm'] == PasswordUtil.ALGORITHM):
+        return user['password']
+    try:
+        new = hash_new_password(password)
+    except (ClientError, ServerError) as e:
+        # 升级不影响本次登录，下次登录再试
+        app_logger.info(f'用户 {user["username"]} 的密码哈希暂未升级: {e.message}')
+        return user['password']
+    if not user_repo.update_password_hash(user['id'], user['password'], new['password'], new['salt'],
+                                          new['pwd_algorithm'], new['pwd_iterations']):
+        return user['password']
+    app_logger.info(f'用户 {user["username"]} 的密码哈希已升级: '
+                    f'{user["pwd_algorithm"]}/{user["pwd_iterations"]} -> {new["pwd_algorithm"]}/{new["pwd_iterations"]}')
+    return new['password']
@@ -0,0 +1,200 @@
+import codecs
+import mmap
+import os
+
+from ..config.app_config import AppConfig
+from ..exception import ClientError
+
+# 按顺序尝试的编码：BOM 优先，其次严格 UTF-8，再退回 GB18030（兼容 GBK / GB2312 的中文文本）
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+FALLBACK_ENCODINGS = ('utf-8', 'gb18030')
+
+# 用于判断编码和是否为二进制文件的采样大小
+SNIFF_SIZE = 64 * 1024
+# 按行号定位时每次统计换行数的块大小
+SKIP_CHUNK_SIZE = 1024 * 1024
+
+PREVIEW_MODES = ('head', 'tail', 'lines')
+
+
+def _is_valid(sample: bytes, encoding: str) -> bool:
+    """严格解码采样，final=False 时末尾被截断的多字节字符不算错误"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(sample: bytes) -> tuple[str, int]:
+    """
+    根据文件开头的采样判断编码，返回 (编码, BOM 长度)。
+    含 NUL 字节且没有 UTF-16 BOM 时视为二进制文件。
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+
+    if b'\x00' in sample:
+        raise ClientError(f'二进制文件无法预览')
+
+    for encoding in FALLBACK_ENCODINGS:
+        if _is_valid(sample, encoding):
+            return encoding, 0
+    return 'latin-1', 0
+
+
+def _clamp(value, default: int, maximum: int, name: str) -> int:
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ClientError(f'{name} 格式错误')
+    if value <= 0:
+        raise ClientError(f'{name} 必须大于 0')
+    return min(value, maximum)
+
+
+def _decode(data: bytes, encoding: str) -> str:
+    return data.decode(encoding, errors='replace')
+
+
+def _head(mm, start: int, size: int, limit: int) -> tuple[int, int]:
+    """从 start 开始最多 limit 字节，截断时在最后一个换行处结束"""
+    end = min(size, start + limit)
+    if end < size:
+        newline = mm.rfind(b'\n', start, end)
+        if newline > start:
+            end = newline + 1
+    return start, end
+
+
+def _tail(mm, start: int, size: int, limit: int) -> tuple[int, int]:
+    """文件末尾最多 limit 字节，截断时从第一个完整行开始"""
+    begin = max(start, size - limit)
+    if begin > start:
+        newline = mm.find(b'\n', begin, size)
+        if 0 <= newline < size - 1:
+            begin = newline + 1
+    return begin, size
+
+
+def _skip_lines(mm, start: int, size: int, count: int) -> int:
+    """
+    从 start 跳过 count 行，返回下一行开头的偏移；行数不够时返回 size。
+    按块统计换行数，最多向后扫描 PREVIEW_TEXT_SKIP_BYTES 字节，更靠后的内容需要用 offset 定位。
+    """
+    pos = start
+    scan_end = min(size, start + AppConfig.PREVIEW_TEXT_SKIP_BYTES)
+    while count > 0 and pos < size:
+        if pos >= scan_end:
+            raise ClientError('起始行号太大，请从上一页返回的 next_offset 继续')
+        chunk_end = min(scan_end, pos + SKIP_CHUNK_SIZE)
+        chunk = mm[pos:chunk_end]
+        newlines = chunk.count(b'\n')
+        if newlines < count:
+            count -= newlines
+            pos = chunk_end
+            continue
+        index = -1
+        for _ in range(count):
+            index = chunk.find(b'\n', index + 1)
+        return pos + index + 1
+    return min(pos, size)
+
+
+def _line_window(mm, pos: int, size: int, line_count: int, limit: int) -> int:
+    """从 pos 开始的 line_count 行，字节数不超过 limit，返回结束偏移"""
+    end = pos
+    for _ in range(line_count):
+        if end >= size:
+            break
+        newline = mm.find(b'\n', end, min(size, pos + limit))
+        if newline < 0:
+            # 剩余部分没有换行：文件末尾的最后一行，或单行超过 limit
+            end = min(size, pos + limit)
+            break
+        end = newline + 1
+    return end
+
+
+def _offset(value) -> int | None:
+    if value is None or value == '':
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ClientError(f'offset 格式错误')
+    if value < 0:
+        raise ClientError(f'offset 不能为负数')
+    return value
+
+
+def read_preview(filepath: str, mode: str = 'head', max_bytes=None, start_line=None, line_count=None,
+                 offset=None) -> dict:
+    """
+    读取文本文件的一部分用于预览，文件通过 mmap 访问，只有实际返回的片段会被读入内存。
+    - head：开头最多 max_bytes 字节
+    - tail：末尾最多 max_bytes 字节
+    - lines：从字节偏移 offset（或第 start_line 行）开始的 line_count 行（同样受 max_bytes 限制）
+    返回的 start / end 是片段在文件中的字节偏移；head / lines 模式用 next_offset 继续向后翻页，直接定位，
+    不需要从头数行。同时传入 offset 和 start_line 时 start_line 只作为 offset 处的行号，用于计算 next_line。
+    """
+    if mode not in PREVIEW_MODES:
+        raise ClientError(f'预览模式只能是 {", ".join(PREVIEW_MODES)} 之一')
+    limit = _clamp(max_bytes, AppConfig.PREVIEW_TEXT_BYTES, AppConfig.PREVIEW_TEXT_MAX_BYTES, '预览字节数')
+    first_line = _clamp(start_line, 1, 2 ** 31, '起始行号')
+    line_count = _clamp(line_count, AppConfig.PREVIEW_TEXT_LINES, AppConfig.PREVIEW_TEXT_MAX_LINES, '预览行数')
+    offset = _offset(offset)
+    if offset is not None and not start_line:
+        first_line = None
+
+    if not filepath or not os.path.isfile(filepath):
+        raise ClientError(f'无法预览：未找到文件路径')
+
+    size = os.path.getsize(filepath)
+    result = {'mode': mode, 'filesize': size, 'encoding': 'utf-8', 'start': 0, 'end': 0, 'text': '', 'eof': True}
+    if size == 0:
+        return result
+
+    with open(filepath, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        encoding, bom_size = detect_encoding(mm[:SNIFF_SIZE])
+        if encoding.startswith('utf-16'):
+            # UTF-16 的换行不是单字节 \n，只支持按字节截取，偏移对齐到 2 字节
+            if mode == 'lines':
+                raise ClientError(f'UTF-16 文件不支持按行预览')
+            begin = bom_size if mode == 'head' else max(bom_size, size - limit)
+            begin += (begin - bom_size) % 2
+            end = min(size, begin + limit)
+            end -= (end - begin) % 2
+        elif mode == 'tail':
+            begin, end = _tail(mm, bom_size, size, limit)
+        else:
+            if mode == 'head':
+                first_line = 1
+                begin, end = _head(mm, bom_size, size, limit)
+            else:
+                if offset is not None:
+                    begin = min(max(offset, bom_size), size)
+                else:
+                    begin = _skip_lines(mm, bom_size, size, first_line - 1)
+                end = _line_window(mm, begin, size, line_count, limit)
+            result['start_line'] = first_line
+            result['next_offset'] = end if end < size else None
+            # 单行超过 max_bytes 时至少前进一行，避免翻页停在原地
+            result['next_line'] = (first_line + max(mm[begin:end].count(b'\n'), 1)
+                                   if end < size and first_line else None)
+
+        result.update({
+            'encoding': encoding,
+            'start': begin,
+            'end': end,
+            'text': _decode(mm[begin:end], encoding),
+            'eof': end >= size,
+        })
+    return result
@@ -0,0 +1,106 @@
+from markupsafe import Markup, escape
+
+from ..config.app_config import AppConfig
+from ..config.log_config import project_logger
+from ..exception import ClientError
+from ..repository import search_repo
+from ..repository.search_repo import MARK_START, MARK_END
+from . import job_service, preview_service
+
+app_logger = project_logger()
+
+# 搜索范围：name 只搜文件名，all 同时搜文本文件的内容
+SEARCH_SCOPES = ('all', 'name')
+SEARCH_MAX_TERMS = 8
+# trigram 索引至少需要 3 个字符，更短的词只在文件名上 LIKE 匹配
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _clamp_page(page, limit) -> tuple[int, int]:
+    try:
+        page = max(1, int(page or 1))
+        limit = int(limit or AppConfig.SEARCH_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise ClientError(f'分页参数格式错误')
+    return page, max(1, min(limit, AppConfig.SEARCH_PAGE_SIZE_MAX))
+
+
+def _mark_html(text: str | None) -> Markup | None:
+    if not text:
+        return None
+    return Markup(str(escape(text)).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def _strip_marks(text: str | None) -> str | None:
+    return text.replace(MARK_START, '').replace(MARK_END, '') if text else text
+
+
+def search(keyword: str, scope: str = 'all', page=1, limit=None) -> dict:
+    """
+    按空白分词，所有词都命中的条目按相关度排序分页返回（页码从 1 开始）。
+    每项附带 filename_html（命中部分用 <mark> 标出，已转义）和 snippet（内容中命中的片段，纯文本）。
+    """
+    keyword = (keyword or '').strip()
+    if not keyword:
+        raise ClientError(f'搜索关键词不能为空')
+    if scope not in SEARCH_SCOPES:
+        raise ClientError(f'搜索范围只能是 {", ".join(SEARCH_SCOPES)} 之一')
+    page, limit = _clamp_page(page, limit)
+
+    terms = list(dict.fromkeys(keyword.split()))[:SEARCH_MAX_TERMS]
+    match_terms = [t for t in terms if len(t) >= TRIGRAM_MIN_LENGTH]
+    like_terms = [t for t in terms if len(t) < TRIGRAM_MIN_LENGTH]
+
+    # 多取一行用来判断是否还有下一页
+    rows = search_repo.search(match_terms, like_terms, scope == 'all', limit + 1, (page - 1) * limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    for row in rows:
+        row['filename_html'] = _mark_html(row.get('filename_html')) or escape(row['filename'])
+        snippet = row.get('snippet')
+        # 内容没有命中时 snippet 只是开头的一段，不返回
+        row['snippet_html'] = _mark_html(snippet) if snippet and MARK_START in snippet else None
+        row['snippet'] = _strip_marks(snippet) if row['snippet_html'] else None
+    return {'keyword': keyword, 'scope': scope, 'page': page, 'limit': limit, 'items': rows, 'has_more': has_more}
+
+
+def schedule_content_index() -> None:
+    """有新的文本文件时提交内容索引任务，已有任务在排队时不重复提交"""
+    if search_repo.is_available():
+        job_service.enqueue_unique('search.index_content')
+
+
+def _read_text(filepath: str) -> str:
+    """读取文件开头 SEARCH_CONTENT_MAX_BYTES 字节并解码，二进制文件（如 .pyc、.db）返回空串"""
+    try:
+        with open(filepath, 'rb') as fp:
+            data = fp.read(AppConfig.SEARCH_CONTENT_MAX_BYTES)
+    except OSError as e:
+        app_logger.warning(f'建立内容索引时无法读取 {filepath}: {e}')
+        return ''
+    try:
+        encoding, bom_size = preview_service.detect_encoding(data[:preview_service.SNIFF_SIZE])
+    except ClientError:
+        return ''
+    # 截断处可能落在多字节字符中间
+    return data[bom_size:].decode(encoding, errors='ignore')
+
+
+@job_service.periodic('search.index_content', AppConfig.SEARCH_INDEX_INTERVAL)
+def _index_content_job(payload: dict, progress) -> dict:
+    """为还没有内容索引的文本文件分批建立索引，一批一个事务"""
+    if not search_repo.is_available():
+        return {'indexed': 0}
+    indexed = 0
+    after_id = 0
+    while True:
+        rows = search_repo.pending_content(after_id, AppConfig.SEARCH_INDEX_BATCH)
+        if not rows:
+            break
+        search_repo.save_content([(row['id'], _read_text(row['filepath'])) for row in rows])
+        after_id = rows[-1]['id']
+        indexed += len(rows)
+        progress(indexed, 0)
+    if indexed:
+        app_logger.info(f'内容索引完成: {indexed} 个文件')
+    return {'indexed': indexed}
@@ -0,0 +1,170 @@
+import datetime
+import threading
+import time
+
+from ..config.app_config import AppConfig
+from ..config.log_config import project_logger
+from ..db import DB
+from ..repository import file_repo
+from ..util.cache import LRUCache
+from ..util.constant import ICON_TYPES
+
+app_logger = project_logger()
+
+# 首页公开分享列表：查询结果（已排序、已补充 icon_class）缓存在进程内，
+# 有效期取 PUBLIC_SHARE_CACHE_TTL 和最早一个分享过期时间中较早的那个，过期的分享不会多展示。
+# 本进程内创建 / 修改 / 删除分享或删除文件时主动失效；其他 worker 进程的缓存最多滞后一个 TTL。
+_public_feed = None  # (rows, valid_until)
+_public_feed_generation = 0
+_public_feed_lock = threading.Lock()
+
+# 分享链接解析：share_key -> (share, 分享的文件)，(分享根目录 id, path) -> 面包屑。
+# 热门分享内逐级进入子目录时只查一次缓存，不再每级查询一次 t_file。
+# 不缓存"不存在"的结果，新建目录后立即可见；删除文件 / 目录和分享变更时清空。
+# 每项带 SHARE_CACHE_TTL 的过期时间，其他 worker 进程的修改最多滞后这么久。
+share_cache = LRUCache(maxsize=AppConfig.SHARE_CACHE_SIZE)
+share_path_cache = LRUCache(maxsize=AppConfig.SHARE_PATH_CACHE_SIZE)
+_share_generation = 0
+
+
+def _load_public_shares(now: datetime.datetime) -> tuple[list[dict], datetime.datetime | None]:
+    rows = DB.query("""
+        SELECT
+            t_share.id as share_id,
+            t_file.id as file_id,
+            *
+        FROM t_share
+        JOIN t_file ON t_share.file_id = t_file.id
+        WHERE password IS NULL AND (expires_at IS NULL OR expires_at > ?) AND t_file.is_dir = 0
+        ORDER BY t_file.is_dir DESC, t_file.create_datetime DESC
+    """, (now.isoformat(),))
+
+    next_expiry = None
+    for row in rows:
+        row['icon_class'] = 'folder' if row['is_dir'] else ICON_TYPES.get((row.get('filetype') or '').lower(), 'file')
+        if row['expires_at']:
+            expires_at = datetime.datetime.fromisoformat(row['expires_at'])
+            if next_expiry is None or expires_at < next_expiry:
+                next_expiry = expires_at
+    return rows, next_expiry
+
+
+def list_public_shares() -> list[dict]:
+    """
+    无密码、未过期的文件分享，按文件创建时间倒序。
+    返回的列表由所有请求共享，不要原地修改。
+    """
+    global _public_feed
+    now = datetime.datetime.now()
+    feed = _public_feed
+    if feed is not None and now < feed[1]:
+        return feed[0]
+
+    # 同一时刻只有一个线程重建，其余线程等待后直接使用新结果
+    with _public_feed_lock:
+        feed = _public_feed
+        if feed is not None and now < feed[1]:
+            return feed[0]
+        generation = _public_feed_generation
+        rows, next_expiry = _load_public_shares(now)
+        valid_until = now + AppConfig.PUBLIC_SHARE_CACHE_TTL
+        if next_expiry is not None and next_expiry < valid_until:
+            valid_until = next_expiry
+        # 查询期间有分享变更时不写入缓存，下一个请求重新查询
+        if generation == _public_feed_generation:
+            _public_feed = (rows, valid_until)
+    return rows
+
+
+def invalidate_public_shares() -> None:
+    global _public_feed, _public_feed_generation
+    _public_feed_generation += 1
+    _public_feed = None
+
+
+def invalidate_shares() -> None:
+    """分享创建、修改、删除后调用"""
+    global _share_generation
+    _share_generation += 1
+    share_cache.clear()
+    invalidate_public_shares()
+
+
+def invalidate_files() -> None:
+    """文件或目录删除后调用：分享的内容和目录路径都可能已经不存在"""
+    share_path_cache.clear()
+    invalidate_shares()
+
+
+def _cache_get(cache: LRUCache, key):
+    entry = cache.get(key)
+    if entry is None or entry[1] < time.monotonic():
+        return None
+    return entry[0]
+
+
+def _cache_set(cache: LRUCache, key, value, generation: int) -> None:
+    # 查询期间发生过失效时不写入，避免把失效前读到的旧数据放回缓存
+    if generation == _share_generation:
+        cache.set(key, (value, time.monotonic() + AppConfig.SHARE_CACHE_TTL.total_seconds()))
+
+
+def get_share(share_key: str) -> tuple[dict, dict | None] | None:
+    """
+    返回 (分享记录, 分享的文件记录)，分享不存在时返回 None，文件已被删除时第二项为 None。
+    是否过期、密码是否正确由调用方按每次请求判断。返回的字典由所有请求共享，不要原地修改。
+    """
+    cached = _cache_get(share_cache, share_key)
+    if cached is not None:
+        return cached
+
+    generation = _share_generation
+    share = DB.query_one("SELECT * FROM t_share WHERE share_key=?", (share_key,))
+    if not share:
+        return None
+    base_file = DB.query_one("SELECT * FROM t_file WHERE id=?", (share['file_id'],))
+    _cache_set(share_cache, share_key, (share, base_file), generation)
+    return share, base_file
+
+
+def share_contains(share_key: str, file_id: int) -> bool:
+    """分享存在、未过期，且 file_id 是分享的文件本身或其下的文件（祖先链走 file_repo 的缓存）"""
+    loaded = get_share(share_key) if share_key else None
+    if not loaded or not loaded[1]:
+        return False
+    share, base_file = loaded
+    if share['expires_at'] and datetime.datetime.now() > datetime.datetime.fromisoformat(share['expires_at']):
+        return False
+    return any(node['id'] == base_file['id'] for node in file_repo.get_ancestors(file_id))
+
+
+def resolve_path(base_file: dict, path: str) -> list[dict] | None:
+    """
+    从分享的根目录逐级解析 path（如 "folder1/folder2"），返回面包屑（id、filename），最后一项为当前目录；
+    路径不存在时返回 None。从已缓存的最长前缀继续解析，只查询剩下的几级。
+    """
+    parts = [p for p in path.split('/') if p]
+    root = [{'id': base_file['id'], 'filename': base_file['filename']}]
+
+    breadcrumbs, resolved = root, 0
+    for depth in range(len(parts), 0, -1):
+        cached = _cache_get(share_path_cache, (base_file['id'], '/'.join(parts[:depth])))
+        if cached is not None:
+            breadcrumbs, resolved = cached, depth
+            break
+    if resolved == len(parts):
+        return breadcrumbs
+
+    generation = _share_generation
+    breadcrumbs = list(breadcrumbs)
+    for depth in range(resolved, len(parts)):
+        # 查找当前目录下名为 parts[depth] 的子目录（命中 idx_file_parent_name）
+        child = DB.query_one(
+            "SELECT id, filename FROM t_file WHERE parent_id=? AND filename=? AND is_dir=1",
+            (breadcrumbs[-1]['id'], parts[depth])
+        )
+        if not child:
+            return None
+        breadcrumbs.append(child)
+        _cache_set(share_path_cache, (base_file['id'], '/'.join(parts[:depth + 1])), list(breadcrumbs), generation)
+    return breadcrumbs
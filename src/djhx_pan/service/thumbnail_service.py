@@ -0,0 +1,182 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config.app_config import AppConfig, config_dict
+from ..config.log_config import project_logger
+from ..util.cache import LRUCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+app_logger = project_logger()
+
+app_config_mode = os.getenv("CONFIG_MODE", "development")
+
+# 缩略图缓存：按内容 MD5 存放在 <THUMB_FOLDER>/ab/<md5>.jpg，相同内容的文件共用一张缩略图。
+# 总大小超过 THUMBNAIL_CACHE_MAX_SIZE 时按最近访问时间（mtime）淘汰。
+THUMB_FOLDER = os.path.join(config_dict.get(app_config_mode).UPLOAD_FOLDER, '.thumbs')
+os.makedirs(THUMB_FOLDER, exist_ok=True)
+
+FFMPEG = shutil.which(AppConfig.THUMBNAIL_FFMPEG)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+_pending_lock = threading.Lock()
+# 生成失败的内容：md5 -> 可以重试的时间（time.monotonic()）。THUMBNAIL_RETRY_AFTER 秒内不再重试，
+# 避免每次打开目录都重新解码损坏的文件；ffmpeg 超时等临时失败过后还能重新生成
+_failed = LRUCache(4096)
+
+_cache_size = None
+_cache_size_lock = threading.Lock()
+
+
+def thumbnail_path(md5: str) -> str:
+    return os.path.join(THUMB_FOLDER, md5[:2], f'{md5}.jpg')
+
+
+def is_supported(preview_type: str) -> bool:
+    if preview_type == 'image':
+        return Image is not None or FFMPEG is not None
+    if preview_type == 'video':
+        return FFMPEG is not None
+    return False
+
+
+def get_thumbnail(md5: str) -> str | None:
+    """返回已生成的缩略图路径并刷新访问时间，没有时返回 None"""
+    if not md5:
+        return None
+    path = thumbnail_path(md5)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=AppConfig.THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+        return _executor
+
+
+def schedule(md5: str, filepath: str, preview_type: str) -> bool:
+    """
+    提交缩略图生成任务，已存在、正在生成或不支持的类型直接返回 False。
+    任务在后台线程池中执行，不阻塞上传请求。
+    """
+    if not md5 or not filepath or not is_supported(preview_type) or _failed.get(md5, 0) > time.monotonic():
+        return False
+    if os.path.exists(thumbnail_path(md5)):
+        return False
+    with _pending_lock:
+        if md5 in _pending:
+            return False
+        _pending.add(md5)
+    _get_executor().submit(_generate, md5, filepath, preview_type)
+    return True
+
+
+def _generate(md5: str, filepath: str, preview_type: str) -> None:
+    target = thumbnail_path(md5)
+    tmp_path = f'{target}.{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if preview_type == 'image' and Image is not None:
+            _generate_with_pillow(filepath, tmp_path)
+        else:
+            _generate_with_ffmpeg(filepath, tmp_path, preview_type)
+        os.replace(tmp_path, target)
+        _account(os.path.getsize(target))
+        app_logger.debug(f'缩略图生成完成: {md5}')
+    except Exception as e:
+        _failed.set(md5, time.monotonic() + AppConfig.THUMBNAIL_RETRY_AFTER)
+        app_logger.warning(f'缩略图生成失败: {filepath} ({e})')
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with _pending_lock:
+            _pending.discard(md5)
+
+
+def _generate_with_pillow(filepath: str, target: str) -> None:
+    size = AppConfig.THUMBNAIL_SIZE
+    with Image.open(filepath) as img:
+        # JPEG 可以在解码时直接按 1/2、1/4、1/8 缩小，大图不需要完整解码
+        img.draft('RGB', size)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.save(target, 'JPEG', quality=AppConfig.THUMBNAIL_QUALITY)
+
+
+def _generate_with_ffmpeg(filepath: str, target: str, preview_type: str) -> None:
+    width, height = AppConfig.THUMBNAIL_SIZE
+    scale = f'scale={width}:{height}:force_original_aspect_ratio=decrease'
+    # 视频优先取第 1 秒附近的代表帧，片长不足 1 秒时退回第一帧
+    attempts = [['-ss', '1'], []] if preview_type == 'video' else [[]]
+    for seek in attempts:
+        subprocess.run(
+            [FFMPEG, '-v', 'error', '-y', *seek, '-i', filepath,
+             '-frames:v', '1', '-vf', f'thumbnail,{scale}' if seek else scale,
+             '-q:v', '4', '-f', 'image2', target],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            timeout=AppConfig.THUMBNAIL_TIMEOUT, check=True,
+        )
+        if os.path.exists(target) and os.path.getsize(target) > 0:
+            return
+    raise RuntimeError('ffmpeg 没有输出任何帧')
+
+
+def _scan_cache() -> list[tuple[float, int, str]]:
+    entries = []
+    for root, _, files in os.walk(THUMB_FOLDER):
+        for name in files:
+            if not name.endswith('.jpg'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def _account(added: int) -> None:
+    """累计缓存大小，超过上限时删除最久未访问的缩略图，直到降到上限的 90%"""
+    global _cache_size
+    with _cache_size_lock:
+        if _cache_size is None:
+            _cache_size = sum(size for _, size, _ in _scan_cache())
+        else:
+            _cache_size += added
+        if _cache_size <= AppConfig.THUMBNAIL_CACHE_MAX_SIZE:
+            return
+
+        entries = _scan_cache()
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        low_water = AppConfig.THUMBNAIL_CACHE_MAX_SIZE * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= low_water:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        _cache_size = total
+    app_logger.info(f'缩略图缓存超过上限，淘汰 {removed} 个')
@@ -0,0 +1,212 @@
+import json
+import math
+import os
+import re
+import secrets
+import shutil
+import time
+
+from ..config.app_config import AppConfig
+from ..config.log_config import project_logger
+from ..exception import ClientError
+from ..util import safe_secure_filename
+from ..util.stream import HashingTempFile, copy_stream, COPY_BUFFER_SIZE
+from . import file_service, usage_service
+
+app_logger = project_logger()
+
+# 分片上传暂存目录：<STAGING_FOLDER>/<upload_id>/meta.json + 00000000.part ...
+STAGING_FOLDER = os.path.join(file_service.UPLOAD_FOLDER, '.staging')
+os.makedirs(STAGING_FOLDER, exist_ok=True)
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _upload_dir(upload_id: str) -> str:
+    if not upload_id or not UPLOAD_ID_PATTERN.match(upload_id):
+        raise ClientError(f'无效的上传 id')
+    return os.path.join(STAGING_FOLDER, upload_id)
+
+
+def _part_path(upload_dir: str, index: int) -> str:
+    return os.path.join(upload_dir, f'{index:08d}.part')
+
+
+def _load_meta(upload_id: str) -> dict:
+    upload_dir = _upload_dir(upload_id)
+    try:
+        with open(os.path.join(upload_dir, 'meta.json'), 'r', encoding='utf-8') as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        raise ClientError(f'上传任务 {upload_id} 不存在或已完成')
+
+
+def _received_chunks(upload_dir: str) -> list[int]:
+    received = []
+    for name in os.listdir(upload_dir):
+        if name.endswith('.part'):
+            received.append(int(name[:-5]))
+    received.sort()
+    return received
+
+
+def _expected_chunk_size(meta: dict, index: int) -> int:
+    if index < meta['total_chunks'] - 1:
+        return meta['chunk_size']
+    return meta['filesize'] - meta['chunk_size'] * (meta['total_chunks'] - 1)
+
+
+def init_upload(filename: str, filesize, parent_id, md5: str = None, chunk_size=None) -> dict:
+    """
+    创建分片上传任务，返回 upload_id、分片大小和分片数量。
+    客户端随后可以并行 PUT 各个分片，断线后用 upload_status 查询已收到的分片继续上传。
+    传入的 md5 在服务端已存在时直接秒传，返回 {'instant': True, 'id': ...}。
+    """
+    filename = safe_secure_filename(filename)
+    if not filename:
+        raise ClientError(f'上传文件的文件名不能为空')
+
+    try:
+        filesize = int(filesize)
+        chunk_size = int(chunk_size or AppConfig.UPLOAD_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        raise ClientError(f'文件大小或分片大小格式错误')
+    if filesize < 0:
+        raise ClientError(f'文件大小不能为负数')
+    if chunk_size <= 0 or chunk_size > AppConfig.UPLOAD_CHUNK_MAX_SIZE:
+        raise ClientError(f'分片大小需要在 1 ~ {AppConfig.UPLOAD_CHUNK_MAX_SIZE} 字节之间')
+
+    parent_id, _ = file_service.resolve_parent(parent_id)
+    # 提前按声明的大小检查配额，避免上传完所有分片才被拒绝；合并后登记时还会按实际大小再检查
+    usage_service.check_quota(filesize)
+
+    # 已有相同内容时直接秒传，不需要再上传分片
+    if md5:
+        new_file = file_service.instant_upload(filename, md5, parent_id, filesize)
+        if new_file:
+            return {'instant': True, 'id': new_file.id, 'filename': new_file.filename}
+
+    purge_stale_uploads()
+
+    upload_id = secrets.token_hex(16)
+    upload_dir = _upload_dir(upload_id)
+    os.makedirs(upload_dir)
+
+    meta = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'filesize': filesize,
+        'chunk_size': chunk_size,
+        'total_chunks': max(1, math.ceil(filesize / chunk_size)),
+        'parent_id': parent_id,
+        'md5': md5 or None,
+        'created_at': time.time(),
+    }
+    tmp_meta = os.path.join(upload_dir, 'meta.json.tmp')
+    with open(tmp_meta, 'w', encoding='utf-8') as fp:
+        json.dump(meta, fp)
+    os.replace(tmp_meta, os.path.join(upload_dir, 'meta.json'))
+
+    app_logger.info(f'分片上传开始: {upload_id} {filename} ({filesize} bytes, {meta["total_chunks"]} chunks)')
+    return {**meta, 'instant': False, 'received': []}
+
+
+def upload_status(upload_id: str) -> dict:
+    meta = _load_meta(upload_id)
+    return {**meta, 'received': _received_chunks(_upload_dir(upload_id))}
+
+
+def save_chunk(upload_id: str, index: int, stream) -> int:
+    """
+    保存第 index 个分片（从 0 开始）。先写临时文件再原子改名，
+    多个分片可以并行上传，重复上传同一分片会覆盖之前的内容。
+    """
+    meta = _load_meta(upload_id)
+    if index < 0 or index >= meta['total_chunks']:
+        raise ClientError(f'分片序号 {index} 超出范围 0 ~ {meta["total_chunks"] - 1}')
+
+    upload_dir = _upload_dir(upload_id)
+    expected = _expected_chunk_size(meta, index)
+    part_path = _part_path(upload_dir, index)
+    tmp_path = f'{part_path}.{secrets.token_hex(4)}.tmp'
+
+    written = 0
+    try:
+        with open(tmp_path, 'wb') as fp:
+            while True:
+                buf = stream.read(COPY_BUFFER_SIZE)
+                if not buf:
+                    break
+                written += len(buf)
+                if written > expected:
+                    raise ClientError(f'分片 {index} 大小超过预期的 {expected} 字节')
+                fp.write(buf)
+        if written != expected:
+            raise ClientError(f'分片 {index} 大小为 {written} 字节，预期 {expected} 字节')
+        os.replace(tmp_path, part_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return written
+
+
+def complete_upload(upload_id: str):
+    """
+    所有分片到齐后按顺序一次写入最终文件，同时计算 MD5，校验通过后登记到 t_file。
+    """
+    meta = _load_meta(upload_id)
+    upload_dir = _upload_dir(upload_id)
+
+    missing = sorted(set(range(meta['total_chunks'])) - set(_received_chunks(upload_dir)))
+    if missing:
+        raise ClientError(f'还有 {len(missing)} 个分片未上传: {missing[:20]}')
+
+    # 改名作为锁，防止重复调用 complete 同时合并
+    assembling_dir = f'{upload_dir}.assembling'
+    try:
+        os.rename(upload_dir, assembling_dir)
+    except OSError:
+        raise ClientError(f'上传任务 {upload_id} 正在合并')
+
+    try:
+        parent_id, _ = file_service.resolve_parent(meta['parent_id'])
+
+        with HashingTempFile() as assembled:
+            for index in range(meta['total_chunks']):
+                with open(_part_path(assembling_dir, index), 'rb') as part:
+                    copy_stream(part, assembled)
+            if meta['md5'] and meta['md5'] != assembled.hexdigest():
+                raise ClientError(f'{meta["filename"]} md5 不匹配')
+            new_file = file_service.store_upload(assembled, meta['filename'], parent_id)
+    except Exception:
+        # 合并失败时恢复暂存目录，客户端可以重新上传有问题的分片后再次合并
+        os.rename(assembling_dir, upload_dir)
+        raise
+
+    shutil.rmtree(assembling_dir, ignore_errors=True)
+    app_logger.info(f'分片上传完成: {upload_id} -> {new_file.filepath}')
+    return new_file
+
+
+def abort_upload(upload_id: str) -> None:
+    upload_dir = _upload_dir(upload_id)
+    if not os.path.isdir(upload_dir):
+        raise ClientError(f'上传任务 {upload_id} 不存在或已完成')
+    shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+def purge_stale_uploads() -> int:
+    """清理超过 UPLOAD_STAGING_EXPIRE 未完成的上传任务"""
+    expire_before = time.time() - AppConfig.UPLOAD_STAGING_EXPIRE.total_seconds()
+    purged = 0
+    for name in os.listdir(STAGING_FOLDER):
+        path = os.path.join(STAGING_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < expire_before:
+                shutil.rmtree(path, ignore_errors=True)
+                purged += 1
+        except FileNotFoundError:
+            continue
+    if purged:
+        app_logger.info(f'清理过期的分片上传任务 {purged} 个')
+    return purged
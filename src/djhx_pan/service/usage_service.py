@@ -0,0 +1,38 @@
+from ..config.app_config import AppConfig
+from ..config.log_config import project_logger
+from ..exception import ClientError
+from ..repository import usage_repo
+from . import job_service
+
+app_logger = project_logger()
+
+# 存储用量：目录聚合值（t_file.subtree_size / subtree_files）和总用量（t_storage_usage）由 SQLite 触发器
+# 在插入、删除、移动文件的同一事务中维护，请求时只读一行，不需要递归遍历目录树。
+# 文件没有归属用户，用量和配额按整个网盘统计。
+
+
+def get_usage() -> dict:
+    """总用量和配额，quota 为 None 表示不限制"""
+    usage = usage_repo.get_usage()
+    quota = AppConfig.STORAGE_QUOTA
+    usage['quota'] = quota
+    usage['percent'] = round(usage['used_size'] * 100 / quota, 1) if quota else None
+    return usage
+
+
+def check_quota(incoming_size) -> None:
+    """再写入 incoming_size 字节会超过配额时抛出 ClientError"""
+    quota = AppConfig.STORAGE_QUOTA
+    if not quota:
+        return
+    used = usage_repo.get_usage()['used_size']
+    if used + int(incoming_size or 0) > quota:
+        raise ClientError(f'存储空间不足：已用 {used} / {quota} 字节，本次需要 {incoming_size} 字节')
+
+
+@job_service.periodic('usage.reconcile', AppConfig.USAGE_RECONCILE_INTERVAL)
+def _reconcile_job(payload: dict, progress) -> dict:
+    result = usage_repo.reconcile()
+    if result['folders_fixed'] or result['size_drift'] or result['file_drift']:
+        app_logger.warning(f'存储用量重算修正了偏差: {result}')
+    return result
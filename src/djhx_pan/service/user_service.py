@@ -1,25 +1,33 @@
 import random
 import string
-import time
 from dataclasses import dataclass
 from datetime import timedelta
 
 from flask_jwt_extended import create_access_token, create_refresh_token
 
+from ..config.app_config import AppConfig
 from ..config.log_config import project_logger
 from ..exception import ClientError
 from ..repository import user_repo
 from ..repository.user_repo import get_user_by_email
-from ..util import PasswordUtil, send_email_verify_code
+from ..util import send_email_verify_code
+from ..util.ephemeral import EphemeralStore
 from ..model import User
+from . import job_service, password_service
 
 app_logger = project_logger()
 
 JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=60)
 JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=7)
 
-# 简单内存验证码缓存，可换 Redis
-email_code_cache = {}
+# 邮箱验证码：email -> {'code': ...}，所有 worker 进程共用，过期后自动失效
+email_codes = EphemeralStore('email_code', AppConfig.EMAIL_CODE_TTL.total_seconds(), AppConfig.EMAIL_CODE_MAX_ENTRIES)
+# 发送冷却：email -> True，存在期间不能重新发送
+email_code_cooldown = EphemeralStore('email_code_cooldown', AppConfig.EMAIL_CODE_RESEND_INTERVAL.total_seconds(),
+                                     AppConfig.EMAIL_CODE_MAX_ENTRIES)
+# 校验次数：email -> 窗口内的校验次数，跨验证码累计
+email_code_attempts = EphemeralStore('email_code_attempts', AppConfig.EMAIL_CODE_ATTEMPT_WINDOW.total_seconds(),
+                                     AppConfig.EMAIL_CODE_MAX_ENTRIES)
 
 @dataclass
 class TokenData:
@@ -34,16 +42,17 @@ class TokenData:
             "token_type": self.token_type
         }
 
-def login_by_username(username: str, password: str) -> TokenData | None:
-    user = user_repo.get_user_by_username(username)
+def login_by_username(username: str, password: str, client: str = None) -> TokenData | None:
+    """client 为客户端标识（IP），同一客户端短时间内重复登录时跳过哈希计算"""
+    user = user_repo.get_credentials(username)
     if not user:
         raise ClientError(f'用户 {username} 不存在')
 
-    if not PasswordUtil.verify_password(password, user.password, user.salt):
+    if not password_service.verify_user(user, password, client):
         raise ClientError(f'用户名或密码错误')
 
-    access_token = create_access_token(identity=user.username, expires_delta=JWT_ACCESS_TOKEN_EXPIRES)
-    refresh_token = create_refresh_token(identity=user.username, expires_delta=JWT_REFRESH_TOKEN_EXPIRES)
+    access_token = create_access_token(identity=user['username'], expires_delta=JWT_ACCESS_TOKEN_EXPIRES)
+    refresh_token = create_refresh_token(identity=user['username'], expires_delta=JWT_REFRESH_TOKEN_EXPIRES)
     return TokenData(access_token=access_token, refresh_token=refresh_token)
 
 
@@ -51,16 +60,9 @@ def login_by_email(email: str, email_code: str) -> TokenData | None:
     user = get_user_by_email(email)
     if not user:
         raise ClientError(f'邮箱 {email} 未注册')
-    stored = email_code_cache.get(email)
-    if not stored:
-        raise ClientError("请先获取邮箱验证码")
-    if time.time() - stored['time'] > 300:
-        raise ClientError("验证码已过期")
-    if stored['code'] != email_code:
-        raise ClientError("验证码错误")
+    check_email_code(email, email_code)
     access_token = create_access_token(identity=user.username, expires_delta=JWT_ACCESS_TOKEN_EXPIRES)
     refresh_token = create_refresh_token(identity=user.username, expires_delta=JWT_REFRESH_TOKEN_EXPIRES)
-    email_code_cache.pop(email, None)
     return TokenData(access_token=access_token, refresh_token=refresh_token)
 
 
@@ -77,9 +79,9 @@ def user_register(username: str, password: str, password_confirm: str, email: st
     if phone and user_repo.get_user_by_phone(phone):
         raise ClientError(f'手机号 {phone} 已被注册')
 
-    salt = PasswordUtil.generate_salt()
-    password_hash = PasswordUtil.hash_password(password, salt)
-    new_user = user_repo.add_user(username, username, password_hash, salt, email, phone)
+    hashed = password_service.hash_new_password(password)
+    new_user = user_repo.add_user(username, username, hashed['password'], hashed['salt'], email, phone,
+                                  hashed['pwd_algorithm'], hashed['pwd_iterations'])
     return new_user
 
 
@@ -89,13 +91,43 @@ def send_email_code(email: str) -> None:
     if not user:
         raise ClientError(f'邮箱 {email} 未注册')
 
+    # 重新发送不清零校验次数，次数用完后发送新的验证码也无法通过，不再发送
+    if (email_code_attempts.get(email) or 0) >= AppConfig.EMAIL_CODE_MAX_ATTEMPTS:
+        raise ClientError("验证码错误次数过多，请稍后再试")
+    if not email_code_cooldown.add(email, True):
+        raise ClientError(f"发送过于频繁，请 {int(AppConfig.EMAIL_CODE_RESEND_INTERVAL.total_seconds())} 秒后再试")
+
     code = ''.join(random.choices(string.digits, k=6))
-    email_code_cache[email] = {'code': code, 'time': time.time()}
+    email_codes.set(email, {'code': code})
+
+    # SMTP 握手较慢，交给后台任务发送；验证码不写入任务参数（t_job 会保留 JOB_RETENTION），发送时从存储中读取
+    job_service.enqueue('email.verify_code', {'email': email})
+
+
+def check_email_code(email: str, code: str) -> None:
+    """
+    校验邮箱验证码，通过后删除（只能使用一次），不通过时抛出 ClientError。
+    比较和删除是同一条语句，并发提交或期间重新发送了验证码时只有当前的验证码能通过。
+    每次校验先占用一次次数再比较，并发猜测也不会超过 EMAIL_CODE_MAX_ATTEMPTS，通过后清零。
+    """
+    if email_codes.get(email) is None:
+        raise ClientError("请先获取邮箱验证码，或验证码已过期")
+    if email_code_attempts.increment(email) > AppConfig.EMAIL_CODE_MAX_ATTEMPTS:
+        email_codes.pop(email)
+        raise ClientError("验证码错误次数过多，请稍后再试")
+    if not code or email_codes.pop_matching(email, 'code', str(code)) is None:
+        raise ClientError("验证码错误")
+    email_code_attempts.pop(email)
 
-    try:
-        send_email_verify_code(email, code)
-    except Exception as e:
-        raise e
+
+@job_service.handler('email.verify_code')
+def _send_email_code_job(payload: dict, progress) -> None:
+    stored = email_codes.get(payload['email'])
+    if not stored:
+        app_logger.info(f'邮件 {payload["email"]} 的验证码已过期或已使用，不再发送')
+        return
+    send_email_verify_code(payload['email'], stored['code'])
+    app_logger.info(f'邮件 {payload["email"]} 验证码发送成功')
 
 
 def refresh_token(username: str) -> TokenData | None:
@@ -8,15 +8,41 @@ function openPreview(imageUrl) {
     modal.style.display = "flex"; // 显示预览框
 }
 
-function openTextPreview(fileUrl) {
-    fetch(fileUrl)
-        .then(response => response.text())
-        .then(text => {
+// 文本预览：只请求文件的一部分（开头 / 末尾 / 指定行），大文件也能立即打开
+let textPreviewUrl = null;
+
+function openTextPreview(previewUrl, mode = 'head', startLine = null, offset = null) {
+    textPreviewUrl = previewUrl;
+    const params = new URLSearchParams({mode: mode});
+    // 向后翻页用上一页的结束偏移直接定位，行号只用来继续计算下一页的行号
+    if (offset) {
+        params.set('offset', offset);
+    }
+    if (startLine) {
+        params.set('start', startLine);
+    }
+
+    fetch(`${previewUrl}?${params}`)
+        .then(response => response.json())
+        .then(result => {
+            if (!result.success) {
+                alert(result.message);
+                return;
+            }
+            const data = result.data;
             const modal = document.getElementById('textPreviewModal');
             const previewContent = document.getElementById('textPreviewContent');
+            const previewInfo = document.getElementById('textPreviewInfo');
+            const nextButton = document.getElementById('textPreviewNext');
+
+            previewContent.textContent = data.text;
+            previewContent.scrollTop = 0;
+            previewInfo.textContent = `${data.filename}（${data.encoding}，第 ${data.start} ~ ${data.end} 字节，共 ${data.filesize} 字节）`;
 
-            // 设置文本内容并进行代码高亮
-            previewContent.textContent = text;
+            // head / lines 模式还有后续内容时显示“下一页”
+            nextButton.dataset.line = data.next_line || '';
+            nextButton.dataset.offset = data.next_offset || '';
+            nextButton.style.display = data.next_offset ? '' : 'none';
 
             modal.style.display = "flex"; // 显示文本预览框
         })
@@ -25,6 +51,15 @@ function openTextPreview(fileUrl) {
         });
 }
 
+function textPreviewPage(mode) {
+    if (mode === 'lines') {
+        const nextButton = document.getElementById('textPreviewNext');
+        openTextPreview(textPreviewUrl, 'lines', nextButton.dataset.line, nextButton.dataset.offset);
+    } else {
+        openTextPreview(textPreviewUrl, mode);
+    }
+}
+
 function closePreview(event) {
     const modal = document.getElementById('imagePreviewModal');
     const textModal = document.getElementById('textPreviewModal');
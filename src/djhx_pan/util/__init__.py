@@ -47,22 +47,23 @@ class PasswordUtil:
         return base64.b64encode(salt_bytes).decode('utf-8')
 
     @staticmethod
-    def hash_password(password: str, salt: str) -> str:
-        """生成密码哈希（PBKDF2 + Salt + Base64 编码）"""
+    def hash_password(password: str, salt: str, iterations: int = ITERATIONS, algorithm: str = ALGORITHM) -> str:
+        """生成密码哈希（PBKDF2 + Salt + Base64 编码），iterations / algorithm 取用户保存的参数"""
         salt_bytes = base64.b64decode(salt)
         dk = hashlib.pbkdf2_hmac(
-            PasswordUtil.ALGORITHM,
+            algorithm,
             password.encode('utf-8'),
             salt_bytes,
-            PasswordUtil.ITERATIONS,
+            iterations,
             dklen=PasswordUtil.KEY_LENGTH
         )
         return base64.b64encode(dk).decode('utf-8')
 
     @staticmethod
-    def verify_password(input_password: str, stored_hash: str, stored_salt: str) -> bool:
+    def verify_password(input_password: str, stored_hash: str, stored_salt: str,
+                        iterations: int = ITERATIONS, algorithm: str = ALGORITHM) -> bool:
         """验证密码"""
-        new_hash = PasswordUtil.hash_password(input_password, stored_salt)
+        new_hash = PasswordUtil.hash_password(input_password, stored_salt, iterations, algorithm)
         return hmac.compare_digest(new_hash, stored_hash)
 
 
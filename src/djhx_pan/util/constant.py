@@ -98,6 +98,11 @@ PREVIEW_TYPES = {
     "svg": "image", "ico": "image", "heic": "image", "avif": "image",
     "psd": "image", "ai": "image", "eps": "image",
 
+    # 视频类：缩略图取视频开头的一帧
+    "mp4": "video", "mkv": "video", "mov": "video", "webm": "video",
+    "avi": "video", "m4v": "video", "flv": "video", "wmv": "video",
+    "mpeg": "video", "mpg": "video", "3gp": "video",
+
     # 文本类
     "txt": "text", "rtf": "text",
     "xml": "text",
@@ -0,0 +1,172 @@
+import logging
+import os
+import secrets
+from urllib.parse import quote
+
+from flask import Response, current_app, request
+from werkzeug.utils import send_file
+
+from ..config.app_config import AppConfig, config_dict
+from .stream import COPY_BUFFER_SIZE
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+app_config = config_dict.get(os.getenv("CONFIG_MODE", "development"))
+
+DOWNLOAD_OFFLOAD_MODES = (None, 'x-accel', 'x-sendfile')
+if app_config.DOWNLOAD_OFFLOAD not in DOWNLOAD_OFFLOAD_MODES:
+    raise ValueError(f'DOWNLOAD_OFFLOAD 只能是 {DOWNLOAD_OFFLOAD_MODES} 之一: {app_config.DOWNLOAD_OFFLOAD}')
+
+
+def _if_range_matches(etag: str | None, last_modified) -> bool:
+    """If-Range 缺省或与当前的强 ETag / Last-Modified 一致时，Range 才生效"""
+    if_range = request.if_range
+    if if_range.etag is None and if_range.date is None:
+        return True
+    if if_range.etag is not None:
+        return etag is not None and if_range.etag == etag
+    return last_modified is not None and if_range.date == last_modified
+
+
+def _satisfiable_ranges(ranges, size: int) -> list[tuple[int, int]]:
+    """把 Range 头中的区间换算成 [start, stop)，丢弃无法满足的区间并合并重叠部分"""
+    result = []
+    for begin, end in ranges:
+        if begin < 0:
+            start, stop = max(size + begin, 0), size
+        else:
+            start, stop = begin, size if end is None else min(end, size)
+        if start < stop:
+            result.append((start, stop))
+
+    result.sort()
+    merged = []
+    for start, stop in result:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _read_range(filepath: str, start: int, stop: int):
+    with open(filepath, 'rb') as fp:
+        fp.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            buf = fp.read(min(COPY_BUFFER_SIZE, remaining))
+            if not buf:
+                break
+            remaining -= len(buf)
+            yield buf
+
+
+def _range_response(full: Response, filepath: str, size: int, ranges: list[tuple[int, int]]) -> Response:
+    """
+    为合并后的区间构造 206 响应：单个区间直接返回该段，
+    多个区间返回 multipart/byteranges，边读边发，不在内存中拼接整个响应
+    """
+    content_type = full.headers.get('Content-Type', 'application/octet-stream')
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = Response(_read_range(filepath, start, stop), status=206, content_type=content_type)
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.headers['Content-Length'] = str(stop - start)
+    else:
+        boundary = secrets.token_hex(16)
+        part_headers = [
+            (f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+             f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('latin-1')
+            for start, stop in ranges
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+
+        def generate():
+            for index, ((start, stop), header) in enumerate(zip(ranges, part_headers)):
+                yield (b'\r\n' + header) if index else header
+                yield from _read_range(filepath, start, stop)
+            yield closing
+
+        response = Response(generate(), status=206, mimetype=f'multipart/byteranges; boundary={boundary}')
+        response.headers['Content-Length'] = str(
+            sum(len(h) for h in part_headers) + sum(stop - start for start, stop in ranges)
+            + 2 * (len(ranges) - 1) + len(closing)
+        )
+
+    full.close()
+    for name in ('ETag', 'Last-Modified', 'Cache-Control', 'Expires', 'Content-Disposition', 'Accept-Ranges'):
+        if name in full.headers:
+            response.headers[name] = full.headers[name]
+    return response
+
+
+def _accel_uri(filepath: str) -> str | None:
+    """把 UPLOAD_FOLDER 下的文件路径换算成 nginx internal location 的 URI，不在上传目录下时返回 None"""
+    relpath = os.path.relpath(os.path.abspath(filepath), os.path.abspath(app_config.UPLOAD_FOLDER))
+    if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+        return None
+    return app_config.DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(relpath.replace(os.sep, '/'))
+
+
+def send_stored_file(filepath: str, download_name: str, md5: str = None, as_attachment: bool = True) -> Response:
+    """
+    发送存储中的文件：
+    - 强 ETag 取自 t_file.md5，内容不变 ETag 就不变；旧数据没有 md5 时使用 werkzeug 基于 mtime/size 的 ETag
+    - If-None-Match / If-Modified-Since 命中时返回 304
+    - 单区间 Range（含 If-Range）由 werkzeug 处理，多区间返回 multipart/byteranges
+    - Cache-Control: private，浏览器可以缓存 DOWNLOAD_CACHE_MAX_AGE 秒，代理不缓存
+    - 配置了 DOWNLOAD_OFFLOAD 时只返回响应头，文件内容和 Range 交给前置代理发送，不占用 worker
+    """
+    offload = app_config.DOWNLOAD_OFFLOAD
+    accel_uri = None
+    if offload == 'x-accel':
+        accel_uri = _accel_uri(filepath)
+        if accel_uri is None:
+            app_logger.warning(f'文件不在上传目录下，无法使用 X-Accel-Redirect，改为直接发送: {filepath}')
+            offload = None
+
+    # werkzeug 只支持单区间，遇到多区间直接返回 416；多区间请求去掉 Range 头交给 werkzeug 做条件判断，
+    # 再在下面补上 multipart/byteranges。交给代理发送时 Range 由代理处理，这里同样去掉
+    http_range = request.range
+    multi_range = (request.method == 'GET' and http_range is not None
+                   and http_range.units == 'bytes' and len(http_range.ranges) > 1)
+    environ = request.environ
+    if offload or multi_range:
+        environ = {k: v for k, v in environ.items() if k != 'HTTP_RANGE'}
+
+    # 不经过 flask.send_file：它固定使用 request.environ 和全局的 USE_X_SENDFILE
+    response = send_file(
+        filepath,
+        environ,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        etag=md5 or True,
+        conditional=True,
+        max_age=AppConfig.DOWNLOAD_CACHE_MAX_AGE,
+        use_x_sendfile=offload is not None,
+        response_class=current_app.response_class,
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+
+    if offload:
+        # 304 等条件请求的结果由应用直接返回；带上转发头的话代理会忽略状态码照常发送整个文件
+        if response.status_code != 200:
+            response.headers.pop('X-Sendfile', None)
+            return response
+        if accel_uri is not None:
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = accel_uri
+        return response
+
+    if (multi_range and response.status_code == 200
+            and _if_range_matches(response.get_etag()[0], response.last_modified)):
+        size = os.path.getsize(filepath)
+        ranges = _satisfiable_ranges(http_range.ranges, size)
+        if not ranges:
+            response.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        if len(ranges) <= AppConfig.DOWNLOAD_MAX_RANGES:
+            return _range_response(response, filepath, size, ranges)
+
+    return response
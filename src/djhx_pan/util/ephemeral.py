@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from ..config.app_config import AppConfig, config_dict
+from ..db import ConnectionPool
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+app_config = config_dict.get(os.getenv("CONFIG_MODE", "development"))
+
+# 短期状态（邮箱验证码等）：保存在独立的 SQLite 文件中，所有 gunicorn worker 进程共用，
+# 某个进程发出的验证码可以在另一个进程中校验。每项带过期时间，读取时过期的视为不存在；
+# 每个命名空间最多保留 max_entries 项，写入时删除已过期的项，超出时先淘汰最早过期的。
+# 这个文件丢失只会让未使用的验证码失效，不影响业务数据。
+_pool = ConnectionPool(app_config.EPHEMERAL_DB)
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def _get_connection():
+    global _schema_ready
+    conn = _pool.get()
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS t_ephemeral (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                    "value TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_ephemeral_expires ON t_ephemeral (namespace, expires_at)")
+                _schema_ready = True
+    return conn
+
+
+class EphemeralStore:
+    """带过期时间和容量上限的键值存储，值按 JSON 保存"""
+
+    def __init__(self, namespace: str, ttl: float, max_entries: int = 10000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        now = time.time()
+        conn = _get_connection()
+        with _pool.transaction():
+            conn.execute(
+                "INSERT INTO t_ephemeral (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (self.namespace, key, json.dumps(value), now + (ttl or self.ttl))
+            )
+            evicted = self._trim(conn, now)
+        self._log_evicted(evicted)
+
+    def add(self, key: str, value, ttl: float = None) -> bool:
+        """不存在或已过期时写入并返回 True，已存在时不做修改并返回 False（并发调用时只有一个成功）"""
+        now = time.time()
+        conn = _get_connection()
+        with _pool.transaction():
+            added = conn.execute(
+                "INSERT INTO t_ephemeral (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE t_ephemeral.expires_at <= ? RETURNING key",
+                (self.namespace, key, json.dumps(value), now + (ttl or self.ttl), now)
+            ).fetchall()
+            evicted = self._trim(conn, now) if added else 0
+        self._log_evicted(evicted)
+        return bool(added)
+
+    def increment(self, key: str) -> int:
+        """
+        计数加一并返回新值；不存在或已过期时从 1 开始，过期时间从这次开始计算，
+        之后的累加不延长过期时间（固定窗口）
+        """
+        now = time.time()
+        conn = _get_connection()
+        with _pool.transaction():
+            rows = conn.execute(
+                "INSERT INTO t_ephemeral (namespace, key, value, expires_at) VALUES (?, ?, '1', ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET "
+                "value = CASE WHEN t_ephemeral.expires_at <= ? THEN '1' ELSE t_ephemeral.value + 1 END, "
+                "expires_at = CASE WHEN t_ephemeral.expires_at <= ? THEN excluded.expires_at ELSE t_ephemeral.expires_at END "
+                "RETURNING value",
+                (self.namespace, key, now + self.ttl, now, now)
+            ).fetchall()
+            evicted = self._trim(conn, now)
+        self._log_evicted(evicted)
+        return int(rows[0]['value'])
+
+    def _trim(self, conn, now: float) -> int:
+        """删除已过期的项，超过 max_entries 时先淘汰最早过期的，返回淘汰的项数"""
+        conn.execute("DELETE FROM t_ephemeral WHERE namespace = ? AND expires_at <= ?", (self.namespace, now))
+        return conn.execute("""
+            DELETE FROM t_ephemeral WHERE namespace = ? AND key IN (
+                SELECT key FROM t_ephemeral WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.namespace, self.namespace, self.max_entries)).rowcount
+
+    def _log_evicted(self, evicted: int) -> None:
+        if evicted:
+            app_logger.warning(f'{self.namespace} 超过 {self.max_entries} 项，淘汰了 {evicted} 项')
+
+    def get(self, key: str):
+        """不存在或已过期时返回 None"""
+        row = _get_connection().execute(
+            "SELECT value FROM t_ephemeral WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (self.namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def pop(self, key: str):
+        """删除并返回原来的值；并发调用时只有一个能取到"""
+        rows = _get_connection().execute(
+            "DELETE FROM t_ephemeral WHERE namespace = ? AND key = ? RETURNING value, expires_at",
+            (self.namespace, key)
+        ).fetchall()
+        if not rows or rows[0]['expires_at'] <= time.time():
+            return None
+        return json.loads(rows[0]['value'])
+
+    def pop_matching(self, key: str, field: str, expected):
+        """
+        值中的 field 等于 expected 时删除并返回原来的值，比较和删除在同一条语句中完成，
+        期间被 set 替换成新值时不会误删新值
+        """
+        if not field.isidentifier():
+            raise ValueError(f'字段名不合法: {field}')
+        rows = _get_connection().execute(
+            "DELETE FROM t_ephemeral WHERE namespace = ? AND key = ? AND expires_at > ? "
+            f"AND json_extract(value, '$.{field}') = ? RETURNING value",
+            (self.namespace, key, time.time(), expected)
+        ).fetchall()
+        return json.loads(rows[0]['value']) if rows else None
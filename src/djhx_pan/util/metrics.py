@@ -0,0 +1,309 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import request
+
+from ..config.app_config import AppConfig, config_dict
+from ..db import ConnectionPool, Statement, statement_hooks
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+app_config = config_dict.get(os.getenv("CONFIG_MODE", "development"))
+
+# Prometheus 指标，多个 gunicorn worker 进程汇总：
+# - 计数器和直方图在进程内累加增量，每 METRICS_FLUSH_INTERVAL 秒由后台线程一次性加到 METRICS_DB 中，
+#   /metrics 读取的是所有进程累加后的总数，worker 重启不会丢失已经写入的部分
+# - 仪表（进行中的下载数）每个进程写自己的当前值，读取时只汇总最近刷新过的进程，退出的进程自动排除
+# 指标定义在模块导入时登记，每个进程都相同，输出时按定义的顺序生成 HELP / TYPE。
+_pool = ConnectionPool(app_config.METRICS_DB)
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+_registry = []
+_lock = threading.Lock()
+_pending = {}  # (样本名, 标签 JSON) -> 未写入的增量
+_gauges = {}  # (样本名, 标签 JSON) -> 本进程的当前值
+_local = threading.local()
+_flusher_started = False
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# db.notify_statement 的 source，每个请求都按这两类记录（没有执行 SQL 的请求记为 0）
+SQL_SOURCES = ('db', 'sqlalchemy')
+
+
+def _labels_key(pairs) -> str:
+    return json.dumps(pairs, ensure_ascii=False, separators=(',', ':'))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    def _pairs(self, labels: dict) -> list:
+        return [[name, str(labels.get(name, ''))] for name in self.labelnames]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = (self.name, _labels_key(self._pairs(labels)))
+        with _lock:
+            _pending[key] = _pending.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = (self.name, _labels_key(self._pairs(labels)))
+        with _lock:
+            _gauges[key] = _gauges.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value: float, **labels) -> None:
+        pairs = self._pairs(labels)
+        base = _labels_key(pairs)
+        updates = [((self.name + '_sum', base), value), ((self.name + '_count', base), 1)]
+        updates += [((self.name + '_bucket', _labels_key(pairs + [['le', _format_value(bound)]])), 1)
+                    for bound in self.buckets if value <= bound]
+        with _lock:
+            for key, amount in updates:
+                _pending[key] = _pending.get(key, 0) + amount
+
+
+REQUEST_DURATION = Histogram(
+    'djhx_http_request_duration_seconds', '请求处理时间（到返回响应头为止，不含流式响应体的发送）',
+    ('blueprint', 'endpoint', 'method', 'status'))
+REQUEST_BYTES = Counter('djhx_http_request_bytes_total', '收到的请求体字节数（上传）', ('blueprint', 'endpoint'))
+RESPONSE_BYTES = Counter('djhx_http_response_bytes_total', '发送的响应体字节数（下载）', ('blueprint', 'endpoint'))
+ACTIVE_DOWNLOADS = Gauge('djhx_active_downloads', '正在发送的流式响应（文件下载、ZIP 打包）', ('endpoint',))
+UPLOAD_HASH_DURATION = Histogram('djhx_upload_hash_seconds', '每个上传文件计算 MD5 的累计时间')
+SQL_STATEMENTS = Counter('djhx_sql_statements_total', '执行的 SQL 语句数', ('source',))
+SQL_DURATION = Counter('djhx_sql_duration_seconds_total', 'SQL 语句的累计执行时间', ('source',))
+REQUEST_SQL_STATEMENTS = Histogram(
+    'djhx_request_sql_statements', '每个请求执行的 SQL 语句数', ('source',), buckets=COUNT_BUCKETS)
+REQUEST_SQL_DURATION = Histogram('djhx_request_sql_duration_seconds', '每个请求的 SQL 累计执行时间', ('source',))
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _get_connection():
+    global _schema_ready
+    conn = _pool.get()
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS t_metric (name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, "
+                    "PRIMARY KEY (name, labels)) WITHOUT ROWID"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS t_metric_gauge (pid INTEGER NOT NULL, name TEXT NOT NULL, "
+                    "labels TEXT NOT NULL, value REAL NOT NULL, updated REAL NOT NULL, PRIMARY KEY (pid, name, labels)) "
+                    "WITHOUT ROWID"
+                )
+                _schema_ready = True
+    return conn
+
+
+def flush() -> None:
+    """把本进程累积的增量和仪表的当前值写入 METRICS_DB；写入失败时增量保留到下一次"""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+        gauges = list(_gauges.items())
+    now = time.time()
+    try:
+        conn = _get_connection()
+        with _pool.transaction():
+            conn.executemany(
+                "INSERT INTO t_metric (name, labels, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+                [(name, labels, value) for (name, labels), value in pending.items()]
+            )
+            conn.executemany(
+                "INSERT INTO t_metric_gauge (pid, name, labels, value, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(pid, name, labels) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                [(os.getpid(), name, labels, value, now) for (name, labels), value in gauges]
+            )
+            conn.execute("DELETE FROM t_metric_gauge WHERE updated < ?", (now - 10 * AppConfig.METRICS_FLUSH_INTERVAL,))
+    except Exception as e:
+        app_logger.warning(f'指标写入失败，下次重试: {e}')
+        with _lock:
+            for key, value in pending.items():
+                _pending[key] = _pending.get(key, 0) + value
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(AppConfig.METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render() -> str:
+    """所有 worker 进程汇总后的指标，Prometheus 文本格式"""
+    flush()
+    conn = _get_connection()
+    samples = {}
+    for row in conn.execute("SELECT name, labels, value FROM t_metric"):
+        samples.setdefault(row['name'], []).append((row['labels'], row['value']))
+    # 超过 3 个刷新间隔没有更新的进程已经退出或卡住，不计入
+    for row in conn.execute(
+            "SELECT name, labels, sum(value) AS value FROM t_metric_gauge WHERE updated >= ? GROUP BY name, labels",
+            (time.time() - 3 * AppConfig.METRICS_FLUSH_INTERVAL,)):
+        samples.setdefault(row['name'], []).append((row['labels'], row['value']))
+
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        names = [metric.name + suffix for suffix in ('_bucket', '_sum', '_count')] if metric.kind == 'histogram' \
+            else [metric.name]
+        for name in names:
+            rows = [(json.loads(labels), value) for labels, value in samples.get(name, [])]
+            if name.endswith('_bucket'):
+                # 同一组标签的桶按上界排列
+                rows.sort(key=lambda r: (r[0][:-1], float(r[0][-1][1])))
+            else:
+                rows.sort(key=lambda r: r[0])
+            for pairs, value in rows:
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+                lines.append(f'{name}{{{label_text}}} {_format_value(value)}' if label_text
+                             else f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def record_statement(statement: Statement) -> None:
+    """db.statement_hooks 的回调：累计到总数，请求中执行的同时累计到当前请求"""
+    SQL_STATEMENTS.inc(source=statement.source)
+    SQL_DURATION.inc(statement.seconds, source=statement.source)
+    tally = getattr(_local, 'sql', None)
+    if tally is not None:
+        entry = tally.setdefault(statement.source, [0, 0.0])
+        entry[0] += 1
+        entry[1] += statement.seconds
+
+
+def observe_upload_hash(seconds: float) -> None:
+    if AppConfig.METRICS_ENABLED:
+        UPLOAD_HASH_DURATION.observe(seconds)
+
+
+def _track_stream(iterable, callback):
+    """逐块转发，发送完或客户端断开时以实际发送的字节数调用 callback"""
+    sent = 0
+    try:
+        for chunk in iterable:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close:
+            close()
+        callback(sent)
+
+
+def _track_download(response, labels: dict) -> None:
+    """流式响应：计入进行中的下载数，服务器关闭响应时减去并累计发送的字节数"""
+    endpoint = labels['endpoint']
+    ACTIVE_DOWNLOADS.inc(endpoint=endpoint)
+
+    def finish(sent):
+        ACTIVE_DOWNLOADS.dec(endpoint=endpoint)
+        RESPONSE_BYTES.inc(sent, **labels)
+
+    body = response.response
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and isinstance(body, file_wrapper):
+        # send_file 返回的 wsgi.file_wrapper：包一层迭代器会让 gunicorn 放弃 sendfile，改为替换它的 close；
+        # 拿不到实际发送的字节数，按 Content-Length 计，客户端中途断开时会多算
+        length = response.content_length or 0
+        original_close = getattr(body, 'close', None)
+
+        def close():
+            try:
+                if original_close:
+                    original_close()
+            finally:
+                finish(length)
+
+        body.close = close
+    else:
+        # direct_passthrough 的响应不经过 call_on_close，统一包一层生成器
+        response.response = _track_stream(body, finish)
+
+
+def init_metrics(app) -> None:
+    """注册请求钩子、SQL 回调和后台刷新线程；METRICS_ENABLED 为 False 时不做任何事"""
+    global _flusher_started
+    if not AppConfig.METRICS_ENABLED:
+        return
+    if record_statement not in statement_hooks:
+        statement_hooks.append(record_statement)
+    if not _flusher_started:
+        _flusher_started = True
+        threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+        atexit.register(flush)
+
+    @app.before_request
+    def _metrics_start():
+        _local.start = time.perf_counter()
+        _local.sql = {}
+
+    @app.after_request
+    def _metrics_finish(response):
+        start = getattr(_local, 'start', None)
+        if start is None:
+            return response
+        labels = {'blueprint': request.blueprint or '', 'endpoint': request.endpoint or ''}
+        REQUEST_DURATION.observe(time.perf_counter() - start, method=request.method,
+                                 status=response.status_code, **labels)
+        if request.content_length:
+            REQUEST_BYTES.inc(request.content_length, **labels)
+        tally = _local.sql or {}
+        for source in SQL_SOURCES:
+            count, seconds = tally.get(source, (0, 0.0))
+            REQUEST_SQL_STATEMENTS.observe(count, source=source)
+            REQUEST_SQL_DURATION.observe(seconds, source=source)
+        _local.start = None
+        _local.sql = None
+
+        if request.method == 'HEAD' or response.status_code == 304:
+            return response
+        if response.is_streamed:
+            if response.status_code in (200, 206):
+                _track_download(response, labels)
+        elif response.content_length:
+            RESPONSE_BYTES.inc(response.content_length, **labels)
+        return response
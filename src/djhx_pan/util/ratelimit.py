@@ -0,0 +1,191 @@
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from functools import partial, wraps
+
+from flask import Response, make_response, request, session
+
+from ..config.app_config import AppConfig, config_dict
+from ..db import ConnectionPool
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+app_config = config_dict.get(os.getenv("CONFIG_MODE", "development"))
+
+# 令牌桶：每个桶按固定速率补充令牌，最多 capacity 个；请求 / 字节消耗令牌，不够时等待或拒绝。
+# 状态保存在独立的 SQLite 文件中（不占用业务库的写锁），BEGIN IMMEDIATE 保证多个 worker 进程之间的扣减是原子的。
+# 这个文件丢失只会让限额重新开始计算，不影响业务数据。
+_pool = ConnectionPool(app_config.RATE_LIMIT_DB)
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+# 长时间没有访问的桶已经补满，与不存在等价，定期删除
+PRUNE_EVERY = 1000
+PRUNE_IDLE_SECONDS = 3600
+_calls = itertools.count(1)
+
+# 下载时累计到这么多字节才扣减一次带宽令牌，避免每个 8 KB 的块都写一次状态库
+THROTTLE_STEP = 256 * 1024
+# 单次等待的上限，欠账很多时分多次等待，客户端断开后能尽快结束
+THROTTLE_MAX_SLEEP = 5
+
+
+def _ensure_schema(conn) -> None:
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS t_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) "
+                "WITHOUT ROWID"
+            )
+            _schema_ready = True
+
+
+def take(buckets: list[tuple[str, float, float]], cost: float, allow_debt: bool = False) -> float:
+    """
+    从 buckets（(key, 每秒补充量, 容量) 列表）中同时扣除 cost 个令牌，返回还需要等待的秒数。
+    allow_debt 为 False 时只要有一个桶不够就都不扣（用于拒绝请求）；
+    为 True 时总是扣除，桶可以透支，返回值是还清透支需要的时间（用于下载限速）。
+    状态库不可用时放行，限流不能影响正常访问。
+    """
+    if not buckets:
+        return 0
+    now = time.time()
+    try:
+        conn = _pool.get()
+        _ensure_schema(conn)
+        with _pool.transaction():
+            rows = conn.execute(
+                "SELECT key, tokens, updated FROM t_bucket WHERE key IN (SELECT value FROM json_each(?))",
+                (json.dumps([key for key, _, _ in buckets]),)
+            ).fetchall()
+            stored = {row['key']: row for row in rows}
+
+            levels = []
+            wait = 0
+            for key, rate, capacity in buckets:
+                row = stored.get(key)
+                tokens = capacity if row is None else min(capacity, row['tokens'] + (now - row['updated']) * rate)
+                levels.append(tokens - cost)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate)
+            if wait > 0 and not allow_debt:
+                return wait
+
+            conn.executemany(
+                "INSERT INTO t_bucket (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                [(key, level, now) for (key, _, _), level in zip(buckets, levels)]
+            )
+
+            if next(_calls) % PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM t_bucket WHERE updated < ?", (now - PRUNE_IDLE_SECONDS,))
+        return wait
+    except Exception as e:
+        app_logger.warning(f'限流状态库不可用，本次放行: {e}')
+        return 0
+
+
+def client_ip() -> str:
+    if AppConfig.RATE_LIMIT_IP_HEADER:
+        forwarded = request.headers.get(AppConfig.RATE_LIMIT_IP_HEADER)
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+
+def _scopes(share_key: str | None) -> list[tuple[str, str]]:
+    scopes = [('ip', f'ip:{client_ip()}'), ('global', 'global')]
+    if share_key:
+        scopes.append(('share', f'share:{share_key}'))
+    return scopes
+
+
+def request_buckets(share_key: str = None) -> list[tuple[str, float, float]]:
+    buckets = []
+    for scope, key in _scopes(share_key):
+        limit = AppConfig.RATE_LIMIT_REQUESTS.get(scope)
+        if limit:
+            rate, capacity = limit
+            buckets.append((f'req:{key}', rate, capacity))
+    return buckets
+
+
+def bandwidth_buckets(share_key: str = None) -> list[tuple[str, float, float]]:
+    buckets = []
+    for scope, key in _scopes(share_key):
+        rate = AppConfig.RATE_LIMIT_BANDWIDTH.get(scope)
+        if rate:
+            buckets.append((f'bw:{key}', rate, rate * AppConfig.RATE_LIMIT_BANDWIDTH_BURST))
+    return buckets
+
+
+def throttle(iterable, buckets):
+    """按 buckets 的带宽限制逐块发送，超出时在两块之间等待；结束或客户端断开时关闭原始的 iterable"""
+    pending = 0
+    try:
+        for chunk in iterable:
+            yield chunk
+            pending += len(chunk)
+            if pending >= THROTTLE_STEP:
+                wait = take(buckets, pending, allow_debt=True)
+                pending = 0
+                while wait > 0:
+                    time.sleep(min(wait, THROTTLE_MAX_SLEEP))
+                    wait -= THROTTLE_MAX_SLEEP
+        if pending:
+            take(buckets, pending, allow_debt=True)
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close:
+            close()
+
+
+def too_many_requests(retry_after: float) -> Response:
+    response = Response('请求过于频繁，请稍后再试', status=429, mimetype='text/plain')
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(view=None, *, share_key=None):
+    """
+    匿名访问的限流装饰器：超过请求数限制时返回 429 和 Retry-After；
+    流式响应（文件下载、ZIP）按带宽限制发送，交给 nginx 发送（X-Accel-Redirect）时改为设置 X-Accel-Limit-Rate。
+    分享链接取自路由参数 share_key；路由中没有分享时可以传入 share_key=callable(**路由参数)，
+    由它校验请求中的分享参数并返回分享链接，客户端随意传入的值不能作为限额的 key。
+    """
+    if view is None:
+        return partial(rate_limit, share_key=share_key)
+    resolve_share = share_key
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not AppConfig.RATE_LIMIT_ENABLED or session.get('user'):
+            return view(*args, **kwargs)
+
+        share_key = kwargs.get('share_key') or (resolve_share(**kwargs) if resolve_share else None)
+        retry_after = take(request_buckets(share_key), 1)
+        if retry_after > 0:
+            app_logger.info(f'请求被限流: {client_ip()} {request.path} ({retry_after:.1f}s)')
+            return too_many_requests(retry_after)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code not in (200, 206):
+            return response
+        buckets = bandwidth_buckets(share_key)
+        if not buckets:
+            return response
+        if 'X-Accel-Redirect' in response.headers:
+            # nginx 只支持按连接限速，取最严格的一个
+            response.headers['X-Accel-Limit-Rate'] = str(int(min(rate for _, rate, _ in buckets)))
+        elif response.is_streamed:
+            response.response = throttle(response.response, buckets)
+        return response
+
+    return wrapper
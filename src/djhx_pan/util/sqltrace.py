@@ -0,0 +1,125 @@
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+
+from flask import request
+
+from ..config.app_config import AppConfig, config_dict
+from ..db import Statement, pool, statement_hooks
+
+app_logger = logging.getLogger(AppConfig.PROJECT_NAME + "." + __name__)
+
+app_config = config_dict.get(os.getenv("CONFIG_MODE", "development"))
+
+# SQL 跟踪（SQL_TRACE_ENABLED，开发环境默认开启）：
+# - 记录请求中执行的每条语句（参数只记录类型，不记录值）、行数和耗时，请求结束时写 DEBUG 日志，
+#   汇总放在响应头 Server-Timing 中，浏览器开发者工具里可以直接看到
+# - 超过 SQL_TRACE_SLOW_MS 的语句连同 EXPLAIN QUERY PLAN 写 WARNING 日志（后台任务中的语句也会记录）
+# - 同一个请求中同一条语句执行超过 SQL_TRACE_REPEAT_THRESHOLD 次时提示可能的 N+1 查询
+_local = threading.local()
+
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b', re.IGNORECASE)
+
+
+def _compact(sql: str, limit: int = 300) -> str:
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= limit else sql[:limit] + '…'
+
+
+def _shape(params, many: bool = False) -> str:
+    """参数的结构，如 (int, str) / {name: str} / 200 × (int, str)，不包含参数值"""
+    if many:
+        if params is None:
+            return '[...]'
+        return f'{len(params)} × {_shape(params[0]) if params else "()"}'
+    if not params:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+def explain(sql: str, params=None) -> list[str]:
+    """EXPLAIN QUERY PLAN 的结果，按层级缩进；不能解释的语句返回空列表"""
+    if not _EXPLAINABLE.match(sql):
+        return []
+    rows = pool.get().execute('EXPLAIN QUERY PLAN ' + sql, params or []).fetchall()
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append('  ' * (depth[node_id] - 1) + detail)
+    return lines
+
+
+def _log_slow(statement: Statement) -> None:
+    params = statement.params
+    if statement.many:
+        params = params[0] if params else None
+    try:
+        plan = explain(statement.sql, params)
+    except Exception as e:
+        plan = [f'EXPLAIN 失败: {e}']
+    where = f'{request.method} {request.path}' if getattr(_local, 'statements', None) is not None else '后台'
+    app_logger.warning(
+        f'慢查询 {statement.seconds * 1000:.1f}ms [{statement.source}] ({where}) '
+        f'rows={statement.rows} params={_shape(statement.params, statement.many)}: {_compact(statement.sql)}'
+        + ''.join(f'\n    {line}' for line in plan)
+    )
+
+
+def record_statement(statement: Statement) -> None:
+    """db.statement_hooks 的回调"""
+    statements = getattr(_local, 'statements', None)
+    if statements is not None:
+        statements.append(statement)
+    if statement.seconds * 1000 >= AppConfig.SQL_TRACE_SLOW_MS:
+        _log_slow(statement)
+
+
+def _report(statements: list[Statement]) -> None:
+    where = f'{request.method} {request.path}'
+    total = sum(s.seconds for s in statements) * 1000
+    if app_logger.isEnabledFor(logging.DEBUG):
+        lines = [f'{where}: {len(statements)} 条 SQL，共 {total:.1f}ms']
+        for index, s in enumerate(statements, 1):
+            lines.append(f'  {index:>3}. {s.seconds * 1000:7.2f}ms rows={s.rows} [{s.source}] '
+                         f'{_shape(s.params, s.many)} {_compact(s.sql, 160)}')
+        app_logger.debug('\n'.join(lines))
+
+    repeated = defaultdict(list)
+    for s in statements:
+        repeated[' '.join(s.sql.split())].append(s)
+    for sql, group in repeated.items():
+        if len(group) > AppConfig.SQL_TRACE_REPEAT_THRESHOLD:
+            app_logger.warning(
+                f'可能的 N+1 查询: {where} 中同一条语句执行了 {len(group)} 次，'
+                f'共 {sum(s.seconds for s in group) * 1000:.1f}ms: {_compact(sql)}'
+            )
+
+
+def init_sql_trace(app) -> None:
+    """SQL_TRACE_ENABLED 为 True 时注册 SQL 回调和请求钩子"""
+    if not app_config.SQL_TRACE_ENABLED:
+        return
+    if record_statement not in statement_hooks:
+        statement_hooks.append(record_statement)
+    app_logger.info(f'SQL 跟踪已开启: 慢查询阈值 {AppConfig.SQL_TRACE_SLOW_MS}ms，'
+                    f'重复 {AppConfig.SQL_TRACE_REPEAT_THRESHOLD} 次以上提示 N+1')
+
+    @app.before_request
+    def _sql_trace_start():
+        _local.statements = []
+
+    @app.after_request
+    def _sql_trace_finish(response):
+        statements = getattr(_local, 'statements', None)
+        _local.statements = None
+        if statements is None:
+            return response
+        _report(statements)
+        total = sum(s.seconds for s in statements) * 1000
+        response.headers.add('Server-Timing', f'sql;dur={total:.2f};desc="{len(statements)} statements"')
+        return response
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import secrets
+import time
+
+from flask import Request
+from werkzeug.datastructures import FileStorage
+
+from ..config.app_config import config_dict
+from . import metrics
+
+app_config_mode = os.getenv("CONFIG_MODE", "development")
+
+# 上传临时文件目录，放在 UPLOAD_FOLDER 下保证与最终位置在同一文件系统，落盘后只需改名
+UPLOAD_TEMP_FOLDER = os.path.join(config_dict.get(app_config_mode).UPLOAD_FOLDER, '.tmp')
+os.makedirs(UPLOAD_TEMP_FOLDER, exist_ok=True)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def _create_temp(directory: str) -> tuple[int, str]:
+    """
+    创建上传临时文件。不用 tempfile.mkstemp：它固定使用 0600 权限，改名后最终文件也是 0600，
+    与 gunicorn 不同用户的 nginx / lighttpd 无法读取，X-Accel-Redirect / X-Sendfile 返回 403。
+    这里按 0666 创建，由 umask 决定实际权限，与 open() 写入的文件一致
+    """
+    while True:
+        name = os.path.join(directory, f'upload-{secrets.token_hex(8)}.tmp')
+        try:
+            return os.open(name, os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666), name
+        except FileExistsError:
+            continue
+
+
+class HashingTempFile:
+    """
+    边写边算 MD5 的临时文件。
+    写入完成后由 commit() 原子改名到最终路径；未 commit 就 close() 时删除临时文件，
+    校验失败不会在上传目录里留下残缺文件。
+    """
+
+    def __init__(self, directory: str = UPLOAD_TEMP_FOLDER):
+        fd, self.name = _create_temp(directory)
+        self._fp = os.fdopen(fd, 'w+b', buffering=COPY_BUFFER_SIZE)
+        self._md5 = hashlib.md5()
+        self.size = 0
+        self.hash_seconds = 0.0
+        self.committed = False
+
+    def write(self, data) -> int:
+        start = time.perf_counter()
+        self._md5.update(data)
+        self.hash_seconds += time.perf_counter() - start
+        self.size += len(data)
+        return self._fp.write(data)
+
+    def hexdigest(self) -> str:
+        return self._md5.hexdigest()
+
+    def commit(self, target_path: str) -> None:
+        self._fp.close()
+        os.replace(self.name, target_path)
+        self.committed = True
+        metrics.observe_upload_hash(self.hash_seconds)
+
+    def close(self) -> None:
+        self._fp.close()
+        if not self.committed and os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __getattr__(self, item):
+        # read / readline / seek / tell 等直接交给底层文件
+        return getattr(self._fp, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def copy_stream(src, dst, buffer_size: int = COPY_BUFFER_SIZE) -> int:
+    copied = 0
+    for buf in iter(lambda: src.read(buffer_size), b''):
+        dst.write(buf)
+        copied += len(buf)
+    return copied
+
+
+def spool_upload(file: FileStorage) -> HashingTempFile:
+    """
+    取得上传文件对应的 HashingTempFile。
+    通过 UploadRequest 解析的表单文件在接收时已经写入临时文件并算好 MD5，直接复用；
+    其他来源的流单次复制到临时文件。
+    """
+    if isinstance(file.stream, HashingTempFile):
+        return file.stream
+
+    spooled = HashingTempFile()
+    try:
+        copy_stream(file.stream, spooled)
+    except BaseException:
+        spooled.close()
+        raise
+    return spooled
+
+
+class UploadRequest(Request):
+    """
+    multipart 上传的文件在解析请求体时直接写入 HashingTempFile，
+    不再经过 werkzeug 默认的 SpooledTemporaryFile，省去一次复制和一次重读。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingTempFile()
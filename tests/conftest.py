@@ -0,0 +1,19 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# 配置在导入时读取 CONFIG_MODE，所有数据放在临时目录中（与 benchmarks/run.py 相同的 benchmark 配置）。
+# 在导入应用之前注册清理，atexit 后注册先执行，指标等在退出时写库之后才删除目录
+BENCH_DIR = tempfile.mkdtemp(prefix='djhx-pan-test-')
+atexit.register(shutil.rmtree, BENCH_DIR, ignore_errors=True)
+os.environ['CONFIG_MODE'] = 'benchmark'
+os.environ['DJHX_PAN_BENCH_DIR'] = BENCH_DIR
+
+
+@pytest.fixture(scope='session')
+def app():
+    from src.djhx_pan import create_app
+    return create_app('benchmark')
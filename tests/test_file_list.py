@@ -0,0 +1,39 @@
+import datetime
+
+from src.djhx_pan.db import DB
+from src.djhx_pan.repository import file_repo
+
+
+def _insert(parent_id, filename, is_dir, create_datetime):
+    return DB.execute("""
+        INSERT INTO t_file (filename, filesize, filetype, filepath, parent_id, is_dir, create_datetime, update_datetime)
+        VALUES (?, 0, ?, ?, ?, ?, ?, NULL)
+    """, (filename, 'folder' if is_dir else 'bin', '/tmp/' + filename, parent_id, is_dir, create_datetime))
+
+
+def test_paging_keeps_null_dated_rows(app):
+    folder_id = _insert(None, 'paging', 1, datetime.datetime.now().isoformat())
+    base = datetime.datetime(2024, 1, 1)
+    expected = [_insert(folder_id, f'd{i}', 1, (base + datetime.timedelta(minutes=i)).isoformat()) for i in range(3)]
+    expected += [_insert(folder_id, f'f{i}', 0, (base + datetime.timedelta(minutes=i)).isoformat()) for i in range(20)]
+    # 旧代码 / 手工写入的 NULL 由触发器补上默认值
+    expected.append(_insert(folder_id, 'null-dated', None, None))
+    assert DB.query_one("SELECT is_dir, create_datetime FROM t_file WHERE id = ?", (expected[-1],))['create_datetime']
+
+    seen, after = [], None
+    while True:
+        rows, cursor = file_repo.list_children(folder_id, after, 5)
+        seen.extend(row['id'] for row in rows)
+        if cursor is None:
+            break
+        after = file_repo.decode_cursor(cursor)
+    assert sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen))
+    assert seen == [row['id'] for row in file_repo.list_children(folder_id)[0]]
+
+
+def test_paging_uses_index_range(app):
+    sql, params = file_repo.children_query(1, (0, '2024-01-01T00:00:00', 100), 50)
+    plan = ' '.join(row['detail'] for row in DB.query("EXPLAIN QUERY PLAN " + sql, params))
+    assert 'idx_file_parent_list (parent_id=? AND' in plan
+    assert 'TEMP B-TREE' not in plan